@@ -1,5 +1,8 @@
-from fastapi import FastAPI
-from database import engine, SessionLocal, Base
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+import database
+from database import engine, record_write, SessionLocal
+from migrations import run_migrations
 from fastapi.middleware.cors import CORSMiddleware
 from routers import (
     auth,
@@ -9,9 +12,32 @@ from routers import (
     projects,
     users,
 )  # Importing routes
+from utils.email_outbox import EMAIL_WORKER_ENABLED, outbox_worker
+from utils.invite_sweeper import INVITE_SWEEPER_ENABLED, invite_sweeper
+from utils import sharding
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Deliver queued emails and purge expired invites in the background
+    if EMAIL_WORKER_ENABLED:
+        outbox_worker.start()
+    if INVITE_SWEEPER_ENABLED:
+        invite_sweeper.start()
+    yield
+    if INVITE_SWEEPER_ENABLED:
+        invite_sweeper.stop()
+    if EMAIL_WORKER_ENABLED:
+        outbox_worker.stop()
+    for async_engine in (database.async_engine, database.async_replica_engine):
+        if async_engine is not None:
+            await async_engine.dispose()
+    if sharding.shards is not None:
+        sharding.shards.dispose()
+
 
 # Create the FastAPI instance
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,8 +45,23 @@ app.add_middleware(
     allow_credentials=True,  # Allows cookies
     allow_methods=["*"],  # Allows all HTTP methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["X-Next-Cursor"],  # Lets the frontend read pagination cursors
 )
 
+
+async def read_your_writes(request: Request, call_next):
+    # After a successful write, the client's reads go to the primary for a while
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        record_write(request, response)
+    return response
+
+
+# Only needed when GET endpoints read from a replica
+if database.replica_engine is not None:
+    app.middleware("http")(read_your_writes)
+
+
 # Include the auth routes
 app.include_router(auth.router, prefix="/auth")
 app.include_router(consumption.router, prefix="/consumption")
@@ -29,8 +70,11 @@ app.include_router(options.router, prefix="/options")
 app.include_router(projects.router, prefix="/projects")
 app.include_router(users.router, prefix="/users")
 
-# Create the database tables (this will only run once when you start the app for the first time)
-Base.metadata.create_all(bind=engine)
+# Bring the database schema up to date (creates the tables on first start)
+run_migrations(engine)
+# Entries left in the catalog would be invisible in shard mode
+if sharding.shards is not None:
+    sharding.shards.check_catalog()
 
 
 # Dependency to get the database session
@@ -0,0 +1,234 @@
+from datetime import datetime, timezone
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    func,
+    inspect,
+    select,
+)
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from database import Base
+from logging_config import logger
+from models import (
+    Consumption,
+    DailyEmission,
+    EmailOutbox,
+    Invite,
+    Project,
+    User,
+    User_Project,
+)
+from utils.rollup import rebuild_daily_emissions
+
+# Bookkeeping table recording which migrations have been applied
+schema_metadata = MetaData()
+schema_version = Table(
+    "SchemaVersion",
+    schema_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("appliedAt", DateTime, nullable=False),
+)
+
+
+# --- Migration steps ---------------------------------------------------------
+#
+# Every step receives a connection inside its own transaction and must be safe to
+# run both on a fresh database (where create_all already built the latest schema)
+# and on an existing, populated one.
+
+
+def _create_base_schema(conn):
+    """Create every table that does not exist yet."""
+    Base.metadata.create_all(bind=conn)
+
+
+def _create_tables(*tables):
+    """Build a step that creates the given tables, with their indexes, if missing."""
+
+    def step(conn):
+        for table in tables:
+            logger.info(f"Ensuring table {table.name}")
+            table.create(bind=conn, checkfirst=True)
+
+    return step
+
+
+def _create_indexes(*tables):
+    """Build a step that creates the declared indexes of the given tables."""
+
+    def step(conn):
+        for table in tables:
+            existing = {column["name"] for column in inspect(conn).get_columns(table.name)}
+            for index in table.indexes:
+                # Indexes on columns a later migration adds are created by that
+                # migration; SQLite would otherwise index the quoted name as a literal
+                if any(column.name not in existing for column in index.columns):
+                    continue
+                logger.info(f"Ensuring index {index.name} on {table.name}")
+                index.create(bind=conn, checkfirst=True)
+
+        # Refresh planner statistics so the new indexes are picked up
+        if conn.dialect.name == "sqlite":
+            conn.exec_driver_sql("ANALYZE")
+
+    return step
+
+
+def _drop_indexes(*index_names):
+    """Build a step that drops the given indexes if they exist."""
+
+    def step(conn):
+        for name in index_names:
+            logger.info(f"Dropping index {name}")
+            conn.exec_driver_sql(f'DROP INDEX IF EXISTS "{name}"')
+
+    return step
+
+
+def _add_columns(table, *column_names):
+    """Build a step that adds the given model columns to a table if they are missing."""
+
+    def step(conn):
+        existing = {column["name"] for column in inspect(conn).get_columns(table.name)}
+        for name in column_names:
+            if name in existing:
+                continue
+            logger.info(f"Adding column {name} to {table.name}")
+            column_ddl = CreateColumn(table.c[name]).compile(dialect=conn.dialect)
+            conn.exec_driver_sql(
+                f'ALTER TABLE "{table.name}" ADD COLUMN {column_ddl}'
+            )
+
+    return step
+
+
+def _backfill_daily_emissions(conn):
+    """Populate the DailyEmission rollup for databases created before it existed."""
+    with Session(bind=conn) as db:
+        has_rollup = db.query(DailyEmission.projectId).first() is not None
+        has_consumption = db.query(Consumption.id).first() is not None
+        if has_consumption and not has_rollup:
+            # Soft deletes (deletedAt) only arrive with migration 8
+            rebuild_daily_emissions(db, skip_deleted=False)
+            db.flush()
+
+
+def _add_consumption_change_tracking(conn):
+    """Add Consumption.updatedAt/deletedAt, stamping existing rows with the current time."""
+    _add_columns(Consumption.__table__, "updatedAt", "deletedAt")(conn)
+    conn.execute(
+        Consumption.__table__.update()
+        .where(Consumption.updatedAt.is_(None))
+        .values(updatedAt=datetime.now(timezone.utc))
+    )
+    _create_indexes(Consumption.__table__)(conn)
+
+
+# Ordered list of (version, description, step). Append only; never renumber.
+MIGRATIONS = [
+    (1, "Create base schema", _create_base_schema),
+    (
+        2,
+        "Add composite indexes for consumption queries",
+        _create_indexes(
+            Consumption.__table__,
+            Project.__table__,
+            User_Project.__table__,
+            DailyEmission.__table__,
+        ),
+    ),
+    (3, "Backfill DailyEmission rollup", _backfill_daily_emissions),
+    (
+        4,
+        "Add User.permissionVersion",
+        _add_columns(User.__table__, "permissionVersion"),
+    ),
+    (5, "Add EmailOutbox table", _create_tables(EmailOutbox.__table__)),
+    (6, "Add Invite.createdAt indexes", _create_indexes(Invite.__table__)),
+    (
+        7,
+        "Drop redundant Consumption primary key index",
+        _drop_indexes("ix_Consumption_id"),
+    ),
+    (
+        8,
+        "Add Consumption change tracking and soft deletes",
+        _add_consumption_change_tracking,
+    ),
+]
+
+
+def current_version(conn) -> int:
+    """Return the highest applied migration version, or 0 for an empty database."""
+    schema_metadata.create_all(bind=conn)
+    return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+def run_migrations(engine):
+    """
+    Apply all pending migrations in order, each in its own transaction.
+
+    :param engine: The engine of the database to migrate.
+    :return: The schema version after migrating.
+    """
+    with engine.begin() as conn:
+        version = current_version(conn)
+
+    for step_version, description, step in MIGRATIONS:
+        if step_version <= version:
+            continue
+        logger.info(f"Applying migration {step_version}: {description}")
+        with engine.begin() as conn:
+            step(conn)
+            conn.execute(
+                schema_version.insert().values(
+                    version=step_version,
+                    description=description,
+                    appliedAt=datetime.now(timezone.utc),
+                )
+            )
+        version = step_version
+
+    return version
+
+
+# --- Query plan inspection -----------------------------------------------------
+
+
+class Explain(Executable, ClauseElement):
+    """Wraps a SELECT so it is executed as EXPLAIN QUERY PLAN."""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "sqlite")
+def _compile_explain_sqlite(element, compiler, **kw):
+    return "EXPLAIN QUERY PLAN " + compiler.process(element.statement, **kw)
+
+
+def explain_query_plan(db: Session, query):
+    """
+    Return the query plan of an ORM query as a list of plan detail strings.
+
+    :param db: The session the query would run in.
+    :param query: A Query or a select() statement.
+    """
+    statement = getattr(query, "statement", query)
+    rows = db.connection().execute(Explain(statement)).all()
+    return [row[-1] for row in rows]
+
+
+def list_indexes(engine, table_name: str):
+    """Return the names of the indexes present on a table."""
+    return {index["name"] for index in inspect(engine).get_indexes(table_name)}
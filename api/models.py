@@ -1,4 +1,13 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Date, Float, DateTime
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    ForeignKey,
+    Date,
+    Float,
+    DateTime,
+    Index,
+)
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import date, datetime, timedelta, timezone
@@ -28,6 +37,12 @@ class Invite(Base):
     inviteToken = Column(String, unique=True, nullable=False)  # Secure token for setup
     createdAt = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
+    # Expiry is checked on every read of pending invites (see utils/invite_sweeper.py)
+    __table_args__ = (
+        Index("ix_invite_created", "createdAt"),
+        Index("ix_invite_company_created", "companyId", "createdAt"),
+    )
+
     company = relationship("Company")  # Link to company
 
     @property
@@ -47,11 +62,18 @@ class User(Base):
     passwordhash = Column(String)
     role = Column(String)
     companyId = Column(Integer, ForeignKey("Company.id"))
+    # Bumped whenever role, company or project assignments change (see security.py)
+    permissionVersion = Column(Integer, nullable=False, default=0, server_default="0")
 
     company = relationship("Company", back_populates="users")
     projects = relationship("User_Project", back_populates="user")
     consumptions = relationship("Consumption", back_populates="user")
 
+    @property
+    def project_ids(self):
+        """IDs of the projects the user is assigned to."""
+        return [p.projectId for p in self.projects]
+
 
 # Project Model
 class Project(Base):
@@ -63,6 +85,8 @@ class Project(Base):
     endDate = Column(Date)
     companyId = Column(Integer, ForeignKey("Company.id"))
 
+    __table_args__ = (Index("ix_project_company", "companyId"),)
+
     company = relationship("Company", back_populates="projects")
     users = relationship("User_Project", back_populates="project")
     consumptions = relationship("Consumption", back_populates="project")
@@ -84,6 +108,11 @@ class User_Project(Base):
     userId = Column(Integer, ForeignKey("User.id"))
     projectId = Column(Integer, ForeignKey("Project.id"))
 
+    __table_args__ = (
+        Index("ix_user_project_user", "userId", "projectId"),
+        Index("ix_user_project_project", "projectId"),
+    )
+
     user = relationship("User", back_populates="projects")
     project = relationship("Project", back_populates="users")
 
@@ -123,7 +152,8 @@ class Unit(Base):
 class Consumption(Base):
     __tablename__ = "Consumption"
 
-    id = Column(Integer, primary_key=True, index=True)
+    # No separate index: the integer primary key is SQLite's rowid already
+    id = Column(Integer, primary_key=True)
     amount = Column(Float, nullable=False)
     startDate = Column(Date, nullable=False)
     endDate = Column(Date, nullable=False)
@@ -134,9 +164,59 @@ class Consumption(Base):
     activityTypeId = Column(Integer, ForeignKey("ActivityType.id"))
     fuelTypeId = Column(Integer, ForeignKey("FuelType.id"), nullable=False)
     unitId = Column(Integer, ForeignKey("Unit.id"))
+    # Change tracking for /consumption/changes (UTC). updatedAt is set on every
+    # insert and update (nullable only because migration 8 backfills it); deletes
+    # are soft: deletedAt marks the row as a tombstone and every read skips it
+    updatedAt = Column(
+        DateTime,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+    )
+    deletedAt = Column(DateTime, nullable=True)
+
+    # Composite indexes backing the filters, joins and keyset ordering of the routers
+    __table_args__ = (
+        Index("ix_consumption_project_start", "projectId", "startDate"),
+        Index("ix_consumption_user_report", "userId", "reportDate"),
+        Index("ix_consumption_fuel_type", "fuelTypeId"),
+        Index("ix_consumption_report", "reportDate", "id"),
+        Index("ix_consumption_updated", "updatedAt", "id"),
+    )
 
     user = relationship("User", back_populates="consumptions")
     project = relationship("Project", back_populates="consumptions")
     activity_type = relationship("ActivityType", back_populates="consumptions")
     fuel_type = relationship("FuelType", back_populates="consumptions")
     unit = relationship("Unit", back_populates="consumptions")
+
+
+# DailyEmission Model (rollup of Consumption prorated per day, maintained on write)
+class DailyEmission(Base):
+    __tablename__ = "DailyEmission"
+
+    projectId = Column(Integer, ForeignKey("Project.id"), primary_key=True)
+    date = Column(Date, primary_key=True)
+    fuelTypeId = Column(Integer, ForeignKey("FuelType.id"), primary_key=True)
+    amount = Column(Float, nullable=False, default=0.0)  # Prorated consumption
+    co2 = Column(Float, nullable=False, default=0.0)  # amount * averageCO2Emission
+
+    __table_args__ = (Index("ix_daily_emission_fuel_type", "fuelTypeId"),)
+
+
+# EmailOutbox Model (outgoing emails, delivered by the background worker in utils/email_outbox.py)
+class EmailOutbox(Base):
+    __tablename__ = "EmailOutbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending/sending/sent/failed
+    attempts = Column(Integer, nullable=False, default=0)
+    nextAttemptAt = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    lastError = Column(String, nullable=True)
+    createdAt = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    sentAt = Column(DateTime, nullable=True)
+
+    # The worker polls for due messages by status and time
+    __table_args__ = (Index("ix_email_outbox_due", "status", "nextAttemptAt"),)
@@ -5,6 +5,7 @@ from models import User
 from schemas import LoginSchema
 from security import (
     verify_password,
+    build_access_claims,
     create_access_token,
     create_refresh_token,
     refresh_access_token,
@@ -37,14 +38,7 @@ def login(login_data: LoginSchema, response: Response, db: Session = Depends(get
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
     # Create both access and refresh tokens with relevant user information
-    access_token = create_access_token(
-        {
-            "sub": str(user.id),  # Subject (user ID) as string
-            "email": user.email,  # User email
-            "role": user.role,  # User role for authorization
-            "companyId": user.companyId,  # Company affiliation
-        }
-    )
+    access_token = create_access_token(build_access_claims(user))
 
     print("access_token: ", access_token)
 
@@ -82,7 +76,7 @@ def logout(response: Response):
 
 
 @router.post("/refresh")
-def refresh_token(request: Request, response: Response):
+def refresh_token(request: Request, response: Response, db: Session = Depends(get_db)):
     """
     Refreshes access token using refresh token from cookies.
 
@@ -100,7 +94,7 @@ def refresh_token(request: Request, response: Response):
         raise HTTPException(status_code=401, detail="No refresh token found")
 
     try:
-        new_access_token, new_refresh_token = refresh_access_token(refresh_token)
+        new_access_token, new_refresh_token = refresh_access_token(refresh_token, db)
     except Exception as e:
         logger.error(f"Refresh failed: {e}")
         raise HTTPException(status_code=401, detail="Invalid refresh token!")
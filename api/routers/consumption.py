@@ -1,65 +1,728 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Date, cast, func, insert, or_, update
 from sqlalchemy.orm import Session
-from database import get_db
-from models import Consumption, User, Project, ActivityType, FuelType, Unit, Company
-from schemas import ConsumptionSchema, ConsumptionSubmitSchema
-from security import get_current_user
-from typing import List
+from datetime import date, datetime, timezone
+from itertools import islice
+from database import (
+    get_db,
+    get_db_runner,
+    get_read_db,
+    get_read_session_factory,
+    get_session_factory,
+    reads_from_primary,
+    wrote_recently,
+)
+from models import (
+    Consumption,
+    User,
+    Project,
+    ActivityType,
+    FuelType,
+    Unit,
+    Company,
+    DailyEmission,
+)
+from schemas import (
+    ConsumptionBatchResultSchema,
+    ConsumptionBatchSchema,
+    ConsumptionChangesSchema,
+    ConsumptionFilterSchema,
+    ConsumptionSchema,
+    ConsumptionSubmitSchema,
+)
+from security import Principal, get_current_user, get_runner_user
+from typing import List, Optional, Sequence
+from utils.consumption_import import (
+    IMPORT_FORMATS,
+    ConsumptionImporter,
+    read_batches,
+    spool_body,
+)
+from utils.export import (
+    EXPORT_BATCH_SIZE,
+    EXPORT_FORMATS,
+    columnar_chunks,
+    csv_chunks,
+    gzip_chunks,
+    ndjson_chunks,
+)
+from utils.fieldsets import parse_fields
+from utils.pagination import (
+    MAX_PAGE_SIZE,
+    NEXT_CURSOR_HEADER,
+    decode_cursor,
+    encode_cursor,
+    keyset_filter,
+)
+from utils.response_cache import (
+    EMISSIONS_TAG,
+    company_tag,
+    project_tag,
+    response_cache,
+)
+from utils.rollup import add_consumption, add_consumptions, remove_consumption
+from utils import sharding
+from utils.serialization import (
+    COLUMNAR_MEDIA_TYPE,
+    row_columns,
+    row_records,
+    wants_columnar,
+)
+from utils.sharding import company_session, entry_company, merge_sorted
+from utils.single_flight import SingleFlight, principal_scope
+from utils.sync import (
+    CHANGES_PAGE_SIZE,
+    MAX_CHANGES_PAGE_SIZE,
+    decode_watermark,
+    next_watermark,
+    settled_before,
+)
+from utils.timeseries import BUCKET_SIZES, emission_series
 
 router = APIRouter()
 
+# Identical concurrent list and timeseries requests share one query and one
+# encoded response body
+flights = SingleFlight()
+
+# Whitelisted sort keys for the consumption list, mapped to their SQL expressions
+SORT_COLUMNS = {
+    "reportDate": Consumption.reportDate,
+    "startDate": Consumption.startDate,
+    "endDate": Consumption.endDate,
+    "amount": Consumption.amount,
+    "project": Project.name,
+    "activityType": ActivityType.name,
+    "fuelType": FuelType.name,
+    "unit": Unit.name,
+    "user": User.firstName + " " + User.lastName,
+    "company": Company.name,
+}
+DEFAULT_SORT = "-reportDate"
+
+# Keys of a consumption list entry, in response order
+CONSUMPTION_FIELDS = tuple(ConsumptionSchema.model_fields)
+
+# Column expression of each list field, and the tables it needs joined
+CONSUMPTION_COLUMNS = {
+    "id": (Consumption.id, ()),
+    "amount": (Consumption.amount, ()),
+    "startDate": (Consumption.startDate, ()),
+    "endDate": (Consumption.endDate, ()),
+    "reportDate": (Consumption.reportDate, ()),
+    "description": (Consumption.description, ()),
+    "userId": (Consumption.userId, ()),
+    "project": (Project.name.label("project"), (Project,)),
+    "activityType": (ActivityType.name.label("activityType"), (ActivityType,)),
+    "fuelTypeId": (Consumption.fuelTypeId, ()),
+    "fuelType": (FuelType.name.label("fuelType"), (FuelType,)),
+    "unit": (Unit.name.label("unit"), (Unit,)),
+    "user_first_name": (User.firstName.label("user_first_name"), (User,)),
+    "user_last_name": (User.lastName.label("user_last_name"), (User,)),
+    "company": (Company.name.label("company"), (Project, Company)),
+}
+
+# Tables joined for the sort keys that are not consumption columns
+SORT_JOINS = {
+    "project": (Project,),
+    "activityType": (ActivityType,),
+    "fuelType": (FuelType,),
+    "unit": (Unit,),
+    "user": (User,),
+    "company": (Project, Company),
+}
+
+# Joinable tables with their join conditions, in join order
+CONSUMPTION_JOINS = (
+    (Project, Project.id == Consumption.projectId),
+    (ActivityType, ActivityType.id == Consumption.activityTypeId),
+    (FuelType, FuelType.id == Consumption.fuelTypeId),
+    (Unit, Unit.id == Consumption.unitId),
+    (User, User.id == Consumption.userId),
+    (Company, Company.id == Project.companyId),
+)
+
+# Upper bound for the number of operations accepted by /consumption/batch
+BATCH_MAX_OPERATIONS = 1000
+
+# Keys of a /consumption/changes entry
+CHANGE_FIELDS = CONSUMPTION_FIELDS + ("updatedAt",)
+
+# Name columns repeated across many rows; dictionary-encoded in the columnar layout
+CONSUMPTION_DICTIONARY_FIELDS = (
+    "project",
+    "activityType",
+    "fuelType",
+    "unit",
+    "user_first_name",
+    "user_last_name",
+    "company",
+)
+
+
+def parse_sort(sort: str):
+    """
+    Resolves a sort parameter such as "amount" or "-reportDate" against the whitelist.
+
+    :return: A (column expression, descending) tuple.
+    :raises HTTPException: If the sort key is not allowed.
+    """
+    descending = sort.startswith("-")
+    column = SORT_COLUMNS.get(sort.lstrip("-"))
+    if column is None:
+        raise HTTPException(status_code=400, detail=f"Cannot sort by '{sort}'")
+    return column, descending
+
+
+def project_write_errors(current_user, projects) -> dict:
+    """
+    Checks which projects the current user may add consumption entries to.
+
+    :param projects: (id, companyId) pairs of existing projects.
+    :return: Project ID -> the reason adding is not allowed, or None if it is.
+    """
+    member_of = set(current_user.project_ids) if current_user.role == "user" else ()
+    errors = {}
+    for project_id, company_id in projects:
+        if current_user.role == "user" and project_id not in member_of:
+            # Users can only create entries for projects they are part of
+            errors[project_id] = "Not allowed to add to this project"
+        elif current_user.role == "companyadmin" and company_id != current_user.companyId:
+            # Company admins can create entries for any project within their company
+            errors[project_id] = "Not allowed to add to projects outside your company"
+        else:
+            errors[project_id] = None
+    return errors
+
+
+def can_modify_entry(current_user, company_id, user_id) -> bool:
+    """
+    Whether the current user may edit or delete an entry: admins any, company
+    admins those of their company's projects, users their own.
+
+    :param company_id: The company of the entry's project.
+    :param user_id: The user who reported the entry.
+    """
+    return (
+        current_user.role == "admin"
+        or (current_user.role == "companyadmin" and company_id == current_user.companyId)
+        or (current_user.role == "user" and user_id == current_user.id)
+    )
+
+
+def escape_like(term: str) -> str:
+    """Escapes the LIKE wildcards in a search term, for use with escape="\\"."""
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def get_consumption_filters(
+    projectId: List[int] = Query([]),
+    companyId: List[int] = Query([]),
+    fuelTypeId: List[int] = Query([]),
+    activityTypeId: List[int] = Query([]),
+    userId: List[int] = Query([]),
+    dateFrom: Optional[date] = None,
+    dateTo: Optional[date] = None,
+    minAmount: Optional[float] = None,
+    maxAmount: Optional[float] = None,
+    q: Optional[str] = None,
+) -> ConsumptionFilterSchema:
+    """Collect the consumption list filters from the query string."""
+    return ConsumptionFilterSchema(
+        projectId=projectId,
+        companyId=companyId,
+        fuelTypeId=fuelTypeId,
+        activityTypeId=activityTypeId,
+        userId=userId,
+        dateFrom=dateFrom,
+        dateTo=dateTo,
+        minAmount=minAmount,
+        maxAmount=maxAmount,
+        q=q,
+    )
+
+
+def build_consumption_query(
+    db: Session,
+    current_user,
+    filters: ConsumptionFilterSchema,
+    fields: Sequence[str] = CONSUMPTION_FIELDS,
+    sort: Optional[str] = None,
+    include_deleted: bool = False,
+):
+    """
+    Build the enriched consumption query visible to the current user, with the
+    given filters compiled into the WHERE clause.
+
+    :param fields: The list fields to select; tables none of them, the filters
+        or the sort key refer to are not joined.
+    :param sort: The sort parameter the query will be ordered by, if any.
+    :param include_deleted: Also return soft-deleted entries (tombstones).
+    """
+    # Select only the requested fields, joining just the tables they, the filters and
+    # the sort need; the id is always selected as the pagination tiebreaker
+    needed = set(SORT_JOINS.get(sort.lstrip("-"), ()) if sort else ())
+    columns = [Consumption.id]
+    for field in fields:
+        column, tables = CONSUMPTION_COLUMNS[field]
+        if field != "id":
+            columns.append(column)
+        needed.update(tables)
+    if current_user.role == "companyadmin" or filters.companyId:
+        needed.add(Project)
+    if filters.q:
+        needed.update(table for table, _ in CONSUMPTION_JOINS)
+
+    # Outer joins, so leaving one out never changes which rows match (e.g. entries
+    # without an activity type or unit)
+    query = db.query(*columns)
+    for table, condition in CONSUMPTION_JOINS:
+        if table in needed:
+            query = query.outerjoin(table, condition)
+
+    if not include_deleted:
+        query = query.filter(Consumption.deletedAt.is_(None))
+
+    # Role-based access control to determine what data the user can retrieve
+    if current_user.role == "companyadmin":
+        query = query.filter(Project.companyId == current_user.companyId)
+    elif current_user.role != "admin":
+        # Normal users can only access entries from their assigned projects
+        query = query.filter(
+            Consumption.projectId.in_(current_user.project_ids)
+        )
+
+    # Exact-match filters on foreign keys
+    if filters.projectId:
+        query = query.filter(Consumption.projectId.in_(filters.projectId))
+    if filters.companyId:
+        query = query.filter(Project.companyId.in_(filters.companyId))
+    if filters.fuelTypeId:
+        query = query.filter(Consumption.fuelTypeId.in_(filters.fuelTypeId))
+    if filters.activityTypeId:
+        query = query.filter(Consumption.activityTypeId.in_(filters.activityTypeId))
+    if filters.userId:
+        query = query.filter(Consumption.userId.in_(filters.userId))
+
+    # Date range: keep entries whose consumption period overlaps the range
+    if filters.dateFrom is not None:
+        query = query.filter(Consumption.endDate >= filters.dateFrom)
+    if filters.dateTo is not None:
+        query = query.filter(Consumption.startDate <= filters.dateTo)
+
+    # Amount range
+    if filters.minAmount is not None:
+        query = query.filter(Consumption.amount >= filters.minAmount)
+    if filters.maxAmount is not None:
+        query = query.filter(Consumption.amount <= filters.maxAmount)
+
+    # Free-text search: every term must match one of the displayed names
+    if filters.q:
+        for term in filters.q.split():
+            # Typed % and _ match themselves, not any characters
+            pattern = f"%{escape_like(term)}%"
+            query = query.filter(
+                or_(
+                    Project.name.ilike(pattern, escape="\\"),
+                    ActivityType.name.ilike(pattern, escape="\\"),
+                    FuelType.name.ilike(pattern, escape="\\"),
+                    User.firstName.ilike(pattern, escape="\\"),
+                    User.lastName.ilike(pattern, escape="\\"),
+                    Company.name.ilike(pattern, escape="\\"),
+                )
+            )
+
+    return query
+
+
+def consumption_changed(db: Session, project_ids):
+    """
+    Call after committing changes to the consumption entries of these projects:
+    invalidates the cached aggregates of the projects and their companies, and
+    lets later requests start new queries instead of joining ones in flight.
+    """
+    project_ids = {project_id for project_id in project_ids if project_id is not None}
+    tags = [project_tag(project_id) for project_id in project_ids]
+    if project_ids:
+        tags.extend(
+            company_tag(company_id)
+            for (company_id,) in db.query(Project.companyId)
+            .filter(Project.id.in_(project_ids), Project.companyId.isnot(None))
+            .distinct()
+        )
+    response_cache.invalidate(tags)
+    flights.forget()
+
+
+def filters_key(filters: ConsumptionFilterSchema) -> tuple:
+    """The filters in a canonical form, e.g. for keying coalesced requests."""
+    return tuple(
+        (name, tuple(sorted(set(value))) if isinstance(value, list) else value)
+        for name, value in sorted(filters.model_dump().items())
+    )
+
+
+def list_consumptions(
+    db: Session,
+    current_user,
+    filters: ConsumptionFilterSchema,
+    sort: str,
+    fields: Sequence[str],
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+):
+    """
+    Fetch the consumption list rows, or one page of them with `limit`. Every row
+    also carries its `sort_value`.
+
+    :return: The rows and the cursor of the following page (None on the last one).
+    """
+    sort_column, descending = parse_sort(sort)
+    query = build_consumption_query(db, current_user, filters, fields, sort)
+    query = query.add_columns(sort_column.label("sort_value"))
+
+    # Continue after the last row of the previous page
+    if cursor is not None:
+        last_value, last_id = decode_cursor(cursor, sort)
+        query = query.filter(
+            keyset_filter(sort_column, Consumption.id, last_value, last_id, descending)
+        )
+
+    if descending:
+        query = query.order_by(sort_column.desc(), Consumption.id.desc())
+    else:
+        query = query.order_by(sort_column.asc(), Consumption.id.asc())
+
+    if limit is None:
+        return query.all(), None
+
+    # Fetch one extra row to find out whether another page follows
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(sort, rows[-1].sort_value, rows[-1].id)
+
+
+def list_sharded_consumptions(
+    current_user,
+    filters: ConsumptionFilterSchema,
+    sort: str,
+    fields: Sequence[str],
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+):
+    """
+    list_consumptions in shard mode: the page of the user's company shard, or for
+    admins the pages of all (filtered) companies' shards, fetched in parallel and
+    merged.
+    """
+    shards = sharding.shards
+    args = (current_user, filters, sort, fields, limit, cursor)
+    if current_user.role != "admin":
+        return shards.run(current_user.companyId, list_consumptions, *args)
+
+    pages = shards.fan_out(
+        shards.company_ids(filters.companyId), list_consumptions, *args
+    )
+    _, descending = parse_sort(sort)
+    rows = list(
+        merge_sorted(
+            [page for page, _ in pages],
+            key=lambda row: (row.sort_value, row.id),
+            descending=descending,
+        )
+    )
+    if limit is None:
+        return rows, None
+    # Every shard returned up to `limit` rows after the cursor, so the first `limit`
+    # merged rows are the page; the next one continues after its last row
+    if len(rows) <= limit and all(next_cursor is None for _, next_cursor in pages):
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(sort, rows[-1].sort_value, rows[-1].id)
+
 
 @router.get("/", response_model=List[ConsumptionSchema])
-def get_consumptions(
-    db: Session = Depends(get_db), current_user=Depends(get_current_user)
+async def get_consumptions(
+    request: Request,
+    filters: ConsumptionFilterSchema = Depends(get_consumption_filters),
+    sort: str = DEFAULT_SORT,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    run=Depends(get_db_runner),
+    current_user=Depends(get_runner_user),
 ):
-    # Construct a query joining related tables to enrich the consumption data with
-    # related entity details (project, company, fuel type, etc.)
-    query = (
-        db.query(
-            Consumption.id,
-            Consumption.amount,
-            Consumption.startDate,
-            Consumption.endDate,
-            Consumption.reportDate,
-            Consumption.description,
-            Consumption.userId,
-            Consumption.fuelTypeId,
-            Project.name.label("project"),
-            Project.companyId,
-            ActivityType.name.label("activityType"),
-            FuelType.name.label("fuelType"),
-            Unit.name.label("unit"),
-            User.firstName.label("user_first_name"),
-            User.lastName.label("user_last_name"),
-            Company.name.label("company"),
-        )
-        .join(Project, Project.id == Consumption.projectId)
-        .join(ActivityType, ActivityType.id == Consumption.activityTypeId)
-        .join(FuelType, FuelType.id == Consumption.fuelTypeId)
-        .join(Unit, Unit.id == Consumption.unitId)
-        .join(User, User.id == Consumption.userId)
-        .join(Company, Company.id == Project.companyId)
+    """
+    List the consumption entries visible to the current user.
+
+    - Filters (project, company, fuel type, activity type, user, date and amount
+      ranges) and the free-text `q` are applied in the database.
+    - `sort` takes one of the whitelisted keys, prefixed with "-" for descending
+      order; the default is newest report first.
+    - Without `limit`, every matching entry is returned.
+    - With `limit`, at most `limit` entries are returned and, if more exist, the
+      `X-Next-Cursor` response header carries the cursor for the following page.
+    - Pagination is keyset-based on (sort column, id), so deep pages cost the same
+      as the first one.
+    - With `Accept: application/vnd.columnar+json` the entries are returned in a
+      columnar layout (one array per field, name fields dictionary-encoded)
+      instead of a list of objects.
+    - `fields` takes a comma-separated subset of the entry fields (e.g.
+      "id,amount,project"); only those are selected and only the tables they
+      need are joined.
+    - Identical requests arriving while one is being answered (same parameters
+      and same visible data) wait for it and get the same response.
+    """
+    fields = parse_fields(fields, CONSUMPTION_FIELDS)
+    columnar = wants_columnar(request)
+
+    args = (current_user, filters, sort, fields, limit, cursor)
+
+    async def load():
+        if sharding.shards is None:
+            consumptions, next_cursor = await run(list_consumptions, *args)
+        else:
+            consumptions, next_cursor = await run_in_threadpool(
+                list_sharded_consumptions, *args
+            )
+
+        # The rows already have the response schema's types: encode them directly
+        # with orjson instead of building and re-validating a ConsumptionSchema per row
+        if columnar:
+            response = ORJSONResponse(
+                row_columns(consumptions, fields, CONSUMPTION_DICTIONARY_FIELDS),
+                media_type=COLUMNAR_MEDIA_TYPE,
+            )
+        else:
+            response = ORJSONResponse(row_records(consumptions, fields))
+        return response.body, response.media_type, next_cursor
+
+    # Requests are identical if they ask for the same page of the same data, read
+    # from the same database (primary or replica)
+    key = (
+        "list",
+        principal_scope(current_user),
+        reads_from_primary(request),
+        filters_key(filters),
+        sort,
+        limit,
+        cursor,
+        fields,
+        columnar,
     )
+    body, media_type, next_cursor = await flights.do(key, load)
 
-    # Role-based access control to determine what data the user can retrieve
+    headers = {"Vary": "Accept"}
+    if next_cursor is not None:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
+    return Response(body, media_type=media_type, headers=headers)
+
+
+def list_changes(db: Session, current_user, since: Optional[str], limit: int):
+    """
+    Fetch up to limit + 1 settled changes after the `since` watermark, oldest first,
+    with their updatedAt and deletedAt.
+    """
+    query = build_consumption_query(
+        db, current_user, ConsumptionFilterSchema(), include_deleted=since is not None
+    )
+    query = query.add_columns(Consumption.updatedAt, Consumption.deletedAt)
+    query = query.filter(Consumption.updatedAt <= settled_before())
+    if since is not None:
+        updated_at, last_id = decode_watermark(since)
+        query = query.filter(
+            keyset_filter(Consumption.updatedAt, Consumption.id, updated_at, last_id, False)
+        )
+    return query.order_by(Consumption.updatedAt, Consumption.id).limit(limit + 1).all()
+
+
+def list_sharded_changes(current_user, since: Optional[str], limit: int):
+    """list_changes in shard mode; for admins merged from every company's shard."""
+    shards = sharding.shards
+    if current_user.role != "admin":
+        return shards.run(current_user.companyId, list_changes, current_user, since, limit)
+    pages = shards.fan_out(shards.company_ids(), list_changes, current_user, since, limit)
+    merged = merge_sorted(pages, key=lambda row: (row.updatedAt, row.id))
+    return list(islice(merged, limit + 1))
+
+
+@router.get("/changes", response_model=ConsumptionChangesSchema)
+async def get_consumption_changes(
+    since: Optional[str] = None,
+    limit: int = Query(CHANGES_PAGE_SIZE, ge=1, le=MAX_CHANGES_PAGE_SIZE),
+    run=Depends(get_db_runner),
+    current_user=Depends(get_runner_user),
+):
+    """
+    Incremental sync: the consumption entries visible to the current user that were
+    inserted, updated or deleted after the `since` watermark, oldest change first.
+
+    - Without `since`, all current entries are returned (the initial sync).
+    - `changes` holds inserted and updated entries, `deleted` the IDs of deleted ones.
+    - `watermark` is passed as `since` on the next call; while `hasMore` is true,
+      more changes are ready right away.
+    - Changes become visible a couple of seconds after they are made, so that
+      concurrent transactions committing out of order are not skipped.
+    """
+    if sharding.shards is None:
+        rows = await run(list_changes, current_user, since, limit)
+    else:
+        rows = await run_in_threadpool(list_sharded_changes, current_user, since, limit)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return ORJSONResponse(
+        {
+            "changes": row_records(
+                [row for row in rows if row.deletedAt is None], CHANGE_FIELDS
+            ),
+            "deleted": [row.id for row in rows if row.deletedAt is not None],
+            "watermark": next_watermark(rows, since),
+            "hasMore": has_more,
+        }
+    )
+
+
+def negotiate_export_format(request: Request) -> str:
+    """Picks the export format from the Accept header, defaulting to CSV."""
+    if wants_columnar(request):
+        return "columnar"
+    accept = request.headers.get("accept", "").lower()
+    for format, (media_type, _) in EXPORT_FORMATS.items():
+        if media_type in accept:
+            return format
+    return "csv"
+
+
+def export_query(
+    db: Session,
+    current_user,
+    filters: ConsumptionFilterSchema,
+    fields: Sequence[str],
+    sort: str,
+):
+    """The sorted export query, streaming its rows in batches from the cursor."""
+    sort_column, descending = parse_sort(sort)
+    query = build_consumption_query(db, current_user, filters, fields, sort)
+    query = query.add_columns(sort_column.label("sort_value"))
+    if descending:
+        query = query.order_by(sort_column.desc(), Consumption.id.desc())
+    else:
+        query = query.order_by(sort_column.asc(), Consumption.id.asc())
+    # Stream from the cursor instead of buffering the whole result
+    return query.execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+
+def export_rows(
+    session_factory,
+    current_user,
+    filters: ConsumptionFilterSchema,
+    fields: Sequence[str],
+    sort: str,
+):
+    """
+    The export rows, read through a session of their own: the response body is
+    streamed after the request's dependencies, and their sessions, are closed.
+    """
+    db = session_factory()
+    try:
+        yield from export_query(db, current_user, filters, fields, sort)
+    finally:
+        db.close()
+
+
+def sharded_export_rows(
+    current_user,
+    filters: ConsumptionFilterSchema,
+    fields: Sequence[str],
+    sort: str,
+):
+    """
+    The export rows in shard mode: from the user's company shard, or for admins
+    streamed from every (filtered) company's shard at once and merged in order.
+    """
+    shards = sharding.shards
     if current_user.role == "admin":
-        consumptions = query.all()
-    elif current_user.role == "companyadmin":
-        consumptions = query.filter(Project.companyId == current_user.companyId).all()
+        company_ids = shards.company_ids(filters.companyId)
     else:
-        # Normal users can only access entries from their assigned projects
-        consumptions = query.filter(
-            Project.id.in_([p.projectId for p in current_user.projects])
-        ).all()
+        company_ids = [current_user.companyId]
+    _, descending = parse_sort(sort)
+    sessions = [shards.session(company_id) for company_id in company_ids]
+    try:
+        yield from merge_sorted(
+            [export_query(db, current_user, filters, fields, sort) for db in sessions],
+            key=lambda row: (row.sort_value, row.id),
+            descending=descending,
+        )
+    finally:
+        for db in sessions:
+            db.close()
+
+
+@router.get("/export")
+def export_consumptions(
+    request: Request,
+    filters: ConsumptionFilterSchema = Depends(get_consumption_filters),
+    sort: str = DEFAULT_SORT,
+    format: Optional[str] = None,
+    gzip: bool = False,
+    fields: Optional[str] = None,
+    session_factory=Depends(get_read_session_factory),
+    current_user=Depends(get_current_user),
+):
+    """
+    Download every consumption entry visible to the current user as CSV, NDJSON or
+    columnar JSON batches (one columnar object per line).
+
+    Takes the same filters and `sort` as the list endpoint. Rows are fetched from
+    the database in batches and encoded as they are sent, so memory use does not
+    grow with the size of the export. With `gzip=true` the file is compressed on
+    the fly. Without `format`, the format is picked from the Accept header and
+    defaults to CSV. `fields` selects a subset of the columns, as on the list.
+    """
+    if format is None:
+        format = negotiate_export_format(request)
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{format}'")
+    parse_sort(sort)
+    fields = parse_fields(fields, CONSUMPTION_FIELDS)
+
+    if current_user.role == "user":
+        # Load the user's projects now: the rows are read once their session is closed
+        current_user.project_ids
+    if sharding.shards is None:
+        rows = export_rows(session_factory, current_user, filters, fields, sort)
+    else:
+        rows = sharded_export_rows(current_user, filters, fields, sort)
+
+    media_type, extension = EXPORT_FORMATS[format]
+    if format == "columnar":
+        chunks = columnar_chunks(rows, fields, CONSUMPTION_DICTIONARY_FIELDS)
+    else:
+        encode = csv_chunks if format == "csv" else ndjson_chunks
+        chunks = encode(rows, fields)
+    filename = f"consumption-export.{extension}"
+    if gzip:
+        chunks = gzip_chunks(chunks)
+        media_type, filename = "application/gzip", filename + ".gz"
 
-    # Convert SQLAlchemy row results to Pydantic response models
-    return [ConsumptionSchema(**row._asdict()) for row in consumptions]
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Vary": "Accept",
+        },
+    )
 
 
 @router.get("/projects")
 def get_projects(
-    db: Session = Depends(get_db), current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_read_db), current_user: User = Depends(get_current_user)
 ):
     """Fetch all projects available to the user."""
     if current_user.role == "admin":
@@ -71,7 +734,7 @@ def get_projects(
     else:
         projects = (
             db.query(Project)
-            .filter(Project.id.in_([p.projectId for p in current_user.projects]))
+            .filter(Project.id.in_(current_user.project_ids))
             .all()
         )
 
@@ -79,17 +742,259 @@ def get_projects(
     return [{"id": p.id, "name": p.name} for p in projects]
 
 
+def emission_rows(
+    db: Session,
+    current_user,
+    projectId: Optional[int],
+    companyId: Optional[int],
+    dateFrom: Optional[date],
+    dateTo: Optional[date],
+    bucket: str = "day",
+):
+    """
+    Fetch the DailyEmission rollup of a project or company, summed per day and
+    fuel type, after checking the current user may view it.
+
+    On Postgres, week and month buckets are summed by the database with
+    date_trunc, one row per bucket dated at its first day within the window;
+    emission_series adds them to the same buckets as the daily rows.
+    """
+    day = DailyEmission.date
+    if bucket != "day" and db.get_bind().dialect.name == "postgresql":
+        day = cast(func.date_trunc(bucket, DailyEmission.date), Date)
+        if dateFrom is not None:
+            day = func.greatest(day, dateFrom)
+
+    # Read the prorated daily rollup, summed over the projects in scope
+    query = (
+        db.query(
+            day,
+            DailyEmission.fuelTypeId,
+            FuelType.name,
+            func.sum(DailyEmission.amount),
+            func.sum(DailyEmission.co2),
+        )
+        .join(FuelType, FuelType.id == DailyEmission.fuelTypeId)
+        .group_by(day, DailyEmission.fuelTypeId, FuelType.name)
+    )
+
+    if projectId is not None:
+        project = db.query(Project).filter(Project.id == projectId).first()
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found")
+        if (
+            current_user.role == "companyadmin"
+            and project.companyId != current_user.companyId
+        ) or (
+            current_user.role == "user"
+            and project.id not in current_user.project_ids
+        ):
+            raise HTTPException(status_code=403, detail="Not allowed to view this project")
+        query = query.filter(DailyEmission.projectId == projectId)
+    else:
+        if current_user.role == "user" or (
+            current_user.role == "companyadmin" and companyId != current_user.companyId
+        ):
+            raise HTTPException(status_code=403, detail="Not allowed to view this company")
+        query = query.join(Project, Project.id == DailyEmission.projectId).filter(
+            Project.companyId == companyId
+        )
+
+    if dateFrom is not None:
+        query = query.filter(DailyEmission.date >= dateFrom)
+    if dateTo is not None:
+        query = query.filter(DailyEmission.date <= dateTo)
+
+    return query.all()
+
+
+def sharded_emission_rows(
+    current_user,
+    projectId: Optional[int],
+    companyId: Optional[int],
+    dateFrom: Optional[date],
+    dateTo: Optional[date],
+    bucket: str = "day",
+):
+    """emission_rows in shard mode, read from the shard of the project's company."""
+    args = (current_user, projectId, companyId, dateFrom, dateTo, bucket)
+    with Session(sharding.shards.catalog_engine) as catalog:
+        if projectId is not None:
+            companyId = (
+                catalog.query(Project.companyId).filter(Project.id == projectId).scalar()
+            )
+        with company_session(catalog, companyId) as db:
+            return emission_rows(db, *args)
+
+
+def read_emission_rows(session_factory, *args):
+    """emission_rows outside a request, on a new primary session (or the shards)."""
+    if sharding.shards is not None:
+        return sharded_emission_rows(*args)
+    with session_factory() as db:
+        return emission_rows(db, *args)
+
+
+@router.get("/timeseries")
+async def get_emission_timeseries(
+    request: Request,
+    projectId: Optional[int] = None,
+    companyId: Optional[int] = None,
+    bucket: str = "day",
+    dateFrom: Optional[date] = None,
+    dateTo: Optional[date] = None,
+    run=Depends(get_db_runner),
+    session_factory=Depends(get_session_factory),
+    current_user=Depends(get_runner_user),
+):
+    """
+    Cumulative consumption per fuel type and cumulative total CO2 for a project or
+    a company, prorated evenly over each entry's period and summed per bucket.
+    Reads the DailyEmission rollup, so the cost depends on the days covered rather
+    than on the number of consumption entries.
+
+    - Exactly one of `projectId` or `companyId` must be given.
+    - `bucket` is one of "day", "week" (starting Monday) or "month".
+    - The series spans `dateFrom`..`dateTo`, defaulting to the covered period.
+    - Identical concurrent requests share one query and response.
+    - Responses are cached for RESPONSE_CACHE_TTL seconds, then served stale for
+      up to RESPONSE_CACHE_STALE_SECONDS while they are refreshed in the
+      background. Consumption writes to the project or company invalidate them;
+      a client reading from the primary after its own write bypasses the cache.
+    """
+    if (projectId is None) == (companyId is None):
+        raise HTTPException(
+            status_code=400, detail="Provide exactly one of projectId or companyId"
+        )
+    if bucket not in BUCKET_SIZES:
+        raise HTTPException(status_code=400, detail=f"Unsupported bucket '{bucket}'")
+    if dateFrom is not None and dateTo is not None and dateFrom > dateTo:
+        raise HTTPException(status_code=400, detail="dateFrom must not be after dateTo")
+
+    params = (projectId, companyId, dateFrom, dateTo, bucket)
+    args = (current_user,) + params
+
+    def encode(rows) -> bytes:
+        return ORJSONResponse(emission_series(rows, bucket, dateFrom, dateTo)).body
+
+    async def load():
+        if sharding.shards is None:
+            rows = await run(emission_rows, *args)
+        else:
+            rows = await run_in_threadpool(sharded_emission_rows, *args)
+        return encode(rows)
+
+    # Background refreshes run after the response, without the request's session
+    # and user object; only users' access depends on their projects
+    principal = Principal(
+        id=current_user.id,
+        role=current_user.role,
+        companyId=current_user.companyId,
+        project_ids=(
+            list(current_user.project_ids) if current_user.role == "user" else []
+        ),
+    )
+
+    async def refresh():
+        rows = await run_in_threadpool(
+            read_emission_rows, session_factory, principal, *params
+        )
+        return encode(rows)
+
+    scope = principal_scope(current_user)
+
+    async def coalesced():
+        key = ("timeseries", scope, reads_from_primary(request)) + params
+        return await flights.do(key, load)
+
+    if wrote_recently(request):
+        body = await coalesced()
+    else:
+        if projectId is not None:
+            tags = (project_tag(projectId), EMISSIONS_TAG)
+        else:
+            tags = (company_tag(companyId), EMISSIONS_TAG)
+        key = ("timeseries", scope) + params
+        body = await response_cache.get(key, tags, coalesced, refresh)
+    return Response(body, media_type="application/json")
+
+
+def run_import(db: Session, current_user, fmt: str, company_id: Optional[int], body):
+    """Imports a spooled upload in batches and commits it (see import_consumptions)."""
+    importer = ConsumptionImporter(db, current_user, fmt, company_id)
+    for batch in read_batches(body, fmt):
+        importer.feed(batch)
+    report = importer.finish()
+    consumption_changed(db, importer.project_ids)
+    return report
+
+
+@router.post("/import")
+async def import_consumptions(
+    request: Request,
+    companyId: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Bulk import consumption entries from a CSV (Content-Type: text/csv, with a
+    header line) or NDJSON (application/x-ndjson) body. The body is received in
+    full (spilling to a temporary file past IMPORT_SPOOL_MAX_MEMORY bytes) before
+    any row is written.
+
+    Each row gives amount, startDate, endDate, optionally reportDate (defaults to
+    today) and description, plus project, activityType, fuelType and unit either by
+    name or as projectId, activityTypeId, fuelTypeId and unitId. Rows the caller may
+    not add to, or that fail validation, are skipped and reported by line number;
+    all other rows are imported in one transaction.
+
+    With sharding enabled, an import goes to one company's shard: admins pass
+    that company as `companyId`, other users import into their own company.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    fmt = IMPORT_FORMATS.get(content_type)
+    if fmt is None:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Unsupported content type, use one of: {', '.join(IMPORT_FORMATS)}",
+        )
+
+    company_id = None
+    if sharding.shards is not None:
+        company_id = companyId if current_user.role == "admin" else current_user.companyId
+        if company_id is None:
+            raise HTTPException(
+                status_code=400, detail="Provide the companyId to import into"
+            )
+
+    # Receive the whole upload first: the import's write transaction (and SQLite's
+    # write lock) must not stay open while waiting on the client
+    body = await spool_body(request.stream())
+    try:
+        with company_session(db, company_id) as db:
+            return await run_in_threadpool(
+                run_import, db, current_user, fmt, company_id, body
+            )
+    finally:
+        body.close()
+
+
 @router.get("/{id}")
 def get_consumption(
-    id: int, db: Session = Depends(get_db), current_user=Depends(get_current_user)
+    id: int, db: Session = Depends(get_read_db), current_user=Depends(get_current_user)
 ):
     # Fetch a single consumption record by its ID
-    consumption = db.query(Consumption).filter(Consumption.id == id).first()
+    with company_session(db, entry_company(id)) as db:
+        consumption = (
+            db.query(Consumption)
+            .filter(Consumption.id == id, Consumption.deletedAt.is_(None))
+            .first()
+        )
 
-    if not consumption:
-        raise HTTPException(status_code=404, detail="Consumption entry not found")
+        if not consumption:
+            raise HTTPException(status_code=404, detail="Consumption entry not found")
 
-    return consumption
+        return consumption
 
 
 @router.post("/")
@@ -107,32 +1012,21 @@ def create_consumption(
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    # Users can only create entries for projects they are part of
-    if current_user.role == "user" and project.id not in [
-        p.projectId for p in current_user.projects
-    ]:
-        raise HTTPException(
-            status_code=403, detail="Not allowed to add to this project"
-        )
-
-    # Company admins can create entries for any project within their company
-    if (
-        current_user.role == "companyadmin"
-        and project.companyId != current_user.companyId
-    ):
-        raise HTTPException(
-            status_code=403,
-            detail="Not allowed to add to projects outside your company",
-        )
+    error = project_write_errors(current_user, [(project.id, project.companyId)])
+    if error[project.id]:
+        raise HTTPException(status_code=403, detail=error[project.id])
 
     # Assign the current user ID and set report date to today
     data.userId = current_user.id
 
     # Create and persist the new Consumption record
-    new_consumption = Consumption(**data.model_dump())
-    db.add(new_consumption)
-    db.commit()
-    return new_consumption
+    with company_session(db, project.companyId) as db:
+        new_consumption = Consumption(**data.model_dump())
+        db.add(new_consumption)
+        add_consumption(db, new_consumption)
+        db.commit()
+        consumption_changed(db, [new_consumption.projectId])
+        return new_consumption
 
 
 @router.put("/{id}")
@@ -143,27 +1037,51 @@ def edit_consumption(
     current_user: User = Depends(get_current_user),
 ):
     """Only allow admins or the correct company/user to edit."""
-    consumption = db.query(Consumption).filter(Consumption.id == id).first()
+    with company_session(db, entry_company(id)) as db:
+        consumption = (
+            db.query(Consumption)
+            .filter(Consumption.id == id, Consumption.deletedAt.is_(None))
+            .first()
+        )
 
-    if not consumption:
-        raise HTTPException(status_code=404, detail="Consumption entry not found")
+        if not consumption:
+            raise HTTPException(status_code=404, detail="Consumption entry not found")
 
-    # Determine if the user has permission to update the entry
-    if (
-        current_user.role == "admin"
-        or (
-            current_user.role == "companyadmin"
-            and consumption.project.companyId == current_user.companyId
-        )
-        or (current_user.role == "user" and consumption.user_id == current_user.id)
-    ):
-        # Update fields with provided data
-        for key, value in data.model_dump().items():
+        # Determine if the user has permission to update the entry
+        company_id = consumption.project.companyId if consumption.project else None
+        if not can_modify_entry(current_user, company_id, consumption.userId):
+            raise HTTPException(status_code=403, detail="Not allowed to edit this entry")
+
+        # Moving the entry needs permission to add to the new project, as in a batch
+        if data.projectId != consumption.projectId:
+            project = (
+                db.query(Project.id, Project.companyId)
+                .filter(Project.id == data.projectId)
+                .first()
+            )
+            if not project:
+                raise HTTPException(status_code=404, detail="Project not found")
+            error = project_write_errors(current_user, [project])[project.id]
+            if error:
+                raise HTTPException(status_code=403, detail=error)
+
+            # Entries stay in their company's shard
+            if sharding.shards is not None and project.companyId != company_id:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Entries cannot be moved to another company's project",
+                )
+
+        # Swap the entry's old contribution in the daily rollup for the new one
+        remove_consumption(db, consumption)
+        previous_project_id = consumption.projectId
+        # The entry keeps its reporter
+        for key, value in data.model_dump(exclude={"userId"}).items():
             setattr(consumption, key, value)
+        add_consumption(db, consumption)
         db.commit()
+        consumption_changed(db, [previous_project_id, consumption.projectId])
         return consumption
-    else:
-        raise HTTPException(status_code=403, detail="Not allowed to edit this entry")
 
 
 @router.delete("/{id}")
@@ -173,22 +1091,191 @@ def delete_consumption(
     current_user: User = Depends(get_current_user),
 ):
     """Only allow deletion based on role restrictions."""
-    consumption = db.query(Consumption).filter(Consumption.id == id).first()
+    with company_session(db, entry_company(id)) as db:
+        consumption = (
+            db.query(Consumption)
+            .filter(Consumption.id == id, Consumption.deletedAt.is_(None))
+            .first()
+        )
 
-    if not consumption:
-        raise HTTPException(status_code=404, detail="Consumption entry not found")
+        if not consumption:
+            raise HTTPException(status_code=404, detail="Consumption entry not found")
 
-    # Check role-based permission to delete the record
-    if (
-        current_user.role == "admin"
-        or (
-            current_user.role == "companyadmin"
-            and consumption.project.companyId == current_user.companyId
+        # Check role-based permission to delete the record
+        company_id = consumption.project.companyId if consumption.project else None
+        if can_modify_entry(current_user, company_id, consumption.userId):
+            # Soft delete: the row stays as a tombstone for /consumption/changes
+            remove_consumption(db, consumption)
+            consumption.deletedAt = consumption.updatedAt = datetime.now(timezone.utc)
+            db.commit()
+            consumption_changed(db, [consumption.projectId])
+            return {"message": "Consumption entry deleted"}
+
+        raise HTTPException(status_code=403, detail="Not allowed to delete this entry")
+
+
+@router.post("/batch", response_model=ConsumptionBatchResultSchema)
+def batch_consumptions(
+    batch: ConsumptionBatchSchema,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Create, update and delete many consumption entries in one request.
+
+    Every referenced project and entry is loaded with one IN query each, and the
+    permissions are those of the single-entry endpoints; updates also need the
+    entry's new project to be one the user may add to. Invalid operations are
+    skipped; all others are applied in one transaction with one bulk statement per
+    kind and a single rollup update. Returns a per-operation report.
+    """
+    operations = batch.operations
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {BATCH_MAX_OPERATIONS} operations per batch",
         )
-        or (current_user.role == "user" and consumption.user_id == current_user.id)
-    ):
-        db.delete(consumption)
-        db.commit()
-        return {"message": "Consumption entry deleted"}
+    results = [{"index": i, "op": op.op, "id": op.id} for i, op in enumerate(operations)]
+
+    def fail(index, detail):
+        results[index].update(status="error", detail=detail)
 
-    raise HTTPException(status_code=403, detail="Not allowed to delete this entry")
+    # With sharding, a batch is applied on one company's shard
+    company_id = None
+    if sharding.shards is not None:
+        entry_companies = {entry_company(op.id) for op in operations if op.id is not None}
+        # company_ids() without IDs would list every company
+        companies = (
+            set(sharding.shards.company_ids(entry_companies)) if entry_companies else set()
+        )
+        project_ids = {op.data.projectId for op in operations if op.data is not None}
+        if project_ids:
+            companies.update(
+                company
+                for (company,) in db.query(Project.companyId).filter(
+                    Project.id.in_(project_ids), Project.companyId.isnot(None)
+                )
+            )
+        if len(companies) > 1:
+            raise HTTPException(
+                status_code=400,
+                detail="A batch can only change entries of one company",
+            )
+        company_id = next(iter(companies), None)
+
+    with company_session(db, company_id) as db:
+        # Load everything the batch refers to up front
+        project_ids = {op.data.projectId for op in operations if op.data is not None}
+        projects = project_write_errors(
+            current_user,
+            db.query(Project.id, Project.companyId).filter(Project.id.in_(project_ids)),
+        )
+        entry_ids = {op.id for op in operations if op.id is not None}
+        entries = {
+            entry.id: entry
+            for entry in db.query(
+                Consumption.id,
+                Consumption.userId,
+                Consumption.projectId,
+                Consumption.fuelTypeId,
+                Consumption.startDate,
+                Consumption.endDate,
+                Consumption.amount,
+                Project.companyId,
+            )
+            .outerjoin(Project, Project.id == Consumption.projectId)
+            .filter(Consumption.id.in_(entry_ids), Consumption.deletedAt.is_(None))
+        }
+
+        creates, updates, deletes = [], [], []
+        seen = set()
+        for i, op in enumerate(operations):
+            if op.op != "create":
+                if op.id is None:
+                    fail(i, "Missing id")
+                    continue
+                if op.id in seen:
+                    fail(i, "Entry appears more than once in the batch")
+                    continue
+                seen.add(op.id)
+                entry = entries.get(op.id)
+                if entry is None:
+                    fail(i, "Consumption entry not found")
+                    continue
+                if not can_modify_entry(current_user, entry.companyId, entry.userId):
+                    action = "edit" if op.op == "update" else "delete"
+                    fail(i, f"Not allowed to {action} this entry")
+                    continue
+                if op.op == "delete":
+                    deletes.append((i, entry))
+                    continue
+
+            if op.data is None:
+                fail(i, "Missing data")
+            elif op.data.projectId not in projects:
+                fail(i, "Project not found")
+            elif projects[op.data.projectId]:
+                fail(i, projects[op.data.projectId])
+            elif op.op == "create":
+                # Entries are reported by the current user, as for single creates
+                creates.append((i, {**op.data.model_dump(), "userId": current_user.id}))
+            else:
+                # Updated entries keep their reporter
+                values = op.data.model_dump(exclude={"userId"})
+                updates.append((i, entries[op.id], values))
+
+        now = datetime.now(timezone.utc)
+        # Rollup changes of the whole batch: (projectId, fuelTypeId, start, end, amount)
+        rollup = []
+
+        if creates:
+            created_ids = db.scalars(
+                insert(Consumption).returning(Consumption.id, sort_by_parameter_order=True),
+                [values for _, values in creates],
+            ).all()
+            for (i, values), entry_id in zip(creates, created_ids):
+                results[i].update(status="created", id=entry_id)
+                rollup.append(_rollup_entry(values))
+
+        if updates:
+            db.execute(
+                update(Consumption),
+                [{**values, "id": entry.id, "updatedAt": now} for _, entry, values in updates],
+            )
+            for i, entry, values in updates:
+                results[i]["status"] = "updated"
+                rollup.append(_rollup_entry(entry._asdict(), sign=-1))
+                rollup.append(_rollup_entry(values))
+
+        if deletes:
+            db.query(Consumption).filter(
+                Consumption.id.in_([entry.id for _, entry in deletes])
+            ).update({"deletedAt": now, "updatedAt": now}, synchronize_session=False)
+            for i, entry in deletes:
+                results[i]["status"] = "deleted"
+                rollup.append(_rollup_entry(entry._asdict(), sign=-1))
+
+        if creates or updates or deletes:
+            add_consumptions(db, rollup)
+            db.commit()
+            # Rollup entries start with the project ID
+            consumption_changed(db, [entry[0] for entry in rollup])
+
+        return {
+            "created": len(creates),
+            "updated": len(updates),
+            "deleted": len(deletes),
+            "failed": len(operations) - len(creates) - len(updates) - len(deletes),
+            "results": results,
+        }
+
+
+def _rollup_entry(values: dict, sign: int = 1) -> tuple:
+    """An add_consumptions entry for an entry's values; sign=-1 removes it."""
+    return (
+        values["projectId"],
+        values["fuelTypeId"],
+        values["startDate"],
+        values["endDate"],
+        sign * values["amount"],
+    )
@@ -1,20 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import ValidationError
+from sqlalchemy import literal
 from sqlalchemy.orm import Session
-from database import get_db
-from models import Invite, User
-from schemas import InviteSchema, InviteSubmitSchema
+from database import get_db, get_read_db
+from models import Company, Invite, User
+from schemas import InviteBulkResultSchema, InviteSchema, InviteSubmitSchema
 from security import generate_invite_token, get_current_user
-from datetime import datetime, timedelta
-from utils.email_utils import send_invite_email
+from datetime import datetime, timezone
+from utils.email_outbox import enqueue_emails, enqueue_invite_email, invite_email
+from utils.invite_sweeper import invite_expiry_threshold, invite_sweeper
+import csv
+import io
+import json
 
 router = APIRouter()
 
-# Constants for expiration
-INVITE_EXPIRATION_DAYS = 30  # Number of days after which an invite expires
+# Invites expire after INVITE_EXPIRATION_DAYS; the background sweeper deletes them
 CONFERMATION_LINK = (
     "http://localhost:3000/complete-account-setup/"  # Base URL for account setup link
 )
 
+# Upper bound for the number of rows accepted by /invites/bulk
+BULK_INVITE_MAX_ROWS = 1000
+
+# Columns a bulk invite CSV must provide
+BULK_INVITE_COLUMNS = ("email", "firstName", "lastName", "role", "companyId")
+
 
 @router.post("/", response_model=InviteSchema)
 def create_invite(
@@ -38,6 +49,21 @@ def create_invite(
     if existing_user:
         raise HTTPException(status_code=400, detail="Email is already in use")
 
+    # Only an unexpired invite blocks the email; an expired one is replaced
+    pending = (
+        db.query(Invite.id)
+        .filter(
+            Invite.email == invite_data.email,
+            Invite.createdAt >= invite_expiry_threshold(),
+        )
+        .first()
+    )
+    if pending:
+        raise HTTPException(
+            status_code=400, detail="An invite is already pending for this email"
+        )
+    delete_expired_invites(db, [invite_data.email])
+
     # Create a new invite record with provided data and a generated token
     invite = Invite(
         email=invite_data.email,
@@ -46,36 +72,212 @@ def create_invite(
         role=invite_data.role,
         companyId=invite_data.companyId,
         inviteToken=generate_invite_token(),
-        createdAt=datetime.now(),
+        createdAt=datetime.now(timezone.utc),
     )
 
-    # Save the invite to the database
+    # Save the invite and queue the email with the tokenized setup link together,
+    # the background worker delivers it
     db.add(invite)
-    db.commit()
-    db.refresh(invite)
-
-    # Send invite email with tokenized setup link
-    send_invite_email(
+    enqueue_invite_email(
+        db,
         invite.email,
         invite.firstName,
         invite.lastName,
         CONFERMATION_LINK + invite.inviteToken,
     )
+    db.commit()
+    db.refresh(invite)
 
     return invite
 
 
-@router.get("/token/{invite_token}")
-def get_invite_by_token(invite_token: str, db: Session = Depends(get_db)):
-    # Delete expired invites before processing
-    now = datetime.now()
+def delete_expired_invites(db: Session, emails):
+    """
+    Deletes the expired invites the sweeper has not removed yet for these emails.
+
+    Invite.email is unique, so such a leftover would otherwise block re-inviting.
+
+    :param db: The session of the transaction that inserts the new invites.
+    :param emails: The emails about to be invited.
+    """
     db.query(Invite).filter(
-        Invite.createdAt < now - timedelta(days=INVITE_EXPIRATION_DAYS)
-    ).delete()
-    db.commit()
+        Invite.email.in_(emails), Invite.createdAt < invite_expiry_threshold()
+    ).delete(synchronize_session=False)
+
+
+async def read_body(request: Request) -> bytes:
+    """Reads the raw request body, so the endpoint itself can stay synchronous."""
+    return await request.body()
+
+
+def parse_bulk_rows(content_type: str, raw: bytes) -> list:
+    """
+    Parses a bulk invite upload, either CSV with a header row or a JSON array.
+
+    :param content_type: The Content-Type header of the request.
+    :param raw: The request body.
+    :return: The uploaded rows, not validated yet.
+    """
+    if "csv" in content_type:
+        try:
+            text = raw.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="CSV must be UTF-8 encoded")
+        reader = csv.DictReader(io.StringIO(text))
+        missing = [c for c in BULK_INVITE_COLUMNS if c not in (reader.fieldnames or [])]
+        if missing:
+            raise HTTPException(
+                status_code=400, detail=f"Missing CSV columns: {', '.join(missing)}"
+            )
+        rows = list(reader)
+    else:
+        try:
+            rows = json.loads(raw)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON")
+        if not isinstance(rows, list):
+            raise HTTPException(
+                status_code=400, detail="Expected a JSON array of invites"
+            )
+
+    if len(rows) > BULK_INVITE_MAX_ROWS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {BULK_INVITE_MAX_ROWS} invites per upload",
+        )
+    return rows
+
 
-    # Fetch the invite with the given token
-    invite = db.query(Invite).filter_by(inviteToken=invite_token).first()
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}"
+        for e in error.errors()
+    )
+
+
+@router.post("/bulk", response_model=InviteBulkResultSchema)
+def create_invites_bulk(
+    request: Request,
+    raw: bytes = Depends(read_body),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Invite many users at once from a CSV file (Content-Type: text/csv) or a JSON
+    array. Valid rows are inserted in a single transaction and their emails queued
+    for the outbox worker; invalid rows are skipped. Returns a per-row report.
+    """
+    if current_user.role not in ("admin", "companyadmin"):
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    rows = parse_bulk_rows(request.headers.get("content-type", ""), raw)
+    results = []
+    for i, row in enumerate(rows):
+        email = row.get("email") if isinstance(row, dict) else None
+        results.append({"row": i + 1, "email": email if isinstance(email, str) else None})
+
+    def fail(index, detail):
+        results[index].update(status="error", detail=detail)
+
+    # Validate the rows on their own first
+    candidates = []
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict):
+            fail(i, "Expected an object")
+            continue
+        try:
+            invite_data = InviteSubmitSchema.model_validate(row)
+        except ValidationError as e:
+            fail(i, _validation_message(e))
+            continue
+
+        # Same restrictions as for single invites
+        if current_user.role == "companyadmin":
+            invite_data.companyId = current_user.companyId
+            invite_data.role = "user"
+        candidates.append((i, invite_data))
+
+    # Check every email against existing users and pending invites in one query
+    emails = {invite_data.email for _, invite_data in candidates}
+    taken = dict(
+        db.query(Invite.email, literal("An invite is already pending for this email"))
+        .filter(
+            Invite.email.in_(emails), Invite.createdAt >= invite_expiry_threshold()
+        )
+        .union_all(
+            db.query(User.email, literal("Email is already in use")).filter(
+                User.email.in_(emails)
+            )
+        )
+        .all()
+    )
+    company_ids = {invite_data.companyId for _, invite_data in candidates}
+    known_companies = {
+        company_id
+        for (company_id,) in db.query(Company.id).filter(Company.id.in_(company_ids))
+    }
+
+    accepted = []
+    seen = set()
+    for i, invite_data in candidates:
+        if invite_data.email in taken:
+            fail(i, taken[invite_data.email])
+        elif invite_data.email in seen:
+            fail(i, "Duplicate email in upload")
+        elif invite_data.companyId not in known_companies:
+            fail(i, "Company not found")
+        else:
+            seen.add(invite_data.email)
+            accepted.append((i, invite_data))
+
+    # Insert all accepted invites and queue their emails in one transaction
+    now = datetime.now(timezone.utc)
+    invites = [
+        Invite(
+            **invite_data.model_dump(),
+            inviteToken=generate_invite_token(),
+            createdAt=now,
+        )
+        for _, invite_data in accepted
+    ]
+    if invites:
+        delete_expired_invites(db, [invite.email for invite in invites])
+        db.add_all(invites)
+        enqueue_emails(
+            db,
+            [
+                invite_email(
+                    invite.email,
+                    invite.firstName,
+                    invite.lastName,
+                    CONFERMATION_LINK + invite.inviteToken,
+                )
+                for invite in invites
+            ],
+        )
+        db.flush()
+        for (i, _), invite in zip(accepted, invites):
+            results[i].update(status="created", inviteId=invite.id)
+        db.commit()
+
+    return {
+        "created": len(invites),
+        "failed": len(rows) - len(invites),
+        "results": results,
+    }
+
+
+@router.get("/token/{invite_token}")
+def get_invite_by_token(invite_token: str, db: Session = Depends(get_read_db)):
+    # Fetch the invite with the given token, unless it has expired
+    invite = (
+        db.query(Invite)
+        .filter(
+            Invite.inviteToken == invite_token,
+            Invite.createdAt >= invite_expiry_threshold(),
+        )
+        .first()
+    )
     if not invite:
         raise HTTPException(status_code=404, detail="Invite not found or expired")
 
@@ -84,28 +286,32 @@ def get_invite_by_token(invite_token: str, db: Session = Depends(get_db)):
 
 @router.get("/", response_model=list[InviteSchema])
 def get_pending_invites(
-    db: Session = Depends(get_db), current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_read_db), current_user: User = Depends(get_current_user)
 ):
     """List all pending invites. Companyadmins only see invites from their own company."""
 
-    # First, delete expired invites
-    expiration_threshold = datetime.now() - timedelta(days=INVITE_EXPIRATION_DAYS)
-    db.query(Invite).filter(Invite.createdAt < expiration_threshold).delete()
-    db.commit()
+    # Expired invites are skipped here and deleted later by the sweeper
+    pending = db.query(Invite).filter(Invite.createdAt >= invite_expiry_threshold())
 
     # Return different sets of invites depending on user role
     if current_user.role == "admin":
-        invites = db.query(Invite).all()  # Admins see all invites
+        invites = pending.all()  # Admins see all invites
     elif current_user.role == "companyadmin":
-        invites = (
-            db.query(Invite).filter(Invite.companyId == current_user.companyId).all()
-        )
+        invites = pending.filter(Invite.companyId == current_user.companyId).all()
     else:
         raise HTTPException(status_code=403, detail="Not authorized")
 
     return invites
 
 
+@router.get("/sweeper")
+def get_sweeper_metrics(current_user: User = Depends(get_current_user)):
+    """Admins can check how many expired invites the background sweeper purged."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return invite_sweeper.metrics()
+
+
 @router.delete("/{invite_id}")
 def delete_invite(
     invite_id: int,
@@ -152,16 +358,16 @@ def resend_invite(
 
     # Generate a new token and update timestamp
     invite.inviteToken = generate_invite_token()
-    invite.createdAt = datetime.now()
+    invite.createdAt = datetime.now(timezone.utc)
 
-    db.commit()
-
-    # Resend the invitation email
-    send_invite_email(
+    # Queue the invitation email again, with the new token
+    enqueue_invite_email(
+        db,
         invite.email,
         invite.firstName,
         invite.lastName,
         CONFERMATION_LINK + invite.inviteToken,
     )
+    db.commit()
 
     return {"detail": "Invite resent successfully"}
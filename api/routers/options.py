@@ -1,20 +1,45 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from database import get_db
 from models import Company, ActivityType, FuelType, Unit
 from schemas import CompanySchema, ActivityTypeSchema, FuelTypeSchema, UnitSchema
+from utils.reference_data import invalidate_reference_data, reference_response
+from utils import sharding
+from utils.response_cache import EMISSIONS_TAG, response_cache
+from utils.rollup import recompute_fuel_type
 
 router = APIRouter()
 
+
+# --- COMBINED ENDPOINT ---
+
+
+@router.get("/all")
+def get_all_options(request: Request, db: Session = Depends(get_db)):
+    """
+    Retrieve companies, activity types, fuel types and units in one round trip.
+    """
+    return reference_response(
+        request,
+        "all",
+        lambda: {
+            "companies": db.query(Company).all(),
+            "activityTypes": db.query(ActivityType).all(),
+            "fuelTypes": db.query(FuelType).all(),
+            "units": db.query(Unit).all(),
+        },
+    )
+
+
 # --- COMPANY ENDPOINTS ---
 
 
 @router.get("/companies")
-def get_companies(db: Session = Depends(get_db)):
+def get_companies(request: Request, db: Session = Depends(get_db)):
     """
-    Retrieve a list of all companies from the database.
+    Retrieve a list of all companies, served from the reference data cache.
     """
-    return db.query(Company).all()
+    return reference_response(request, "companies", lambda: db.query(Company).all())
 
 
 @router.post("/companies")
@@ -25,6 +50,7 @@ def create_company(company_data: CompanySchema, db: Session = Depends(get_db)):
     new_company = Company(**company_data.model_dump())
     db.add(new_company)
     db.commit()
+    invalidate_reference_data()
     db.refresh(new_company)
     return new_company
 
@@ -43,6 +69,7 @@ def update_company(id: int, company_data: CompanySchema, db: Session = Depends(g
         setattr(company, key, value)
 
     db.commit()
+    invalidate_reference_data()
     return company
 
 
@@ -57,6 +84,7 @@ def delete_company(id: int, db: Session = Depends(get_db)):
 
     db.delete(company)
     db.commit()
+    invalidate_reference_data()
     return {"message": "Company deleted"}
 
 
@@ -64,11 +92,11 @@ def delete_company(id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/activity-types")
-def get_activity_types(db: Session = Depends(get_db)):
+def get_activity_types(request: Request, db: Session = Depends(get_db)):
     """
-    Retrieve a list of all activity types from the database.
+    Retrieve a list of all activity types, served from the reference data cache.
     """
-    return db.query(ActivityType).all()
+    return reference_response(request, "activity-types", lambda: db.query(ActivityType).all())
 
 
 @router.post("/activity-types")
@@ -79,6 +107,7 @@ def create_activity_type(data: ActivityTypeSchema, db: Session = Depends(get_db)
     new_activity = ActivityType(**data.model_dump())
     db.add(new_activity)
     db.commit()
+    invalidate_reference_data()
     db.refresh(new_activity)
     return new_activity
 
@@ -99,6 +128,7 @@ def update_activity_type(
         setattr(activity, key, value)
 
     db.commit()
+    invalidate_reference_data()
     return activity
 
 
@@ -113,6 +143,7 @@ def delete_activity_type(id: int, db: Session = Depends(get_db)):
 
     db.delete(activity)
     db.commit()
+    invalidate_reference_data()
     return {"message": "Activity type deleted"}
 
 
@@ -120,11 +151,11 @@ def delete_activity_type(id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/fuel-types")
-def get_fuel_types(db: Session = Depends(get_db)):
+def get_fuel_types(request: Request, db: Session = Depends(get_db)):
     """
-    Retrieve a list of all fuel types from the database.
+    Retrieve a list of all fuel types, served from the reference data cache.
     """
-    return db.query(FuelType).all()
+    return reference_response(request, "fuel-types", lambda: db.query(FuelType).all())
 
 
 @router.post("/fuel-types")
@@ -135,6 +166,7 @@ def create_fuel_type(data: FuelTypeSchema, db: Session = Depends(get_db)):
     new_fuel_type = FuelType(**data.model_dump())
     db.add(new_fuel_type)
     db.commit()
+    invalidate_reference_data()
     db.refresh(new_fuel_type)
     return new_fuel_type
 
@@ -148,14 +180,37 @@ def update_fuel_type(id: int, data: FuelTypeSchema, db: Session = Depends(get_db
     if not fuel:
         raise HTTPException(status_code=404, detail="Fuel type not found")
 
+    previous_factor = fuel.averageCO2Emission
+
     # Update fields dynamically
     for key, value in data.model_dump().items():
         setattr(fuel, key, value)
 
+    # Keep the daily emission rollup in line with the new emission factor
+    recompute = fuel.averageCO2Emission != previous_factor
+    if recompute:
+        recompute_fuel_type(db, fuel.id, fuel.averageCO2Emission)
+
     db.commit()
+    if recompute and sharding.shards is not None:
+        sharding.shards.fan_out(
+            sharding.shards.company_ids(),
+            _recompute_shard,
+            fuel.id,
+            fuel.averageCO2Emission,
+        )
+    if recompute:
+        response_cache.invalidate([EMISSIONS_TAG])
+    invalidate_reference_data()
     return fuel
 
 
+def _recompute_shard(db: Session, fuel_type_id: int, factor: float):
+    """Recomputes the rollup of a fuel type on one company shard."""
+    recompute_fuel_type(db, fuel_type_id, factor)
+    db.commit()
+
+
 @router.delete("/fuel-types/{id}")
 def delete_fuel_type(id: int, db: Session = Depends(get_db)):
     """
@@ -167,6 +222,7 @@ def delete_fuel_type(id: int, db: Session = Depends(get_db)):
 
     db.delete(fuel)
     db.commit()
+    invalidate_reference_data()
     return {"message": "Fuel type deleted"}
 
 
@@ -174,11 +230,11 @@ def delete_fuel_type(id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/units")
-def get_units(db: Session = Depends(get_db)):
+def get_units(request: Request, db: Session = Depends(get_db)):
     """
-    Retrieve a list of all measurement units from the database.
+    Retrieve a list of all measurement units, served from the reference data cache.
     """
-    return db.query(Unit).all()
+    return reference_response(request, "units", lambda: db.query(Unit).all())
 
 
 @router.post("/units")
@@ -189,6 +245,7 @@ def create_unit(data: UnitSchema, db: Session = Depends(get_db)):
     new_unit = Unit(**data.model_dump())
     db.add(new_unit)
     db.commit()
+    invalidate_reference_data()
     db.refresh(new_unit)
     return new_unit
 
@@ -207,6 +264,7 @@ def update_unit(id: int, data: UnitSchema, db: Session = Depends(get_db)):
         setattr(unit, key, value)
 
     db.commit()
+    invalidate_reference_data()
     return unit
 
 
@@ -221,4 +279,5 @@ def delete_unit(id: int, db: Session = Depends(get_db)):
 
     db.delete(unit)
     db.commit()
+    invalidate_reference_data()
     return {"message": "Unit deleted"}
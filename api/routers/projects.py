@@ -1,28 +1,64 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import case, or_
 from sqlalchemy.orm import Session
-from database import get_db
-from models import Project, User, Company
+from database import get_db, get_read_db
+from models import Project, User, Company, User_Project
 from schemas import ProjectSchema, ProjectSubmitSchema
-from security import get_current_user
+from security import bump_permission_version, get_current_user
 from datetime import date
+from typing import Optional
 from logging_config import logger
+from utils.fieldsets import parse_fields
+from utils.response_cache import company_tag, project_tag, response_cache
+from utils.serialization import row_records
 
 # Initialize the API router
 router = APIRouter()
 
+# Keys of a project list entry, in response order
+PROJECT_FIELDS = tuple(ProjectSchema.model_fields)
+
+
+def project_columns():
+    """Column expression of each project list field."""
+    return {
+        "id": Project.id,
+        "name": Project.name,
+        "startDate": Project.startDate,
+        "endDate": Project.endDate,
+        # Dynamic status: ongoing until the end date has passed
+        "status": case(
+            (or_(Project.endDate.is_(None), Project.endDate >= date.today()), "Ongoing"),
+            else_="Completed",
+        ).label("status"),
+        "companyId": Project.companyId,
+        "company": Company.name.label("company"),
+    }
+
 
 @router.get("/", response_model=list[ProjectSchema])
-def get_projects(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+def get_projects(
+    fields: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+    user: User = Depends(get_current_user),
+):
     """
     Retrieve projects based on the authenticated user's role.
     - Admin users can view all projects.
     - Company admins can view projects only for their company.
     - Regular users can view projects explicitly assigned to them.
+    - `fields` takes a comma-separated subset of the project fields (e.g.
+      "id,name"); the company is only joined if its name is asked for.
     """
-    # Prepare base query with join to include company name
-    query = db.query(Project, Company.name.label("company")).join(
-        Company, Project.companyId == Company.id
-    )
+    fields = parse_fields(fields, PROJECT_FIELDS)
+    columns = project_columns()
+    query = db.query(*(columns[field] for field in fields))
+    if "company" in fields:
+        query = query.join(Company, Project.companyId == Company.id)
+    else:
+        # Same rows as with the join: projects without a company are not listed
+        query = query.filter(Project.companyId.isnot(None))
 
     # Company admins see only their own company's projects
     if user.role == "companyadmin":
@@ -30,28 +66,10 @@ def get_projects(db: Session = Depends(get_db), user: User = Depends(get_current
 
     # Regular users see only projects assigned to them
     elif user.role == "user":
-        logger.debug(f"User: {user.projects}")  # Logging for debug/trace
-        query = query.filter(Project.id.in_([p.projectId for p in user.projects]))
-
-    projects = query.all()
-
-    # Return serialized project data including dynamic project status
-    return [
-        ProjectSchema(
-            id=proj.id,
-            name=proj.name,
-            startDate=proj.startDate,
-            endDate=proj.endDate,
-            status=(
-                "Ongoing"
-                if proj.endDate is None or proj.endDate >= date.today()
-                else "Completed"
-            ),
-            companyId=proj.companyId,
-            company=companyName,
-        )
-        for proj, companyName in projects
-    ]
+        logger.debug(f"User projects: {user.project_ids}")  # Logging for debug/trace
+        query = query.filter(Project.id.in_(user.project_ids))
+
+    return ORJSONResponse(row_records(query.all(), fields))
 
 
 @router.post("/", response_model=ProjectSchema)
@@ -138,12 +156,19 @@ def update_project(
         update_data["endDate"] = None
 
     # Apply updates to the project model
+    previous_company_id = project.companyId
     for key, value in update_data.items():
         setattr(project, key, value)
 
     db.commit()
     db.refresh(project)
 
+    # Moving a project moves its emissions to the other company's aggregates
+    if project.companyId != previous_company_id:
+        response_cache.invalidate(
+            [company_tag(previous_company_id), company_tag(project.companyId)]
+        )
+
     # Return updated project info
     return ProjectSchema(
         id=project.id,
@@ -180,6 +205,17 @@ def delete_project(
     if user.role == "companyadmin" and project.companyId != user.companyId:
         raise HTTPException(status_code=403, detail="Not authorized")
 
+    # Members lose access to the project: invalidate their issued token claims
+    member_ids = [
+        user_id
+        for (user_id,) in db.query(User_Project.userId).filter(
+            User_Project.projectId == project_id
+        )
+    ]
+    bump_permission_version(db, member_ids)
+
+    company_id = project.companyId
     db.delete(project)
     db.commit()
+    response_cache.invalidate([project_tag(project_id), company_tag(company_id)])
     return {"detail": "Project deleted"}
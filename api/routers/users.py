@@ -1,51 +1,93 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session, joinedload
-from database import get_db
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.orm import Session
+from database import get_db, get_read_db
 from models import User, Company, Project, User_Project, Invite
 from schemas import UserSchema, UserSubmitSchema
-from security import get_current_user, hash_password
-from typing import List
+from security import (
+    bump_permission_version,
+    get_current_user,
+    hash_password,
+    load_user,
+)
+from typing import List, Optional
 from pydantic import BaseModel
+from utils.fieldsets import parse_fields
+from utils.invite_sweeper import invite_expiry_threshold
+from utils.serialization import row_records
 
 router = APIRouter()
 
+# Keys of a user list entry, in response order
+USER_FIELDS = tuple(UserSchema.model_fields)
+
+# Column expression of each list field that is a single column
+USER_COLUMNS = {
+    "id": User.id,
+    "firstName": User.firstName,
+    "lastName": User.lastName,
+    "email": User.email,
+    "role": User.role,
+    "companyId": User.companyId,
+    "company": Company.name.label("company"),
+}
+
 
 @router.get("/", response_model=List[UserSchema])
-def get_users(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    """Admins get all users, company admins only see users from their company."""
-
-    # Build the initial query to fetch users and their company names
-    query = (
-        db.query(User, Company.name.label("company"))
-        .join(Company, User.companyId == Company.id)
-        .options(joinedload(User.projects).joinedload(User_Project.project))
-    )
+def get_users(
+    fields: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+    user: User = Depends(get_current_user),
+):
+    """
+    Admins get all users, company admins only see users from their company.
+
+    `fields` takes a comma-separated subset of the user fields (e.g. "id,email");
+    the company is only joined and the project assignments only loaded if asked for.
+    """
+    fields = parse_fields(fields, USER_FIELDS)
+    columns = [User.id] + [
+        USER_COLUMNS[field] for field in fields if field not in ("id", "projects")
+    ]
+    query = db.query(*columns)
+    if "company" in fields:
+        query = query.join(Company, User.companyId == Company.id)
+    else:
+        # Same rows as with the join: users without a company are not listed
+        query = query.filter(User.companyId.isnot(None))
 
     # Restrict to company-specific users if requester is a company admin
     if user.role == "companyadmin":
         query = query.filter(User.companyId == user.companyId)
 
     users = query.all()
+    records = row_records(users, [field for field in fields if field != "projects"])
 
-    # Construct the list of serialized UserSchema responses
-    return [
-        UserSchema(
-            id=user.id,
-            firstName=user.firstName,
-            lastName=user.lastName,
-            email=user.email,
-            role=user.role,
-            companyId=user.companyId,
-            company=company_name,
-            projects=[up.project.id for up in user.projects],
-        )
-        for user, company_name in users
-    ]
+    # Project assignments of all listed users in one query; last in response order
+    if "projects" in fields:
+        assignments = db.query(User_Project.userId, User_Project.projectId)
+        if user.role == "companyadmin":
+            assignments = assignments.join(User, User.id == User_Project.userId).filter(
+                User.companyId == user.companyId
+            )
+        projects = {}
+        for user_id, project_id in assignments:
+            projects.setdefault(user_id, []).append(project_id)
+        for record, row in zip(records, users):
+            record["projects"] = projects.get(row.id, [])
+
+    return ORJSONResponse(records)
 
 
 @router.get("/me", response_model=UserSchema)
-def get_current_user_details(user: User = Depends(get_current_user)):
+def get_current_user_details(
+    db: Session = Depends(get_read_db), current_user: User = Depends(get_current_user)
+):
     """Return the details of the logged-in user."""
+    user = load_user(db, current_user)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
     return UserSchema(
         id=user.id,
         firstName=user.firstName,
@@ -59,7 +101,7 @@ def get_current_user_details(user: User = Depends(get_current_user)):
 
 @router.get("/{user_id}", response_model=UserSchema)
 def get_user(
-    user_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)
+    user_id: int, db: Session = Depends(get_read_db), user: User = Depends(get_current_user)
 ):
     """Get a user by ID. CompanyAdmins can only access users from their company."""
 
@@ -92,7 +134,12 @@ def create_user(confirm_data: UserSubmitSchema, db: Session = Depends(get_db)):
 
     # Validate the invite token
     invite = (
-        db.query(Invite).filter(Invite.inviteToken == confirm_data.inviteToken).first()
+        db.query(Invite)
+        .filter(
+            Invite.inviteToken == confirm_data.inviteToken,
+            Invite.createdAt >= invite_expiry_threshold(),
+        )
+        .first()
     )
     if not invite:
         raise HTTPException(status_code=404, detail="Invalid or expired invite")
@@ -167,6 +214,9 @@ def update_user(
                 User_Project(userId=user_id, projectId=project_id)
             )  # Assign new projects
 
+    # Role, company or projects may have changed: invalidate issued token claims
+    bump_permission_version(db, [user_id])
+
     db.commit()
     db.refresh(fetched_user)
 
@@ -199,6 +249,7 @@ def delete_user(
     if user.role == "companyadmin" and fetched_user.companyId != user.companyId:
         raise HTTPException(status_code=403, detail="Not authorized")
 
+    bump_permission_version(db, [user_id])
     db.delete(fetched_user)
     db.commit()
     return {"detail": "User deleted"}
@@ -206,7 +257,7 @@ def delete_user(
 
 @router.get("/{user_id}/projects", response_model=List[dict])
 def get_user_projects(
-    user_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)
+    user_id: int, db: Session = Depends(get_read_db), user: User = Depends(get_current_user)
 ):
     """Return a list of projects (ID and Name) assigned to the user."""
 
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, ConfigDict
 from datetime import date, datetime
-from typing import Optional, List
+from typing import Literal, Optional, List
 
 
 class LoginSchema(BaseModel):
@@ -28,6 +28,30 @@ class ConsumptionSchema(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class ConsumptionChangeSchema(ConsumptionSchema):
+    updatedAt: datetime  # UTC time of the last insert or update
+
+
+class ConsumptionChangesSchema(BaseModel):
+    changes: List[ConsumptionChangeSchema]  # Inserted or updated entries
+    deleted: List[int]  # IDs of deleted entries
+    watermark: Optional[str] = None  # Pass as `since` to get the following changes
+    hasMore: bool
+
+
+class ConsumptionFilterSchema(BaseModel):
+    projectId: List[int] = []
+    companyId: List[int] = []
+    fuelTypeId: List[int] = []
+    activityTypeId: List[int] = []
+    userId: List[int] = []
+    dateFrom: Optional[date] = None  # Entries whose period ends on/after this date
+    dateTo: Optional[date] = None  # Entries whose period starts on/before this date
+    minAmount: Optional[float] = None
+    maxAmount: Optional[float] = None
+    q: Optional[str] = None  # Free-text search over names
+
+
 class ConsumptionSubmitSchema(BaseModel):
     projectId: int
     amount: float
@@ -41,6 +65,32 @@ class ConsumptionSubmitSchema(BaseModel):
     userId: int
 
 
+class ConsumptionBatchOperationSchema(BaseModel):
+    op: Literal["create", "update", "delete"]
+    id: Optional[int] = None  # Entry to update or delete
+    data: Optional[ConsumptionSubmitSchema] = None  # Values to create or update with
+
+
+class ConsumptionBatchSchema(BaseModel):
+    operations: List[ConsumptionBatchOperationSchema]
+
+
+class ConsumptionBatchItemResultSchema(BaseModel):
+    index: int  # 0-based position in the operations list
+    op: str
+    status: str  # "created", "updated", "deleted" or "error"
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class ConsumptionBatchResultSchema(BaseModel):
+    created: int
+    updated: int
+    deleted: int
+    failed: int
+    results: List[ConsumptionBatchItemResultSchema]
+
+
 class CompanySchema(BaseModel):
     name: str
 
@@ -115,3 +165,17 @@ class InviteSubmitSchema(BaseModel):
     lastName: str
     role: str
     companyId: int
+
+
+class InviteBulkRowResultSchema(BaseModel):
+    row: int  # 1-based position in the upload (data rows only)
+    email: Optional[str] = None
+    status: str  # "created" or "error"
+    detail: Optional[str] = None
+    inviteId: Optional[int] = None
+
+
+class InviteBulkResultSchema(BaseModel):
+    created: int
+    failed: int
+    results: List[InviteBulkRowResultSchema]
@@ -0,0 +1,94 @@
+"""
+Measure the throughput of the consumption bulk importer against a scratch SQLite
+database file.
+
+Run from the api/ directory:
+
+    python -m scripts.import_benchmark [rows] [csv|ndjson]
+
+The target is 50k rows/s. On the single-core development sandbox 200k rows
+import at about 31-39k rows/s (CSV and NDJSON alike), short of it: the indexed
+executemany alone takes about 2.4s of the 5-6s, converting rows about 1s,
+parsing 0.5s and the rollup 0.5s.
+"""
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+from database import create_db_engine
+from sqlalchemy.orm import Session
+from migrations import run_migrations
+from models import ActivityType, Company, Consumption, FuelType, Project, Unit
+from utils.consumption_import import ConsumptionImporter, read_batches
+
+PROJECTS = 20
+FUEL_TYPES = ("Diesel", "Petrol", "Natural gas", "Electricity")
+
+
+def seed(db):
+    """Create the lookup rows the generated entries refer to."""
+    company = Company(name="Benchmark Co")
+    db.add(company)
+    db.flush()
+    db.add_all(
+        Project(name=f"Site {i}", startDate=date(2024, 1, 1), companyId=company.id)
+        for i in range(PROJECTS)
+    )
+    db.add_all(FuelType(name=name, averageCO2Emission=2.5) for name in FUEL_TYPES)
+    db.add_all([ActivityType(name="Metering"), Unit(name="Liter")])
+    db.commit()
+
+
+def generate_lines(rows, fmt):
+    """Monthly meter readings spread over the projects and fuel types."""
+    if fmt == "csv":
+        yield b"project,activityType,fuelType,unit,amount,startDate,endDate,reportDate"
+    for i in range(rows):
+        start = date(2024, 1, 1) + timedelta(days=(i // PROJECTS) % 330)
+        values = {
+            "project": f"Site {i % PROJECTS}",
+            "activityType": "Metering",
+            "fuelType": FUEL_TYPES[i % len(FUEL_TYPES)],
+            "unit": "Liter",
+            "amount": 100 + i % 50,
+            "startDate": start.isoformat(),
+            "endDate": (start + timedelta(days=29)).isoformat(),
+            "reportDate": (start + timedelta(days=30)).isoformat(),
+        }
+        if fmt == "csv":
+            yield ",".join(str(v) for v in values.values()).encode()
+        else:
+            yield json.dumps(values).encode()
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    fmt = sys.argv[2] if len(sys.argv) > 2 else "csv"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(f"sqlite:///{os.path.join(tmp, 'benchmark.db')}")
+        run_migrations(engine)
+        with Session(engine) as db:
+            seed(db)
+            admin = SimpleNamespace(id=1, role="admin", companyId=None)
+            body = io.BytesIO(b"\n".join(generate_lines(rows, fmt)))
+
+            started = time.perf_counter()
+            importer = ConsumptionImporter(db, admin, fmt)
+            for batch in read_batches(body, fmt):
+                importer.feed(batch)
+            report = importer.finish()
+            elapsed = time.perf_counter() - started
+
+            assert db.query(Consumption).count() == report["inserted"] == rows
+        engine.dispose()
+
+    print(f"Imported {rows} {fmt} rows in {elapsed:.2f}s: {rows / elapsed:,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
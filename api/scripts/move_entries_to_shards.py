@@ -0,0 +1,32 @@
+"""
+Move the consumption entries of an existing database into the company shards,
+before the app is started in shard mode for the first time.
+
+Run from the api/ directory with SHARD_DATABASE_URL_TEMPLATE set:
+
+    python -m scripts.move_entries_to_shards
+
+Entries get new IDs from their company's range (see utils/sharding.py), so
+clients of /consumption/changes must run a fresh initial sync afterwards.
+"""
+import sys
+from database import engine
+from migrations import run_migrations
+from utils import sharding
+
+
+def main():
+    if sharding.shards is None:
+        sys.exit("Set SHARD_DATABASE_URL_TEMPLATE to the shard URL template first")
+    run_migrations(engine)
+    moved = sharding.shards.move_catalog_entries()
+    for company_id, count in moved.items():
+        print(f"Company {company_id}: moved {count} entries")
+    left = sharding.shards.catalog_entries()
+    if left:
+        sys.exit(f"{left} entries without a project or company stay in the catalog")
+    print("The catalog holds no more entries")
+
+
+if __name__ == "__main__":
+    main()
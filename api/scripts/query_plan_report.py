@@ -0,0 +1,105 @@
+"""
+Print the EXPLAIN QUERY PLAN of the hot router queries.
+
+The plans are taken on a temporary copy of the configured SQLite database, with
+the pending migrations applied to the copy, so the report never changes the real
+database. Without a SQLite database file, an empty in-memory database built by the
+migrations is used instead.
+
+Run from the api/ directory:
+
+    python -m scripts.query_plan_report
+"""
+import os
+import sqlite3
+import tempfile
+from datetime import date
+from types import SimpleNamespace
+from sqlalchemy import func
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from database import SQLALCHEMY_DATABASE_URL, create_db_engine
+from migrations import explain_query_plan, run_migrations
+from models import Consumption, DailyEmission, Project
+from routers.consumption import build_consumption_query
+from schemas import ConsumptionFilterSchema
+
+ADMIN = SimpleNamespace(role="admin", companyId=1)
+COMPANY_ADMIN = SimpleNamespace(role="companyadmin", companyId=1)
+USER = SimpleNamespace(role="user", companyId=1, project_ids=[1])
+
+
+def report_queries(db):
+    """Yield (title, query) pairs for the queries the routers issue most."""
+    newest_first = (Consumption.reportDate.desc(), Consumption.id.desc())
+    no_filters = ConsumptionFilterSchema()
+
+    yield "List consumptions as admin", build_consumption_query(
+        db, ADMIN, no_filters
+    ).order_by(*newest_first)
+    yield "List consumptions as companyadmin", build_consumption_query(
+        db, COMPANY_ADMIN, no_filters
+    ).order_by(*newest_first)
+    yield "List consumptions as user", build_consumption_query(
+        db, USER, no_filters
+    ).order_by(*newest_first)
+    yield "List consumptions filtered by user", build_consumption_query(
+        db, ADMIN, ConsumptionFilterSchema(userId=[1])
+    ).order_by(*newest_first)
+    yield "List consumptions of a project up to a date", build_consumption_query(
+        db, ADMIN, ConsumptionFilterSchema(projectId=[1], dateTo=date(2024, 1, 1))
+    )
+    yield "Company emission time series", (
+        db.query(DailyEmission.date, func.sum(DailyEmission.co2))
+        .join(Project, Project.id == DailyEmission.projectId)
+        .filter(Project.companyId == 1, DailyEmission.date >= date(2024, 1, 1))
+        .group_by(DailyEmission.date)
+    )
+
+
+def copy_database(url: str, target: str) -> bool:
+    """
+    Copy a SQLite database file with the backup API, opening the source read-only.
+
+    :param url: The URL of the database to copy.
+    :param target: The path of the copy.
+    :return: Whether the URL named an existing SQLite file that was copied.
+    """
+    parsed = make_url(url)
+    path = parsed.database
+    if parsed.get_backend_name() != "sqlite" or path in (None, "", ":memory:"):
+        return False
+    if not os.path.exists(path):
+        return False
+    source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    copy = sqlite3.connect(target)
+    try:
+        source.backup(copy)
+    finally:
+        copy.close()
+        source.close()
+    return True
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        copy_path = os.path.join(tmp, "query_plan_report.db")
+        if copy_database(SQLALCHEMY_DATABASE_URL, copy_path):
+            engine = create_db_engine(f"sqlite:///{copy_path}")
+        else:
+            print("No SQLite database file configured; using an empty schema\n")
+            engine = create_db_engine("sqlite://")
+        try:
+            run_migrations(engine)
+            with Session(engine) as db:
+                for title, query in report_queries(db):
+                    print(title)
+                    for detail in explain_query_plan(db, query):
+                        print(f"    {detail}")
+                    print()
+        finally:
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
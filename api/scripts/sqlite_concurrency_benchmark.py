@@ -0,0 +1,134 @@
+"""
+Compare read and write throughput of concurrent requests on a scratch SQLite
+database file, with SQLite's default settings and with the production PRAGMAs
+(WAL, synchronous=NORMAL, mmap, cache and busy timeout) from database.py.
+
+Reader threads page through the consumption list while writer threads add
+entries one transaction at a time, as the dashboard and data entry do.
+
+Run from the api/ directory:
+
+    python -m scripts.sqlite_concurrency_benchmark [seconds] [readers] [writers]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from database import create_db_engine, sqlite_pragmas
+from migrations import run_migrations
+from models import ActivityType, Company, Consumption, FuelType, Project, Unit, User
+from routers.consumption import CONSUMPTION_FIELDS, list_consumptions
+from schemas import ConsumptionFilterSchema
+
+ROWS = 20_000
+PAGE_SIZE = 100
+
+
+def seed(db):
+    company = Company(name="Benchmark Co")
+    db.add(company)
+    db.flush()
+    project = Project(name="Site", startDate=date(2024, 1, 1), companyId=company.id)
+    user = User(firstName="Bench", lastName="Mark", email="b@m.co", role="user", companyId=company.id)
+    lookups = [ActivityType(name="Metering"), FuelType(name="Diesel", averageCO2Emission=2.5), Unit(name="Liter")]
+    db.add_all([project, user, *lookups])
+    db.flush()
+    entry = {
+        "userId": user.id,
+        "projectId": project.id,
+        "activityTypeId": lookups[0].id,
+        "fuelTypeId": lookups[1].id,
+        "unitId": lookups[2].id,
+    }
+    db.execute(
+        Consumption.__table__.insert(),
+        [
+            dict(
+                entry,
+                amount=100.0 + i % 50,
+                startDate=date(2024, 1, 1) + timedelta(days=i % 300),
+                endDate=date(2024, 1, 31) + timedelta(days=i % 300),
+                reportDate=date(2024, 2, 1) + timedelta(days=i % 300),
+            )
+            for i in range(ROWS)
+        ],
+    )
+    db.commit()
+    return entry
+
+
+def run(pragmas, seconds, readers, writers):
+    """Returns (reads, writes, lock errors) completed within the given time."""
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(
+            f"sqlite:///{os.path.join(tmp, 'benchmark.db')}", pragmas=pragmas
+        )
+        run_migrations(engine)
+        with Session(engine) as db:
+            entry = seed(db)
+        admin = SimpleNamespace(id=entry["userId"], role="admin", companyId=None)
+
+        def read():
+            while not stop.is_set():
+                with Session(engine) as db:
+                    list_consumptions(
+                        db, admin, ConsumptionFilterSchema(), "-reportDate",
+                        CONSUMPTION_FIELDS, limit=PAGE_SIZE,
+                    )
+                with lock:
+                    counts["reads"] += 1
+
+        def write():
+            while not stop.is_set():
+                try:
+                    with Session(engine) as db:
+                        db.add(Consumption(
+                            amount=1.0, startDate=date(2024, 6, 1),
+                            endDate=date(2024, 6, 30), reportDate=date(2024, 7, 1),
+                            **entry,
+                        ))
+                        db.commit()
+                    key = "writes"
+                except OperationalError:
+                    key = "errors"
+                with lock:
+                    counts[key] += 1
+
+        threads = [threading.Thread(target=read) for _ in range(readers)]
+        threads += [threading.Thread(target=write) for _ in range(writers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+
+    return counts["reads"], counts["writes"], counts["errors"]
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    writers = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+
+    print(f"{readers} readers, {writers} writers, {seconds:g}s, {ROWS} rows")
+    for label, pragmas in (("defaults", {}), ("tuned", sqlite_pragmas())):
+        reads, writes, errors = run(pragmas, seconds, readers, writers)
+        print(
+            f"  {label:8}: {reads / seconds:8,.0f} reads/s  "
+            f"{writes / seconds:8,.0f} writes/s  {errors} lock errors"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,16 @@
 from passlib.context import CryptContext
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from jose import jwt, JWTError
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from database import get_db
-from models import User
+from database import DB_MODE, async_primary_runner, get_db
+from sqlalchemy import event
+from models import User, User_Project
+from typing import List, Optional
+from utils.cache import TTLCache
+import os
 import secrets
 
 # Password hashing settings
@@ -18,6 +23,24 @@ ALGORITHM = "HS256"  # Algorithm used for encoding the JWT
 ACCESS_TOKEN_EXPIRE_MINUTES = 15  # Access token expiration time (in minutes)
 REFRESH_TOKEN_EXPIRE_DAYS = 7  # Refresh token expiration time (in days)
 
+# Authentication mode:
+# - "database": load the user from the database on every request (default)
+# - "cached": keep recently seen principals in a bounded in-process LRU cache
+# - "claims": trust the role/company/project claims of the access token and only
+#   reload the user when their permission version has moved on since issuance
+AUTH_MODE = os.getenv("AUTH_MODE", "database")
+
+# Size and time-to-live (in seconds) of the principal cache used in "cached" mode
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "4096"))
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+
+# Tokens list at most this many project IDs; beyond that the claims fast path is skipped
+MAX_TOKEN_PROJECTS = 200
+
+# How long a worker trusts its cached copy of a user's permission version (in seconds).
+# Bounds how long a permission change made through another worker goes unnoticed.
+PERMISSION_VERSION_TTL = int(os.getenv("PERMISSION_VERSION_TTL", "60"))
+
 # OAuth2PasswordBearer is used to extract the token from the request's Authorization header
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
@@ -75,15 +98,166 @@ def hash_password(password):
     return pwd_context.hash(password)
 
 
+@dataclass(frozen=True)
+class Principal:
+    """
+    Lightweight stand-in for the User model, built from access token claims.
+    Carries only what the permission checks in the routers need.
+    """
+
+    id: int
+    role: str
+    companyId: Optional[int]
+    project_ids: List[int]
+
+
+# Per-worker cache of permission versions ("claims" mode): user ID -> version
+_permission_versions = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PERMISSION_VERSION_TTL)
+
+# Per-worker cache of principals ("cached" mode): user ID -> Principal
+_principals = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+
+def build_access_claims(user: User) -> dict:
+    """
+    Builds the access token claims for a user, including the claims used by the
+    claims-based authentication fast path.
+
+    :param user: The user the token is issued for.
+    :return: A dictionary of claims to pass to create_access_token.
+    """
+    project_ids = sorted(user.project_ids)
+    return {
+        "sub": str(user.id),  # Subject (user ID) as string
+        "email": user.email,  # User email
+        "role": user.role,  # User role for authorization
+        "companyId": user.companyId,  # Company affiliation
+        # Assigned projects, omitted when too many to fit comfortably in a token
+        "projects": project_ids if len(project_ids) <= MAX_TOKEN_PROJECTS else None,
+        "pv": user.permissionVersion or 0,  # Permission version stamp
+    }
+
+
+def get_permission_version(db: Session, user_id: int):
+    """
+    Returns the current permission version of a user, served from the per-worker
+    cache when fresh. Returns None if the user does not exist.
+    """
+    version = _permission_versions.get(user_id)
+    if version is not None:
+        return version
+
+    row = db.query(User.permissionVersion).filter(User.id == user_id).first()
+    version = (row[0] or 0) if row is not None else None
+    if version is not None:
+        _permission_versions.set(user_id, version)
+    return version
+
+
+def invalidate_principals(user_ids):
+    """Drops the cached principals and permission versions of the given users."""
+    for user_id in user_ids:
+        _principals.invalidate(user_id)
+        _permission_versions.invalidate(user_id)
+
+
+def bump_permission_version(db: Session, user_ids):
+    """
+    Invalidates the permission claims of already issued tokens and the cached
+    principals of the given users. Call it whenever a user's role, company or
+    project assignments change, or the user is deleted. The increment is part of
+    the caller's transaction; the caches are cleared now and again after commit, so
+    a concurrent request cannot re-cache the old permissions in between.
+
+    :param db: The database session of the ongoing change.
+    :param user_ids: The IDs of the affected users.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    db.query(User).filter(User.id.in_(user_ids)).update(
+        {User.permissionVersion: User.permissionVersion + 1},
+        synchronize_session=False,
+    )
+    invalidate_principals(user_ids)
+    event.listen(
+        db, "after_commit", lambda session: invalidate_principals(user_ids), once=True
+    )
+
+
+def _principal_from_claims(payload: dict, db: Session):
+    """
+    Returns a Principal built from the token claims, or None if the claims are
+    incomplete or their permission version is stale.
+    """
+    if "pv" not in payload or "role" not in payload or payload.get("projects") is None:
+        return None
+
+    user_id = int(payload["sub"])
+    current = get_permission_version(db, user_id)
+    if current is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found"
+        )
+    if payload["pv"] < current:
+        return None
+
+    return Principal(
+        id=user_id,
+        role=payload["role"],
+        companyId=payload.get("companyId"),
+        project_ids=list(payload["projects"]),
+    )
+
+
+def _cached_principal(db: Session, user_id: int):
+    """
+    Returns the principal of a user from the in-process cache, loading the user and
+    their project assignments on a miss. Returns None if the user does not exist.
+    """
+    principal = _principals.get(user_id)
+    if principal is not None:
+        return principal
+
+    row = db.query(User.role, User.companyId).filter(User.id == user_id).first()
+    if row is None:
+        return None
+    project_ids = [
+        project_id
+        for (project_id,) in db.query(User_Project.projectId).filter(
+            User_Project.userId == user_id
+        )
+    ]
+    principal = Principal(
+        id=user_id, role=row.role, companyId=row.companyId, project_ids=project_ids
+    )
+    _principals.set(user_id, principal)
+    return principal
+
+
+def load_user(db: Session, current_user):
+    """
+    Returns the full User row for the current user, loading it if the request was
+    authenticated through the claims fast path.
+    """
+    if isinstance(current_user, Principal):
+        return db.query(User).filter(User.id == current_user.id).first()
+    return current_user
+
+
 def get_current_user(
     token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
 ):
     """
     Extracts and verifies the current user from the JWT token.
 
+    In "claims" mode a Principal built from the token is returned without loading
+    the user, unless the user's permissions changed after the token was issued.
+    In "cached" mode the Principal comes from the in-process principal cache.
+
     :param token: The JWT token provided by the user in the Authorization header.
     :param db: The database session, used to retrieve user information.
-    :return: The user object if the token is valid.
+    :return: The user object (or Principal) if the token is valid.
     :raises HTTPException: If the token is expired or invalid.
     """
     try:
@@ -96,6 +270,18 @@ def get_current_user(
                 status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token"
             )
 
+        if AUTH_MODE == "claims":
+            principal = _principal_from_claims(payload, db)
+            if principal is not None:
+                return principal
+        elif AUTH_MODE == "cached":
+            principal = _cached_principal(db, user_id)
+            if principal is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found"
+                )
+            return principal
+
         user = (
             db.query(User).filter(User.id == user_id).first()
         )  # Fetch the user from the database
@@ -120,11 +306,47 @@ def get_current_user(
         )
 
 
-def refresh_access_token(refresh_token: str):
+def _resolve_user(db: Session, token: str):
+    user = get_current_user(token, db)
+    # Load the project assignments now: lazy loads outside run_sync fail in async mode
+    user.project_ids
+    return user
+
+
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme), run=Depends(async_primary_runner)
+):
+    """get_current_user for endpoints served through get_db_runner."""
+    return await run(_resolve_user, token)
+
+
+def get_current_user_with_projects(user=Depends(get_current_user)):
+    """
+    get_current_user with a user's project assignments loaded. A sync dependency,
+    so the lazy load runs in the threadpool rather than in the async endpoint.
+    """
+    if user.role == "user":
+        user.project_ids
+    return user
+
+
+# The current user dependency of the async endpoints that use get_db_runner: in async
+# mode it resolves the user on the request's primary AsyncSession (shared with the
+# endpoint unless it reads from a replica), otherwise it resolves the user in the
+# threadpool. Either way the project assignments are loaded, so reading them does
+# not query the database on the event loop
+get_runner_user = (
+    get_current_user_async if DB_MODE == "async" else get_current_user_with_projects
+)
+
+
+def refresh_access_token(refresh_token: str, db: Session = None):
     """
     Refreshes an expired access token using a valid refresh token.
 
     :param refresh_token: The refresh token provided by the user.
+    :param db: Optional database session; when given, the new access token carries
+               the user's current role, company and project claims.
     :return: A new access token and refresh token.
     :raises HTTPException: If the refresh token is invalid or expired.
     """
@@ -133,8 +355,17 @@ def refresh_access_token(refresh_token: str):
         payload = jwt.decode(refresh_token, REFRESH_SECRET_KEY, algorithms=[ALGORITHM])
         user_id = int(payload.get("sub"))  # Extract the user ID from the token
 
+        claims = {"sub": str(user_id)}
+        if db is not None:
+            user = db.query(User).filter(User.id == user_id).first()
+            if user is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found"
+                )
+            claims = build_access_claims(user)
+
         # Generate a new access token
-        new_access_token = create_access_token({"sub": str(user_id)})
+        new_access_token = create_access_token(claims)
 
         # Generate a new refresh token
         new_refresh_token = create_refresh_token({"sub": str(user_id)})
@@ -1,16 +1,34 @@
+import os
 import sys
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
+# Tests drive the email outbox worker and invite sweeper explicitly instead of
+# in the background
+os.environ.setdefault("EMAIL_WORKER_ENABLED", "false")
+os.environ.setdefault("INVITE_SWEEPER_ENABLED", "false")
+# Responses are only cached in the tests that set up a cache backend
+os.environ.setdefault("RESPONSE_CACHE_BACKEND", "none")
+
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 from database import Base
 import pytest
 
-# This engine creates a temporary in-memory DB
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+# By default this engine creates a temporary in-memory DB, shared by every thread
+# so that requests served from the threadpool see the same tables after a commit.
+# Set TEST_DATABASE_URL to run the same tests against a (scratch) Postgres database
+SQLALCHEMY_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "sqlite:///:memory:")
+if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+else:
+    engine = create_engine(SQLALCHEMY_DATABASE_URL)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 @pytest.fixture(scope="function")
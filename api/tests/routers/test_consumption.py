@@ -1,14 +1,24 @@
+import asyncio
+import time
+
+import httpx
 import pytest
 from fastapi.testclient import TestClient
 from datetime import date
+from sqlalchemy.orm import sessionmaker
 
 from app import app
-from database import Base, get_db
+from database import Base, get_db, get_session_factory
 from models import (
     Company, User, Project, User_Project,
-    ActivityType, FuelType, Unit, Consumption
+    ActivityType, FuelType, Unit, Consumption, DailyEmission
 )
+from routers import consumption as consumption_router
+from routers.consumption import build_consumption_query
+from schemas import ConsumptionFilterSchema, ConsumptionSchema
 from security import create_access_token, get_current_user
+from utils.response_cache import MemoryBackend, response_cache
+from utils.rollup import add_consumption
 
 client = TestClient(app)
 
@@ -28,8 +38,12 @@ def override_get_db(db_session):
     def _get_db_override():
         yield db_session
     app.dependency_overrides[get_db] = _get_db_override
+    # Sessions opened outside the request's, e.g. by streamed exports
+    session_factory = sessionmaker(bind=db_session.bind)
+    app.dependency_overrides[get_session_factory] = lambda: session_factory
     yield
     app.dependency_overrides.pop(get_db, None)
+    app.dependency_overrides.pop(get_session_factory, None)
     app.dependency_overrides.pop(get_current_user, None)
 
 
@@ -96,6 +110,7 @@ def seed_data(db_session):
         userId=normal_user.id
     )
     db_session.add(cons)
+    add_consumption(db_session, cons)
     db_session.commit()
 
     return {
@@ -127,6 +142,78 @@ def test_list_consumptions_by_role(seed_data, role, expected_count):
     assert len(r.json()) == expected_count
 
 
+def test_list_consumptions_matches_schema(seed_data):
+    user = seed_data["admin"]
+    override_current_user(user)
+
+    r = client.get("/consumption/", headers=auth_header_for(user))
+    assert r.status_code == 200
+    record = r.json()[0]
+    assert list(record) == list(ConsumptionSchema.model_fields)
+    assert ConsumptionSchema(**record).model_dump(mode="json") == record
+    assert record["project"] == seed_data["project"].name
+    assert record["startDate"] == seed_data["consumption"].startDate.isoformat()
+
+
+def test_list_consumptions_columnar(db_session, seed_data):
+    db_session.add(Consumption(
+        projectId=seed_data["project"].id, amount=7, startDate=date(2023, 2, 1),
+        endDate=date(2023, 2, 1), reportDate=date(2023, 2, 1),
+        activityTypeId=seed_data["activity"].id, fuelTypeId=seed_data["fuel"].id,
+        unitId=seed_data["unit"].id, userId=seed_data["admin"].id,
+    ))
+    db_session.commit()
+
+    user = seed_data["admin"]
+    override_current_user(user)
+    headers = {**auth_header_for(user), "Accept": "application/vnd.columnar+json"}
+    r = client.get("/consumption/?sort=amount", headers=headers)
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/vnd.columnar+json")
+    assert r.headers["vary"] == "Accept"
+
+    body = r.json()
+    assert body["length"] == 2
+    assert list(body["columns"]) == list(ConsumptionSchema.model_fields)
+    assert body["columns"]["amount"] == [7, seed_data["consumption"].amount]
+    assert body["dictionaries"]["project"] == ["ProjectX"]
+    assert body["columns"]["project"] == [0, 0]
+    assert "amount" not in body["dictionaries"]
+
+    # Row objects stay the default
+    r = client.get("/consumption/", headers=auth_header_for(user))
+    assert isinstance(r.json(), list)
+
+
+def test_list_consumptions_coalesces_identical_requests(monkeypatch, seed_data):
+    calls = []
+    list_consumptions = consumption_router.list_consumptions
+
+    def slow_list(*args):
+        calls.append(args[1].role)
+        time.sleep(0.1)
+        return list_consumptions(*args)
+
+    monkeypatch.setattr(consumption_router, "list_consumptions", slow_list)
+    user = seed_data["admin"]
+    override_current_user(user)
+
+    async def fetch_all():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            return await asyncio.gather(
+                c.get("/consumption/", params={"projectId": [2, 1]}),
+                c.get("/consumption/", params={"projectId": [1, 2]}),
+                c.get("/consumption/", params={"sort": "amount"}),
+            )
+
+    first, second, other = asyncio.run(fetch_all())
+    assert first.status_code == second.status_code == other.status_code == 200
+    assert first.content == second.content
+    # The two identical lists ran one query; the other sort ran its own
+    assert calls == ["admin", "admin"]
+
+
 def test_get_consumption_found(seed_data):
     user = seed_data["normal_user"]
     override_current_user(user)
@@ -279,6 +366,12 @@ def test_delete_consumption_success(seed_data):
     assert r.status_code == 200
     assert r.json()["message"] == "Consumption entry deleted"
 
+    # The entry is gone for every read but stays as a tombstone
+    assert client.get(f"/consumption/{cid}", headers=auth_header_for(user)).status_code == 404
+    assert client.get("/consumption/", headers=auth_header_for(user)).json() == []
+    assert client.delete(f"/consumption/{cid}", headers=auth_header_for(user)).status_code == 404
+    assert seed_data["consumption"].deletedAt is not None
+
 
 def test_delete_consumption_not_found(seed_data):
     user = seed_data["admin"]
@@ -296,3 +389,1017 @@ def test_delete_consumption_forbidden(seed_data):
     r = client.delete(f"/consumption/{cid}", headers=auth_header_for(user))
     # comp_admin is allowed on same-company, so still 200
     assert r.status_code == 200
+
+
+def _add_consumptions(db_session, seed_data, report_dates):
+    entries = [
+        Consumption(
+            projectId=seed_data["project"].id,
+            amount=float(i),
+            startDate=date(2023, 1, 1),
+            endDate=date(2023, 1, 2),
+            reportDate=report_date,
+            description=f"Entry {i}",
+            activityTypeId=seed_data["activity"].id,
+            fuelTypeId=seed_data["fuel"].id,
+            unitId=seed_data["unit"].id,
+            userId=seed_data["normal_user"].id,
+        )
+        for i, report_date in enumerate(report_dates)
+    ]
+    db_session.add_all(entries)
+    db_session.commit()
+    return entries
+
+
+def test_list_consumptions_keyset_pagination(db_session, seed_data):
+    user = seed_data["admin"]
+    override_current_user(user)
+    _add_consumptions(
+        db_session,
+        seed_data,
+        [date(2023, 2, 1), date(2023, 2, 1), date(2023, 3, 1), date(2022, 12, 1)],
+    )
+
+    seen = []
+    pages = 0
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        r = client.get("/consumption/", params=params, headers=auth_header_for(user))
+        assert r.status_code == 200
+        assert len(r.json()) <= 2
+        seen.extend(r.json())
+        pages += 1
+        cursor = r.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert pages == 3
+    assert len({c["id"] for c in seen}) == 5
+    keys = [(c["reportDate"], c["id"]) for c in seen]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_list_consumptions_invalid_cursor(seed_data):
+    user = seed_data["admin"]
+    override_current_user(user)
+
+    r = client.get(
+        "/consumption/",
+        params={"limit": 2, "cursor": "not-a-cursor"},
+        headers=auth_header_for(user),
+    )
+    assert r.status_code == 400
+
+    # Well-formed JSON that encode_cursor would never produce
+    import base64
+    import json
+
+    for sort, raw in (
+        ("amount", ["amount", {"a": 1}, [1]]),
+        ("amount", ["amount", 1.5, [1]]),
+        ("amount", ["amount", 1.5, True]),
+        ("amount", ["amount", "abc", 1]),
+        ("reportDate", ["reportDate", 5, 1]),
+        ("project", ["project", {"a": 1}, 1]),
+    ):
+        cursor = base64.urlsafe_b64encode(json.dumps(raw).encode()).decode()
+        r = client.get(
+            "/consumption/",
+            params={"limit": 2, "sort": sort, "cursor": cursor},
+            headers=auth_header_for(user),
+        )
+        assert r.status_code == 400, raw
+
+    watermark = base64.urlsafe_b64encode(
+        json.dumps(["changes", {"a": 1}, [1]]).encode()
+    ).decode()
+    r = client.get(
+        "/consumption/changes", params={"since": watermark}, headers=auth_header_for(user)
+    )
+    assert r.status_code == 400
+
+
+def test_list_consumptions_filters(db_session, seed_data):
+    user = seed_data["admin"]
+    override_current_user(user)
+    _add_consumptions(db_session, seed_data, [date(2023, 2, 1)] * 4)
+
+    r = client.get(
+        "/consumption/",
+        params={"minAmount": 1, "maxAmount": 2},
+        headers=auth_header_for(user),
+    )
+    assert r.status_code == 200
+    assert sorted(c["amount"] for c in r.json()) == [1.0, 2.0]
+
+    r = client.get(
+        "/consumption/",
+        params={"dateFrom": "2023-01-03", "projectId": seed_data["project"].id},
+        headers=auth_header_for(user),
+    )
+    assert r.status_code == 200
+    assert [c["id"] for c in r.json()] == [seed_data["consumption"].id]
+
+    r = client.get(
+        "/consumption/",
+        params={"fuelTypeId": 9999},
+        headers=auth_header_for(user),
+    )
+    assert r.status_code == 200
+    assert r.json() == []
+
+
+def test_list_consumptions_search(seed_data):
+    user = seed_data["comp_admin"]
+    override_current_user(user)
+
+    r = client.get("/consumption/", params={"q": "projectx norm"}, headers=auth_header_for(user))
+    assert r.status_code == 200
+    assert len(r.json()) == 1
+
+    r = client.get("/consumption/", params={"q": "nomatch"}, headers=auth_header_for(user))
+    assert r.status_code == 200
+    assert r.json() == []
+
+    # LIKE wildcards typed by the user match only themselves
+    for q in ("_", "%", "project_", "\\"):
+        r = client.get("/consumption/", params={"q": q}, headers=auth_header_for(user))
+        assert r.status_code == 200
+        assert r.json() == [], q
+
+
+def test_list_consumptions_sorted_pages(db_session, seed_data):
+    user = seed_data["admin"]
+    override_current_user(user)
+    _add_consumptions(db_session, seed_data, [date(2023, 2, 1)] * 4)
+
+    r1 = client.get(
+        "/consumption/", params={"sort": "amount", "limit": 3}, headers=auth_header_for(user)
+    )
+    assert r1.status_code == 200
+    r2 = client.get(
+        "/consumption/",
+        params={"sort": "amount", "limit": 3, "cursor": r1.headers["X-Next-Cursor"]},
+        headers=auth_header_for(user),
+    )
+    assert r2.status_code == 200
+    assert "X-Next-Cursor" not in r2.headers
+
+    amounts = [c["amount"] for c in r1.json() + r2.json()]
+    assert amounts == [0.0, 1.0, 2.0, 3.0, 10.5]
+
+    # A cursor is only valid for the sort order it was issued for
+    r3 = client.get(
+        "/consumption/",
+        params={"sort": "-amount", "limit": 3, "cursor": r1.headers["X-Next-Cursor"]},
+        headers=auth_header_for(user),
+    )
+    assert r3.status_code == 400
+
+
+def test_async_endpoints_query_nothing_on_the_event_loop(db_session, seed_data):
+    from sqlalchemy import event
+
+    user = seed_data["normal_user"]
+    override_current_user(user)
+    headers = auth_header_for(user)
+    project_id = seed_data["project"].id
+    # The user's project assignments have to be loaded again
+    db_session.expire_all()
+    on_loop = []
+
+    def record(conn, cursor, statement, *args):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        on_loop.append(statement)
+
+    event.listen(db_session.bind, "before_cursor_execute", record)
+    try:
+        assert client.get("/consumption/", headers=headers).status_code == 200
+        r = client.get(
+            "/consumption/timeseries", params={"projectId": project_id}, headers=headers
+        )
+        assert r.status_code == 200
+    finally:
+        event.remove(db_session.bind, "before_cursor_execute", record)
+    assert on_loop == []
+
+
+def test_list_consumptions_invalid_sort(seed_data):
+    user = seed_data["admin"]
+    override_current_user(user)
+
+    r = client.get("/consumption/", params={"sort": "passwordhash"}, headers=auth_header_for(user))
+    assert r.status_code == 400
+
+
+def test_list_consumptions_sparse_fields(db_session, seed_data):
+    user = seed_data["normal_user"]
+    override_current_user(user)
+
+    r = client.get(
+        "/consumption/", params={"fields": "amount,id"}, headers=auth_header_for(user)
+    )
+    assert r.status_code == 200
+    assert r.json() == [
+        {"id": seed_data["consumption"].id, "amount": seed_data["consumption"].amount}
+    ]
+
+    r = client.get(
+        "/consumption/", params={"fields": "id,passwordhash"}, headers=auth_header_for(user)
+    )
+    assert r.status_code == 400
+
+    # Only the tables the fields, filters and sort refer to are joined
+    sql = str(build_consumption_query(
+        db_session, user, ConsumptionFilterSchema(), ("id", "amount")
+    ))
+    assert "JOIN" not in sql
+    sql = str(build_consumption_query(
+        db_session, user, ConsumptionFilterSchema(), ("id", "company"), "-fuelType"
+    ))
+    assert "JOIN \"Company\"" in sql and "JOIN \"FuelType\"" in sql
+    assert "JOIN \"User\"" not in sql and "JOIN \"Unit\"" not in sql
+
+
+def test_list_consumptions_same_rows_with_and_without_fields(db_session, seed_data):
+    admin = seed_data["admin"]
+    override_current_user(admin)
+    headers = auth_header_for(admin)
+    db_session.add(Consumption(
+        projectId=seed_data["project"].id, amount=1, startDate=date(2023, 1, 1),
+        endDate=date(2023, 1, 1), reportDate=date(2023, 1, 1),
+        activityTypeId=None, fuelTypeId=seed_data["fuel"].id, unitId=None, userId=None,
+    ))
+    db_session.commit()
+
+    full = client.get("/consumption/", params={"sort": "amount"}, headers=headers).json()
+    sparse = client.get(
+        "/consumption/", params={"sort": "amount", "fields": "id,amount"}, headers=headers
+    ).json()
+    assert len(full) == 2
+    assert [row["id"] for row in full] == [row["id"] for row in sparse]
+    assert full[0]["activityType"] is None and full[0]["unit"] is None
+
+
+def test_timeseries_for_project(seed_data):
+    user = seed_data["normal_user"]
+    override_current_user(user)
+
+    r = client.get(
+        "/consumption/timeseries",
+        params={"projectId": seed_data["project"].id, "bucket": "day"},
+        headers=auth_header_for(user),
+    )
+    assert r.status_code == 200, r.text
+    data = r.json()
+    assert data["dates"] == ["2023-01-02", "2023-01-03"]
+    assert data["fuelTypes"] == {"Fuel": [5.25, 10.5]}
+    assert data["totalCO2"] == [5.775, 11.55]
+
+
+def test_timeseries_for_company_with_range(seed_data):
+    user = seed_data["comp_admin"]
+    override_current_user(user)
+
+    r = client.get(
+        "/consumption/timeseries",
+        params={
+            "companyId": seed_data["company"].id,
+            "bucket": "month",
+            "dateFrom": "2023-01-03",
+            "dateTo": "2023-02-15",
+        },
+        headers=auth_header_for(user),
+    )
+    assert r.status_code == 200, r.text
+    data = r.json()
+    assert data["dates"] == ["2023-01-01", "2023-02-01"]
+    assert data["fuelTypes"] == {"Fuel": [5.25, 5.25]}
+
+
+def test_timeseries_access_and_validation(seed_data):
+    user = seed_data["normal_user"]
+    override_current_user(user)
+
+    r = client.get(
+        "/consumption/timeseries",
+        params={"companyId": seed_data["company"].id},
+        headers=auth_header_for(user),
+    )
+    assert r.status_code == 403
+
+    r = client.get("/consumption/timeseries", headers=auth_header_for(user))
+    assert r.status_code == 400
+
+    r = client.get(
+        "/consumption/timeseries",
+        params={"projectId": seed_data["project"].id, "bucket": "year"},
+        headers=auth_header_for(user),
+    )
+    assert r.status_code == 400
+
+
+def test_timeseries_follows_writes(seed_data):
+    user = seed_data["admin"]
+    override_current_user(user)
+    params = {"projectId": seed_data["project"].id, "bucket": "month"}
+
+    payload = {
+        "projectId": seed_data["project"].id,
+        "amount": 3.0,
+        "startDate": "2023-01-01",
+        "endDate": "2023-01-03",
+        "reportDate": "2023-01-04",
+        "description": "Rollup",
+        "activityTypeId": seed_data["activity"].id,
+        "fuelTypeId": seed_data["fuel"].id,
+        "unitId": seed_data["unit"].id,
+        "userId": user.id,
+    }
+    r = client.post("/consumption/", json=payload, headers=auth_header_for(user))
+    assert r.status_code == 200
+    listed = client.get(
+        "/consumption/",
+        params={"minAmount": 3, "maxAmount": 3},
+        headers=auth_header_for(user),
+    )
+    new_id = listed.json()[0]["id"]
+    series = client.get(
+        "/consumption/timeseries", params=params, headers=auth_header_for(user)
+    ).json()
+    assert series["fuelTypes"] == {"Fuel": [13.5]}
+
+    payload["amount"] = 6.0
+    r = client.put(f"/consumption/{new_id}", json=payload, headers=auth_header_for(user))
+    assert r.status_code == 200
+    series = client.get(
+        "/consumption/timeseries", params=params, headers=auth_header_for(user)
+    ).json()
+    assert series["fuelTypes"] == {"Fuel": [16.5]}
+
+    r = client.delete(f"/consumption/{new_id}", headers=auth_header_for(user))
+    assert r.status_code == 200
+    series = client.get(
+        "/consumption/timeseries", params=params, headers=auth_header_for(user)
+    ).json()
+    assert series["fuelTypes"] == {"Fuel": [10.5]}
+    assert series["totalCO2"] == [11.55]
+
+
+def test_emission_rows_postgres_date_trunc(db_session, seed_data):
+    if db_session.get_bind().dialect.name != "postgresql":
+        pytest.skip("date_trunc buckets are only used on Postgres")
+    admin = seed_data["admin"]
+    fuel = seed_data["fuel"]
+    project_id = seed_data["project"].id
+
+    # The entry's two days (Monday and Tuesday) fall in one week
+    rows = consumption_router.emission_rows(
+        db_session, admin, project_id, None, None, None, "week"
+    )
+    assert [tuple(row[:3]) for row in rows] == [(date(2023, 1, 2), fuel.id, "Fuel")]
+    assert rows[0][3] == pytest.approx(10.5)
+    assert rows[0][4] == pytest.approx(10.5 * 1.1)
+
+    # A bucket starting before dateFrom is dated at dateFrom
+    rows = consumption_router.emission_rows(
+        db_session, admin, project_id, None, date(2023, 1, 3), None, "month"
+    )
+    assert [row[0] for row in rows] == [date(2023, 1, 3)]
+    assert rows[0][3] == pytest.approx(5.25)
+
+
+def test_timeseries_cache_invalidated_by_writes(monkeypatch, seed_data):
+    monkeypatch.setattr(response_cache, "backend", MemoryBackend())
+    queries = []
+    emission_rows = consumption_router.emission_rows
+
+    def counted_emission_rows(*args):
+        queries.append(args[2:4])
+        return emission_rows(*args)
+
+    monkeypatch.setattr(consumption_router, "emission_rows", counted_emission_rows)
+    user = seed_data["admin"]
+    override_current_user(user)
+    headers = auth_header_for(user)
+    by_project = {"projectId": seed_data["project"].id, "bucket": "month"}
+    by_company = {"companyId": seed_data["company"].id, "bucket": "month"}
+
+    for _ in range(2):
+        series = client.get("/consumption/timeseries", params=by_project, headers=headers)
+        assert series.json()["fuelTypes"] == {"Fuel": [10.5]}
+        client.get("/consumption/timeseries", params=by_company, headers=headers)
+    # The repeated requests were answered from the cache
+    assert len(queries) == 2
+
+    payload = {
+        "projectId": seed_data["project"].id,
+        "amount": 3.0,
+        "startDate": "2023-01-01",
+        "endDate": "2023-01-03",
+        "reportDate": "2023-01-04",
+        "description": "Cached",
+        "activityTypeId": seed_data["activity"].id,
+        "fuelTypeId": seed_data["fuel"].id,
+        "unitId": seed_data["unit"].id,
+        "userId": user.id,
+    }
+    assert client.post("/consumption/", json=payload, headers=headers).status_code == 200
+
+    # The write invalidated both the project's and the company's series
+    for params in (by_project, by_company):
+        series = client.get("/consumption/timeseries", params=params, headers=headers)
+        assert series.json()["fuelTypes"] == {"Fuel": [13.5]}
+    assert len(queries) == 4
+
+
+def test_timeseries_stale_entry_refreshed_in_background(monkeypatch, db_session, seed_data):
+    monkeypatch.setattr(response_cache, "backend", MemoryBackend())
+    # Cached entries are stale at once, but stay within the stale window
+    monkeypatch.setattr(response_cache, "ttl", 0)
+    refresh_factory = sessionmaker(bind=db_session.bind)
+    app.dependency_overrides[get_session_factory] = lambda: refresh_factory
+    user = seed_data["admin"]
+    override_current_user(user)
+    headers = auth_header_for(user)
+    params = {"projectId": seed_data["project"].id, "bucket": "month"}
+
+    def fuel_series(c):
+        r = c.get("/consumption/timeseries", params=params, headers=headers)
+        return r.json()["fuelTypes"]["Fuel"]
+
+    try:
+        with TestClient(app) as c:
+            assert fuel_series(c) == [10.5]
+
+            # A change the cache is not told about is picked up by the refresh
+            db_session.query(DailyEmission).update(
+                {DailyEmission.amount: DailyEmission.amount * 2}
+            )
+            db_session.commit()
+            assert fuel_series(c) == [10.5]
+            for _ in range(100):
+                if not response_cache._tasks:
+                    break
+                time.sleep(0.01)
+            assert fuel_series(c) == [21.0]
+    finally:
+        app.dependency_overrides.pop(get_session_factory, None)
+
+
+def test_import_consumptions_csv(db_session, seed_data):
+    from models import DailyEmission
+    from sqlalchemy import func
+
+    user = seed_data["normal_user"]
+    override_current_user(user)
+    other = Project(name="Elsewhere", startDate=date(2023, 1, 1), companyId=seed_data["company"].id)
+    db_session.add(other)
+    db_session.commit()
+
+    body = "\n".join([
+        "project,activityType,fuelType,unit,amount,startDate,endDate,reportDate,description",
+        "ProjectX,Activity,Fuel,Unit,10,2023-02-01,2023-02-10,2023-02-11,Meter A",
+        "projectx,activity,FUEL,unit,5,2023-02-01,2023-02-01,,",
+        "Elsewhere,Activity,Fuel,Unit,1,2023-02-01,2023-02-01,2023-02-02,",
+        "ProjectX,Activity,Coal,Unit,1,2023-02-01,2023-02-01,2023-02-02,",
+        "ProjectX,Activity,Fuel,Unit,abc,2023-02-01,2023-02-01,2023-02-02,",
+        "ProjectX,Activity,Fuel,Unit,1,2023-02-05,2023-02-01,2023-02-02,",
+        "ProjectX,Activity,Fuel,Unit,1",
+    ]) + "\n"
+    r = client.post(
+        "/consumption/import", content=body,
+        headers={**auth_header_for(user), "Content-Type": "text/csv"},
+    )
+    assert r.status_code == 200, r.text
+    report = r.json()
+    assert report["inserted"] == 2
+    assert report["failed"] == 5
+    assert [(e["line"], e["detail"]) for e in report["errors"]] == [
+        (4, "Unknown project 'Elsewhere'"),
+        (5, "Unknown fuelType 'Coal'"),
+        (6, "Invalid amount"),
+        (7, "endDate is before startDate"),
+        (8, "Expected 9 columns, got 5"),
+    ]
+
+    imported = (
+        db_session.query(Consumption)
+        .filter(Consumption.startDate >= date(2023, 2, 1))
+        .order_by(Consumption.amount)
+        .all()
+    )
+    assert [c.amount for c in imported] == [5.0, 10.0]
+    assert imported[0].updatedAt is not None
+    assert imported[0].reportDate == date.today()
+    assert imported[1].description == "Meter A"
+    assert {c.userId for c in imported} == {user.id}
+
+    # The rollup covers the imported entries
+    february = (
+        db_session.query(func.sum(DailyEmission.amount))
+        .filter(DailyEmission.date >= date(2023, 2, 1))
+        .scalar()
+    )
+    assert february == pytest.approx(15.0)
+
+
+def test_import_consumptions_csv_multiline_field(db_session, seed_data):
+    admin = seed_data["admin"]
+    override_current_user(admin)
+    body = (
+        "project,activityType,fuelType,unit,amount,startDate,endDate,description\r\n"
+        'ProjectX,Activity,Fuel,Unit,7,2023-05-01,2023-05-02,"first line\r\nsecond line"\r\n'
+        "ProjectX,Activity,Fuel,Unit,abc,2023-05-01,2023-05-02,\r\n"
+    )
+    r = client.post(
+        "/consumption/import", content=body,
+        headers={**auth_header_for(admin), "Content-Type": "text/csv"},
+    )
+    assert r.status_code == 200, r.text
+    assert r.json()["inserted"] == 1
+    # Errors point at the line a record starts on, counting the quoted line break
+    assert r.json()["errors"] == [{"line": 4, "detail": "Invalid amount"}]
+    imported = db_session.query(Consumption).filter(Consumption.amount == 7).one()
+    assert imported.description == "first line\r\nsecond line"
+
+
+def test_import_consumptions_ndjson_by_id(db_session, seed_data):
+    admin = seed_data["admin"]
+    override_current_user(admin)
+    ids = {
+        "projectId": seed_data["project"].id,
+        "activityTypeId": seed_data["activity"].id,
+        "fuelTypeId": seed_data["fuel"].id,
+        "unitId": seed_data["unit"].id,
+    }
+    body = "\n".join([
+        '{"amount": 3, "startDate": "2023-03-01", "endDate": "2023-03-03", %s}'
+        % ", ".join(f'"{k}": {v}' for k, v in ids.items()),
+        "not json",
+        '{"amount": 3, "startDate": "2023-03-01", "endDate": "2023-03-03", "projectId": 999}',
+    ])
+    r = client.post(
+        "/consumption/import", content=body,
+        headers={**auth_header_for(admin), "Content-Type": "application/x-ndjson"},
+    )
+    assert r.status_code == 200, r.text
+    report = r.json()
+    assert report["inserted"] == 1
+    assert report["errors"] == [
+        {"line": 2, "detail": "Invalid JSON"},
+        {"line": 3, "detail": "Unknown projectId 999"},
+    ]
+
+
+def test_import_consumptions_received_before_writing(db_session, seed_data):
+    admin = seed_data["admin"]
+    override_current_user(admin)
+    headers = {**auth_header_for(admin), "Content-Type": "application/x-ndjson"}
+    line = '{"amount": 2, "startDate": "2023-03-01", "endDate": "2023-03-01", "projectId": %d, "activityTypeId": %d, "fuelTypeId": %d, "unitId": %d}\n' % (
+        seed_data["project"].id, seed_data["activity"].id,
+        seed_data["fuel"].id, seed_data["unit"].id,
+    )
+    db_session.commit()
+    open_while_receiving = []
+
+    def upload():
+        for _ in range(3):
+            yield line.encode()
+            open_while_receiving.append(db_session.in_transaction())
+
+    r = client.post("/consumption/import", content=upload(), headers=headers)
+    assert r.status_code == 200, r.text
+    assert r.json()["inserted"] == 3
+    # No transaction was open while the client was still sending
+    assert open_while_receiving == [False, False, False]
+
+
+def test_import_consumptions_unsupported_type(seed_data):
+    admin = seed_data["admin"]
+    override_current_user(admin)
+    r = client.post(
+        "/consumption/import", content="{}",
+        headers={**auth_header_for(admin), "Content-Type": "application/json"},
+    )
+    assert r.status_code == 415
+
+
+def test_export_consumptions_csv_respects_scope(db_session, seed_data):
+    import csv as csv_module
+    import io
+
+    other = Project(name="Hidden", startDate=date(2023, 1, 1), companyId=seed_data["company"].id)
+    db_session.add(other)
+    db_session.flush()
+    db_session.add(Consumption(
+        projectId=other.id, amount=99, startDate=date(2023, 1, 1),
+        endDate=date(2023, 1, 1), reportDate=date(2023, 1, 1),
+        activityTypeId=seed_data["activity"].id, fuelTypeId=seed_data["fuel"].id,
+        unitId=seed_data["unit"].id, userId=seed_data["admin"].id,
+    ))
+    db_session.commit()
+
+    user = seed_data["normal_user"]
+    override_current_user(user)
+    r = client.get("/consumption/export", headers=auth_header_for(user))
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/csv")
+    assert "consumption-export.csv" in r.headers["content-disposition"]
+
+    rows = list(csv_module.DictReader(io.StringIO(r.text)))
+    assert len(rows) == 1
+    assert rows[0]["project"] == "ProjectX"
+    assert rows[0]["startDate"] == "2023-01-02"
+    assert rows[0]["amount"] == "10.5"
+
+    admin = seed_data["admin"]
+    override_current_user(admin)
+    r = client.get("/consumption/export?sort=amount", headers=auth_header_for(admin))
+    amounts = [row["amount"] for row in csv_module.DictReader(io.StringIO(r.text))]
+    assert amounts == ["10.5", "99.0"]
+
+
+def test_export_consumptions_ndjson_gzip(seed_data):
+    import gzip
+    import json
+
+    admin = seed_data["admin"]
+    override_current_user(admin)
+    r = client.get(
+        "/consumption/export?format=ndjson&gzip=true", headers=auth_header_for(admin)
+    )
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/gzip"
+    assert "consumption-export.ndjson.gz" in r.headers["content-disposition"]
+
+    lines = gzip.decompress(r.content).decode().splitlines()
+    assert [json.loads(line)["reportDate"] for line in lines] == ["2023-01-04"]
+
+    r = client.get("/consumption/export?format=xml", headers=auth_header_for(admin))
+    assert r.status_code == 400
+
+
+def test_export_consumptions_columnar_negotiated(seed_data):
+    import json
+
+    admin = seed_data["admin"]
+    override_current_user(admin)
+    headers = {**auth_header_for(admin), "Accept": "application/vnd.columnar+json"}
+    r = client.get("/consumption/export", headers=headers)
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/vnd.columnar+json")
+    assert "consumption-export.columnar.ndjson" in r.headers["content-disposition"]
+
+    batches = [json.loads(line) for line in r.text.splitlines()]
+    assert len(batches) == 1
+    assert batches[0]["length"] == 1
+    assert batches[0]["dictionaries"]["fuelType"] == [seed_data["fuel"].name]
+
+    # An explicit format wins over the Accept header
+    r = client.get("/consumption/export?format=csv", headers=headers)
+    assert r.headers["content-type"].startswith("text/csv")
+
+    headers["Accept"] = "application/x-ndjson"
+    r = client.get("/consumption/export", headers=headers)
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+
+
+def test_export_consumptions_closes_its_session(db_session, seed_data):
+    from sqlalchemy.orm import Session
+
+    sessions = []
+
+    class TrackedSession(Session):
+        closed = False
+
+        def close(self):
+            self.closed = True
+            super().close()
+
+    def factory():
+        sessions.append(TrackedSession(bind=db_session.bind))
+        return sessions[-1]
+
+    app.dependency_overrides[get_session_factory] = lambda: factory
+    admin = seed_data["admin"]
+    override_current_user(admin)
+    r = client.get("/consumption/export", headers=auth_header_for(admin))
+    assert r.status_code == 200
+    assert "ProjectX" in r.text
+    # The rows were read through a session of the export's own, closed once sent
+    assert len(sessions) == 1
+    assert sessions[0].closed
+
+
+def test_consumption_changes_sync(monkeypatch, seed_data):
+    from utils import sync
+
+    monkeypatch.setattr(sync, "CHANGES_SETTLE_SECONDS", 0)
+    admin = seed_data["admin"]
+    override_current_user(admin)
+    headers = auth_header_for(admin)
+    payload = {
+        "projectId": seed_data["project"].id,
+        "amount": 3,
+        "startDate": "2023-03-01",
+        "endDate": "2023-03-02",
+        "reportDate": "2023-03-03",
+        "description": "",
+        "activityTypeId": seed_data["activity"].id,
+        "fuelTypeId": seed_data["fuel"].id,
+        "unitId": seed_data["unit"].id,
+        "userId": admin.id,
+    }
+    assert client.post("/consumption/", json=payload, headers=headers).status_code == 200
+    existing = seed_data["consumption"].id
+    created = next(
+        c["id"] for c in client.get("/consumption/", headers=headers).json()
+        if c["id"] != existing
+    )
+
+    # Initial sync in pages of one
+    r = client.get("/consumption/changes", params={"limit": 1}, headers=headers)
+    assert r.status_code == 200
+    page = r.json()
+    assert [c["id"] for c in page["changes"]] == [existing]
+    assert page["hasMore"] is True
+    assert "updatedAt" in page["changes"][0]
+    page = client.get(
+        "/consumption/changes", params={"since": page["watermark"]}, headers=headers
+    ).json()
+    assert [c["id"] for c in page["changes"]] == [created]
+    assert page["hasMore"] is False
+    watermark = page["watermark"]
+
+    # Nothing new since the watermark
+    page = client.get("/consumption/changes", params={"since": watermark}, headers=headers).json()
+    assert page == {"changes": [], "deleted": [], "watermark": watermark, "hasMore": False}
+
+    # An edit and a delete after the watermark
+    client.put(f"/consumption/{created}", json={**payload, "amount": 4}, headers=headers)
+    client.delete(f"/consumption/{existing}", headers=headers)
+    page = client.get("/consumption/changes", params={"since": watermark}, headers=headers).json()
+    assert [(c["id"], c["amount"]) for c in page["changes"]] == [(created, 4)]
+    assert page["deleted"] == [existing]
+
+    # Deleted entries are not part of an initial sync
+    page = client.get("/consumption/changes", headers=headers).json()
+    assert [c["id"] for c in page["changes"]] == [created]
+    assert page["deleted"] == []
+
+
+def test_consumption_changes_settle_and_invalid_watermark(monkeypatch, seed_data):
+    from utils import sync
+
+    admin = seed_data["admin"]
+    override_current_user(admin)
+    monkeypatch.setattr(sync, "CHANGES_SETTLE_SECONDS", 3600)
+    r = client.get("/consumption/changes", headers=auth_header_for(admin))
+    assert r.json()["changes"] == []
+    assert r.json()["watermark"] is None
+
+    r = client.get(
+        "/consumption/changes", params={"since": "bogus"}, headers=auth_header_for(admin)
+    )
+    assert r.status_code == 400
+
+
+def test_consumption_changes_include_import_committed_later(
+    monkeypatch, db_session, seed_data
+):
+    from utils import sync
+    from utils.consumption_import import ConsumptionImporter
+
+    # The import below stays open for longer than the settle window
+    monkeypatch.setattr(sync, "CHANGES_SETTLE_SECONDS", 0)
+    admin = seed_data["admin"]
+    override_current_user(admin)
+    headers = auth_header_for(admin)
+    ids = {
+        "projectId": seed_data["project"].id,
+        "activityTypeId": seed_data["activity"].id,
+        "fuelTypeId": seed_data["fuel"].id,
+        "unitId": seed_data["unit"].id,
+    }
+    import_db = sessionmaker(bind=db_session.bind)()
+    importer = ConsumptionImporter(import_db, admin, "ndjson")
+
+    # Another write commits and is synced while the import is open
+    payload = {
+        **ids, "amount": 3, "startDate": "2023-03-01", "endDate": "2023-03-02",
+        "reportDate": "2023-03-03", "description": "", "userId": admin.id,
+    }
+    assert client.post("/consumption/", json=payload, headers=headers).status_code == 200
+    watermark = client.get("/consumption/changes", headers=headers).json()["watermark"]
+
+    importer.feed([
+        b'{"amount": 4, "startDate": "2023-04-01", "endDate": "2023-04-01", %s}'
+        % ", ".join(f'"{k}": {v}' for k, v in ids.items()).encode()
+    ])
+    assert importer.finish()["inserted"] == 1
+    import_db.close()
+
+    r = client.get("/consumption/changes", params={"since": watermark}, headers=headers)
+    assert [c["amount"] for c in r.json()["changes"]] == [4.0]
+
+
+def test_user_can_edit_and_delete_own_entry(seed_data):
+    user = seed_data["normal_user"]
+    override_current_user(user)
+    cid = seed_data["consumption"].id
+    payload = {
+        "projectId": seed_data["project"].id,
+        "amount": 1.0,
+        "startDate": "2023-01-02",
+        "endDate": "2023-01-03",
+        "reportDate": "2023-01-04",
+        "description": "Mine",
+        "activityTypeId": seed_data["activity"].id,
+        "fuelTypeId": seed_data["fuel"].id,
+        "unitId": seed_data["unit"].id,
+        "userId": user.id,
+    }
+    r = client.put(f"/consumption/{cid}", json=payload, headers=auth_header_for(user))
+    assert r.status_code == 200
+    r = client.delete(f"/consumption/{cid}", headers=auth_header_for(user))
+    assert r.status_code == 200
+
+
+def test_user_cannot_move_entry_to_foreign_project(db_session, seed_data):
+    user = seed_data["normal_user"]
+    override_current_user(user)
+    other_company = Company(name="OtherCo")
+    db_session.add(other_company)
+    db_session.flush()
+    foreign = Project(name="Foreign", startDate=date(2023, 1, 1), companyId=other_company.id)
+    db_session.add(foreign)
+    db_session.commit()
+
+    cid = seed_data["consumption"].id
+    payload = {
+        "projectId": foreign.id,
+        "amount": 1.0,
+        "startDate": "2023-01-02",
+        "endDate": "2023-01-03",
+        "reportDate": "2023-01-04",
+        "description": "Moved",
+        "activityTypeId": seed_data["activity"].id,
+        "fuelTypeId": seed_data["fuel"].id,
+        "unitId": seed_data["unit"].id,
+        "userId": user.id,
+    }
+    r = client.put(f"/consumption/{cid}", json=payload, headers=auth_header_for(user))
+    assert r.status_code == 403
+    db_session.refresh(seed_data["consumption"])
+    assert seed_data["consumption"].projectId == seed_data["project"].id
+
+    payload["projectId"] = 9999
+    r = client.put(f"/consumption/{cid}", json=payload, headers=auth_header_for(user))
+    assert r.status_code == 404
+
+
+def test_update_keeps_the_reporter(db_session, seed_data):
+    admin = seed_data["admin"]
+    override_current_user(admin)
+    entry = seed_data["consumption"]
+    reporter = entry.userId
+    payload = {
+        "projectId": seed_data["project"].id,
+        "amount": 2.0,
+        "startDate": "2023-01-02",
+        "endDate": "2023-01-03",
+        "reportDate": "2023-01-04",
+        "description": "Edited",
+        "activityTypeId": seed_data["activity"].id,
+        "fuelTypeId": seed_data["fuel"].id,
+        "unitId": seed_data["unit"].id,
+        "userId": admin.id,
+    }
+    r = client.put(f"/consumption/{entry.id}", json=payload, headers=auth_header_for(admin))
+    assert r.status_code == 200
+    r = client.post(
+        "/consumption/batch",
+        json={"operations": [{"op": "update", "id": entry.id, "data": payload}]},
+        headers=auth_header_for(admin),
+    )
+    assert r.json()["updated"] == 1
+    db_session.refresh(entry)
+    assert entry.userId == reporter
+    assert entry.description == "Edited"
+
+
+def test_batch_consumptions(db_session, seed_data):
+    from models import DailyEmission
+
+    user = seed_data["normal_user"]
+    override_current_user(user)
+    other = Project(name="Elsewhere", startDate=date(2023, 1, 1), companyId=seed_data["company"].id)
+    db_session.add(other)
+    db_session.commit()
+    foreign = Consumption(
+        projectId=other.id, amount=1, startDate=date(2023, 1, 1),
+        endDate=date(2023, 1, 1), reportDate=date(2023, 1, 1),
+        activityTypeId=seed_data["activity"].id, fuelTypeId=seed_data["fuel"].id,
+        unitId=seed_data["unit"].id, userId=seed_data["admin"].id,
+    )
+    db_session.add(foreign)
+    db_session.commit()
+
+    def data(project_id, amount, day):
+        return {
+            "projectId": project_id,
+            "amount": amount,
+            "startDate": day,
+            "endDate": day,
+            "reportDate": day,
+            "description": "",
+            "activityTypeId": seed_data["activity"].id,
+            "fuelTypeId": seed_data["fuel"].id,
+            "unitId": seed_data["unit"].id,
+            "userId": user.id,
+        }
+
+    project_id = seed_data["project"].id
+    cid = seed_data["consumption"].id
+    operations = [
+        {"op": "create", "data": data(project_id, 2, "2023-06-01")},
+        {"op": "create", "data": data(project_id, 3, "2023-06-02")},
+        {"op": "update", "id": cid, "data": data(project_id, 4, "2023-06-03")},
+        {"op": "delete", "id": cid},
+        {"op": "delete", "id": foreign.id},
+        {"op": "create", "data": data(other.id, 5, "2023-06-04")},
+        {"op": "create", "data": data(9999, 5, "2023-06-04")},
+        {"op": "update", "id": 9999, "data": data(project_id, 5, "2023-06-04")},
+        {"op": "delete"},
+        {"op": "create"},
+    ]
+    r = client.post(
+        "/consumption/batch", json={"operations": operations}, headers=auth_header_for(user)
+    )
+    assert r.status_code == 200, r.text
+    report = r.json()
+    assert (report["created"], report["updated"], report["deleted"], report["failed"]) == (2, 1, 0, 7)
+    assert [(res["status"], res.get("detail")) for res in report["results"]] == [
+        ("created", None),
+        ("created", None),
+        ("updated", None),
+        ("error", "Entry appears more than once in the batch"),
+        ("error", "Not allowed to delete this entry"),
+        ("error", "Not allowed to add to this project"),
+        ("error", "Project not found"),
+        ("error", "Consumption entry not found"),
+        ("error", "Missing id"),
+        ("error", "Missing data"),
+    ]
+    created_ids = [res["id"] for res in report["results"][:2]]
+
+    db_session.expire_all()
+    mine = db_session.query(Consumption).filter(Consumption.projectId == project_id)
+    assert sorted((c.id, c.amount) for c in mine) == sorted(
+        [(created_ids[0], 2), (created_ids[1], 3), (cid, 4)]
+    )
+    assert {c.userId for c in mine} == {user.id}
+    # The rollup moved with the entries: only the three June days remain
+    cells = (
+        db_session.query(DailyEmission.date, DailyEmission.amount)
+        .filter(DailyEmission.projectId == project_id)
+        .order_by(DailyEmission.date)
+        .all()
+    )
+    assert [(c.date.isoformat(), c.amount) for c in cells] == [
+        ("2023-06-01", pytest.approx(2)),
+        ("2023-06-02", pytest.approx(3)),
+        ("2023-06-03", pytest.approx(4)),
+    ]
+
+    # Deletes are soft and leave the rollup empty
+    r = client.post(
+        "/consumption/batch",
+        json={"operations": [{"op": "delete", "id": i} for i in created_ids + [cid]]},
+        headers=auth_header_for(user),
+    )
+    assert r.json()["deleted"] == 3
+    assert db_session.query(DailyEmission).filter(DailyEmission.projectId == project_id).count() == 0
+    assert client.get("/consumption/", headers=auth_header_for(user)).json() == []
+
+
+def test_batch_consumptions_too_many(seed_data, monkeypatch):
+    from routers import consumption
+
+    monkeypatch.setattr(consumption, "BATCH_MAX_OPERATIONS", 1)
+    admin = seed_data["admin"]
+    override_current_user(admin)
+    r = client.post(
+        "/consumption/batch",
+        json={"operations": [{"op": "delete", "id": 1}, {"op": "delete", "id": 2}]},
+        headers=auth_header_for(admin),
+    )
+    assert r.status_code == 400
@@ -6,7 +6,7 @@ from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import StaticPool
 from app import app
 from database import Base, get_db
-from models import Company, User, Invite
+from models import Company, EmailOutbox, User, Invite
 import routers.invites as invite_router
 from security import get_current_user
 
@@ -84,14 +84,7 @@ def seed_data(db_session: Session):
 
 # --- Tests --------------------------------------------------------------------
 
-def test_create_invite_as_admin(monkeypatch, client, seed_data):
-    calls = []
-    monkeypatch.setattr(
-        invite_router,
-        "send_invite_email",
-        lambda email, fn, ln, link: calls.append((email, fn, ln, link))
-    )
-
+def test_create_invite_as_admin(db_session, client, seed_data):
     app.dependency_overrides[get_current_user] = override_current_user(seed_data["admin"])
 
     payload = {
@@ -107,19 +100,17 @@ def test_create_invite_as_admin(monkeypatch, client, seed_data):
     data = r.json()
     assert data["email"] == "new@test.co"
     assert data["role"] == "companyadmin"
-    assert len(calls) == 1
-    assert data["inviteToken"] in calls[0][3]
 
-    app.dependency_overrides.pop(get_current_user, None)
+    # The email is queued for the background worker, not sent in the request
+    queued = db_session.query(EmailOutbox).all()
+    assert len(queued) == 1
+    assert queued[0].recipient == "new@test.co"
+    assert queued[0].status == "pending"
+    assert data["inviteToken"] in queued[0].body
 
-def test_create_invite_as_companyadmin_forces_user_role(monkeypatch, client, seed_data):
-    calls = []
-    monkeypatch.setattr(
-        invite_router,
-        "send_invite_email",
-        lambda email, fn, ln, link: calls.append((email, fn, ln, link))
-    )
+    app.dependency_overrides.pop(get_current_user, None)
 
+def test_create_invite_as_companyadmin_forces_user_role(db_session, client, seed_data):
     app.dependency_overrides[get_current_user] = override_current_user(seed_data["comp_admin"])
 
     payload = {
@@ -135,7 +126,7 @@ def test_create_invite_as_companyadmin_forces_user_role(monkeypatch, client, see
     data = r.json()
     assert data["role"] == "user"
     assert data["companyId"] == seed_data["comp_admin"].companyId
-    assert len(calls) == 1
+    assert db_session.query(EmailOutbox).count() == 1
 
     app.dependency_overrides.pop(get_current_user, None)
 
@@ -170,6 +161,50 @@ def test_create_invite_email_in_use(client, seed_data):
 
     app.dependency_overrides.pop(get_current_user, None)
 
+def test_reinvite_replaces_expired_invite(client, db_session, seed_data):
+    company_id = seed_data["company"].id
+    db_session.add_all([
+        Invite(
+            email="lapsed@test.co", firstName="L", lastName="One", role="user",
+            companyId=company_id, inviteToken="LAPSED",
+            createdAt=datetime.now(timezone.utc) - timedelta(days=31),
+        ),
+        Invite(
+            email="lapsed2@test.co", firstName="L", lastName="Two", role="user",
+            companyId=company_id, inviteToken="LAPSED2",
+            createdAt=datetime.now(timezone.utc) - timedelta(days=31),
+        ),
+    ])
+    db_session.commit()
+    app.dependency_overrides[get_current_user] = override_current_user(seed_data["admin"])
+
+    payload = {
+        "email": "lapsed@test.co", "firstName": "L", "lastName": "One",
+        "role": "user", "companyId": company_id,
+    }
+    r = client.post("/invites/", json=payload)
+    assert r.status_code == 200, r.text
+    assert r.json()["inviteToken"] != "LAPSED"
+
+    # The fresh invite blocks another one
+    r = client.post("/invites/", json=payload)
+    assert r.status_code == 400
+    assert r.json()["detail"] == "An invite is already pending for this email"
+
+    rows = [{
+        "email": "lapsed2@test.co", "firstName": "L", "lastName": "Two",
+        "role": "user", "companyId": company_id,
+    }]
+    r = client.post("/invites/bulk", json=rows)
+    assert r.status_code == 200, r.text
+    assert r.json()["created"] == 1
+
+    tokens = {i.email: i.inviteToken for i in db_session.query(Invite).all()}
+    assert set(tokens) == {"lapsed@test.co", "lapsed2@test.co"}
+    assert "LAPSED" not in tokens.values() and "LAPSED2" not in tokens.values()
+
+    app.dependency_overrides.pop(get_current_user, None)
+
 def test_get_invite_by_token_and_expiration(client, db_session, seed_data):
     old = Invite(
         email="old@acme.com", firstName="Old", lastName="One",
@@ -191,6 +226,9 @@ def test_get_invite_by_token_and_expiration(client, db_session, seed_data):
     assert r2.status_code == 200
     assert r2.json()["inviteToken"] == "NEW"
 
+    # Reads no longer delete; the expired invite is left to the sweeper
+    assert db_session.query(Invite).filter_by(inviteToken="OLD").count() == 1
+
 def test_get_pending_invites(client, db_session, seed_data):
     i1 = Invite(
         email="a@co.com", firstName="A", lastName="One",
@@ -222,14 +260,7 @@ def test_get_pending_invites(client, db_session, seed_data):
     assert tokens == {"T1"}
     app.dependency_overrides.pop(get_current_user, None)
 
-def test_delete_and_resend_invite(monkeypatch, db_session, seed_data, client):
-    calls = []
-    monkeypatch.setattr(
-        invite_router,
-        "send_invite_email",
-        lambda email, fn, ln, link: calls.append(link)
-    )
-
+def test_delete_and_resend_invite(db_session, seed_data, client):
     # Create and add the invite
     inv = Invite(
         email="z@acme.com", firstName="Z", lastName="Zap",
@@ -258,8 +289,98 @@ def test_delete_and_resend_invite(monkeypatch, db_session, seed_data, client):
     r_resend = client.post(f"/invites/{new_inv.id}/resend")
     assert r_resend.status_code == 200
 
-    # The last email link must end with the new token
-    assert calls and calls[-1].endswith(new_inv.inviteToken)
+    # The queued email must carry a link with the new token
+    db_session.refresh(new_inv)
+    queued = db_session.query(EmailOutbox).order_by(EmailOutbox.id.desc()).first()
+    assert queued is not None
+    assert invite_router.CONFERMATION_LINK + new_inv.inviteToken in queued.body
 
     # Clean up the override
     app.dependency_overrides.pop(get_current_user, None)
+
+def test_bulk_invites_json_reports_per_row(db_session, seed_data, client):
+    db_session.add(Invite(
+        email="pending@test.co", firstName="P", lastName="P", role="user",
+        companyId=seed_data["company"].id, inviteToken="PENDING",
+        createdAt=datetime.now(timezone.utc),
+    ))
+    db_session.commit()
+    company_id = seed_data["company"].id
+    app.dependency_overrides[get_current_user] = override_current_user(seed_data["admin"])
+
+    rows = [
+        {"email": "a@test.co", "firstName": "A", "lastName": "A", "role": "user", "companyId": company_id},
+        {"email": "user@test.co", "firstName": "N", "lastName": "U", "role": "user", "companyId": company_id},
+        {"email": "pending@test.co", "firstName": "P", "lastName": "P", "role": "user", "companyId": company_id},
+        {"email": "not-an-email", "firstName": "X", "lastName": "X", "role": "user", "companyId": company_id},
+        {"email": "a@test.co", "firstName": "A", "lastName": "A", "role": "user", "companyId": company_id},
+        {"email": "b@test.co", "firstName": "B", "lastName": "B", "role": "user", "companyId": 999},
+        {"email": "c@test.co", "firstName": "C", "lastName": "C", "role": "companyadmin", "companyId": company_id},
+    ]
+    r = client.post("/invites/bulk", json=rows)
+    assert r.status_code == 200, r.text
+    report = r.json()
+    assert report["created"] == 2
+    assert report["failed"] == 5
+
+    results = report["results"]
+    assert [res["status"] for res in results] == [
+        "created", "error", "error", "error", "error", "error", "created"
+    ]
+    assert results[1]["detail"] == "Email is already in use"
+    assert results[2]["detail"] == "An invite is already pending for this email"
+    assert results[3]["detail"].startswith("email:")
+    assert results[4]["detail"] == "Duplicate email in upload"
+    assert results[5]["detail"] == "Company not found"
+
+    created = db_session.get(Invite, results[0]["inviteId"])
+    assert created.email == "a@test.co"
+    queued = {m.recipient: m.body for m in db_session.query(EmailOutbox).all()}
+    assert set(queued) == {"a@test.co", "c@test.co"}
+    assert created.inviteToken in queued["a@test.co"]
+
+    app.dependency_overrides.pop(get_current_user, None)
+
+def test_bulk_invites_csv_as_companyadmin(db_session, seed_data, client):
+    app.dependency_overrides[get_current_user] = override_current_user(seed_data["comp_admin"])
+
+    csv_body = (
+        "email,firstName,lastName,role,companyId\n"
+        "x@test.co,X,Ex,admin,999\n"
+        "y@test.co,Y,Why,user,999\n"
+    )
+    r = client.post(
+        "/invites/bulk", content=csv_body, headers={"Content-Type": "text/csv"}
+    )
+    assert r.status_code == 200, r.text
+    assert r.json()["created"] == 2
+
+    invites = db_session.query(Invite).order_by(Invite.email).all()
+    assert [i.email for i in invites] == ["x@test.co", "y@test.co"]
+    assert {i.role for i in invites} == {"user"}
+    assert {i.companyId for i in invites} == {seed_data["company"].id}
+
+    r = client.post(
+        "/invites/bulk", content="email,firstName\nz@test.co,Z\n",
+        headers={"Content-Type": "text/csv"},
+    )
+    assert r.status_code == 400
+    assert "lastName" in r.json()["detail"]
+
+    app.dependency_overrides.pop(get_current_user, None)
+
+def test_bulk_invites_forbidden_for_users(seed_data, client):
+    app.dependency_overrides[get_current_user] = override_current_user(seed_data["normal"])
+    r = client.post("/invites/bulk", json=[])
+    assert r.status_code == 403
+    app.dependency_overrides.pop(get_current_user, None)
+
+def test_sweeper_metrics_admin_only(seed_data, client):
+    app.dependency_overrides[get_current_user] = override_current_user(seed_data["admin"])
+    r = client.get("/invites/sweeper")
+    assert r.status_code == 200
+    assert {"runs", "purgedTotal", "lastPurged", "lastRunAt"} <= set(r.json())
+
+    app.dependency_overrides[get_current_user] = override_current_user(seed_data["comp_admin"])
+    assert client.get("/invites/sweeper").status_code == 403
+    app.dependency_overrides.pop(get_current_user, None)
@@ -7,6 +7,7 @@ from sqlalchemy.pool import StaticPool
 from app import app
 from database import Base, get_db
 from models import Company, ActivityType, FuelType, Unit
+from utils.reference_data import clear_reference_cache
 
 # --- In-memory SQLite setup -----------------------------------------------
 
@@ -41,9 +42,11 @@ def client(db_session):
             pass
 
     app.dependency_overrides[get_db] = _get_test_db
+    clear_reference_cache()
     with TestClient(app) as c:
         yield c
     app.dependency_overrides.clear()
+    clear_reference_cache()
 
 
 # --- COMPANY tests -------------------------------------------------------
@@ -177,3 +180,85 @@ def test_units_crud(client: TestClient):
 
     r = client.delete(f"/options/units/{u_id}")
     assert r.status_code == 404
+
+
+def test_update_fuel_type_recomputes_rollup(client: TestClient, db_session: Session):
+    from datetime import date
+    from models import DailyEmission, Project
+
+    fuel = FuelType(name="Diesel", averageCO2Emission=2.0)
+    company = Company(name="Acme")
+    db_session.add_all([fuel, company])
+    db_session.flush()
+    project = Project(name="P", startDate=date(2023, 1, 1), companyId=company.id)
+    db_session.add(project)
+    db_session.flush()
+    db_session.add(
+        DailyEmission(
+            projectId=project.id, date=date(2023, 1, 1),
+            fuelTypeId=fuel.id, amount=3.0, co2=6.0,
+        )
+    )
+    db_session.commit()
+
+    r = client.put(
+        f"/options/fuel-types/{fuel.id}",
+        json={"name": "Diesel", "averageCO2Emission": 5.0},
+    )
+    assert r.status_code == 200
+
+    db_session.expire_all()
+    assert db_session.query(DailyEmission.co2).scalar() == 15.0
+
+
+# --- Reference data cache tests ---------------------------------------------
+
+def test_options_etag_and_not_modified(client: TestClient):
+    client.post("/options/units", json={"name": "Liter"})
+
+    r = client.get("/options/units")
+    etag = r.headers["etag"]
+    assert r.status_code == 200
+
+    r = client.get("/options/units", headers={"If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.content == b""
+    assert r.headers["etag"] == etag
+
+    r = client.get("/options/units", headers={"If-None-Match": '"other"'})
+    assert r.status_code == 200
+    assert r.json()[0]["name"] == "Liter"
+
+
+def test_options_cache_invalidated_by_writes(client: TestClient, db_session: Session):
+    client.post("/options/companies", json={"name": "Acme"})
+    first = client.get("/options/companies")
+
+    # Rows written behind the API's back are not seen until the next invalidation
+    db_session.add(Company(name="Hidden"))
+    db_session.commit()
+    assert client.get("/options/companies").json() == first.json()
+
+    client.post("/options/companies", json={"name": "Globex"})
+    r = client.get("/options/companies", headers={"If-None-Match": first.headers["etag"]})
+    assert r.status_code == 200
+    assert {c["name"] for c in r.json()} == {"Acme", "Hidden", "Globex"}
+    assert r.headers["etag"] != first.headers["etag"]
+
+
+def test_get_all_options(client: TestClient):
+    client.post("/options/companies", json={"name": "Acme"})
+    client.post("/options/activity-types", json={"name": "Travel"})
+    client.post("/options/fuel-types", json={"name": "Diesel", "averageCO2Emission": 2.5})
+    client.post("/options/units", json={"name": "Liter"})
+
+    r = client.get("/options/all")
+    assert r.status_code == 200
+    data = r.json()
+    assert [c["name"] for c in data["companies"]] == ["Acme"]
+    assert [a["name"] for a in data["activityTypes"]] == ["Travel"]
+    assert data["fuelTypes"][0]["averageCO2Emission"] == 2.5
+    assert [u["name"] for u in data["units"]] == ["Liter"]
+
+    r = client.get("/options/all", headers={"If-None-Match": r.headers["etag"]})
+    assert r.status_code == 304
@@ -119,6 +119,19 @@ def test_get_projects_by_role(client, seed_data):
     names = {p["name"] for p in r.json()}
     assert names == {"Project1"}
 
+def test_get_projects_sparse_fields(client, seed_data):
+    app.dependency_overrides[get_current_user] = override_current_user(seed_data["comp_admin"])
+    r = client.get("/projects/", params={"fields": "id,name"})
+    assert r.status_code == 200
+    assert r.json() == [{"id": seed_data["p1"].id, "name": "Project1"}]
+
+    r = client.get("/projects/", params={"fields": "name,status"})
+    assert list(r.json()[0]) == ["name", "status"]
+    assert r.json()[0]["status"] in ("Ongoing", "Completed")
+
+    r = client.get("/projects/", params={"fields": "budget"})
+    assert r.status_code == 400
+
 def test_create_project_as_admin_and_companyadmin_and_forbidden(client, seed_data):
     # Admin
     app.dependency_overrides[get_current_user] = override_current_user(seed_data["admin"])
@@ -116,6 +116,24 @@ def test_get_users_list_roles(client, seed_data):
     r = client.get("/users/")
     assert len(r.json()) == 3
 
+def test_get_users_sparse_fields(client, seed_data):
+    app.dependency_overrides[get_current_user] = override_current_user(seed_data["admin"])
+    r = client.get("/users/", params={"fields": "email,id"})
+    assert r.status_code == 200
+    assert all(list(u) == ["id", "email"] for u in r.json())
+
+    r = client.get("/users/", params={"fields": "email,projects"})
+    projects = {u["email"]: u["projects"] for u in r.json()}
+    assert projects["norm@a.com"] == [seed_data["p2"].id]
+    assert projects["admin@a.com"] == []
+
+    r = client.get("/users/", params={"fields": "email,passwordhash"})
+    assert r.status_code == 400
+
+    # The full list keeps every field
+    r = client.get("/users/")
+    assert list(r.json()[0]) == ["id", "firstName", "lastName", "email", "role", "companyId", "company", "projects"]
+
 def test_get_me_and_get_user_by_id(client, seed_data):
     app.dependency_overrides[get_current_user] = override_current_user(seed_data["normal"])
     r = client.get("/users/me")
@@ -198,3 +216,35 @@ def test_delete_user_and_get_projects(client, seed_data):
 
     r4 = client.get("/users/9999/projects")
     assert r4.status_code == 404
+
+def test_update_user_bumps_permission_version(client, seed_data, db_session):
+    app.dependency_overrides[get_current_user] = override_current_user(seed_data["admin"])
+    normal = seed_data["normal"]
+    before = normal.permissionVersion
+    upd = {
+        "id": normal.id,
+        "firstName": normal.firstName,
+        "lastName": normal.lastName,
+        "email": normal.email,
+        "role": normal.role,
+        "companyId": normal.companyId,
+        "projects": [],
+    }
+    r = client.put(f"/users/{normal.id}", json=upd)
+    assert r.status_code == 200, r.text
+
+    db_session.expire_all()
+    assert db_session.get(User, normal.id).permissionVersion == before + 1
+
+def test_get_me_with_claims_principal(client, seed_data):
+    from security import Principal
+
+    normal = seed_data["normal"]
+    principal = Principal(
+        id=normal.id, role="user", companyId=normal.companyId, project_ids=[]
+    )
+    app.dependency_overrides[get_current_user] = override_current_user(principal)
+    r = client.get("/users/me")
+    assert r.status_code == 200
+    assert r.json()["email"] == "norm@a.com"
+    assert r.json()["company"] == "Beta"
@@ -1,5 +1,27 @@
-from database import get_db
+import asyncio
+from datetime import date
+from types import SimpleNamespace
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import Session
+from starlette.requests import Request
+from starlette.responses import Response
+import database
+from database import (
+    DB_POOL_SIZE,
+    READ_YOUR_WRITES_COOKIE,
+    Base,
+    _threadpool_runner,
+    async_url,
+    create_db_engine,
+    get_db,
+    get_read_db,
+    reads_from_primary,
+    record_write,
+)
+from models import ActivityType, Company, Consumption, FuelType, Project, Unit, User
+from routers.consumption import CONSUMPTION_FIELDS, list_consumptions
+from schemas import ConsumptionFilterSchema
 
 
 # Test that a database connection can be established
@@ -19,3 +41,122 @@ def test_get_db():
 
     # Cleanup: Ensure session is closed after test
     db.close()
+
+
+# Test that the threadpool runner calls the function with the request's session
+def test_threadpool_runner(test_db):
+    run = _threadpool_runner(test_db)
+
+    result = asyncio.run(run(lambda db, value: (db, value), 42))
+
+    assert result == (test_db, 42)
+
+
+# Test that the same query functions run on an AsyncSession in async mode
+def test_async_session_runs_list_query(tmp_path):
+    path = tmp_path / "async.db"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=sync_engine)
+    with Session(sync_engine) as db:
+        company = Company(name="AsyncCo")
+        db.add(company)
+        db.flush()
+        project = Project(name="Site", startDate=date(2024, 1, 1), companyId=company.id)
+        admin = User(
+            firstName="A", lastName="B", email="a@async.co",
+            passwordhash="x", role="admin", companyId=company.id,
+        )
+        db.add_all([project, admin, ActivityType(name="Act"),
+                    FuelType(name="Fuel", averageCO2Emission=2.0), Unit(name="L")])
+        db.flush()
+        db.add(Consumption(
+            amount=10, startDate=date(2024, 1, 1), endDate=date(2024, 1, 31),
+            reportDate=date(2024, 2, 1), userId=admin.id, projectId=project.id,
+            activityTypeId=1, fuelTypeId=1, unitId=1,
+        ))
+        db.commit()
+        admin = SimpleNamespace(id=admin.id, role="admin", companyId=company.id)
+    sync_engine.dispose()
+
+    async def fetch():
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        try:
+            async with AsyncSession(async_engine) as db:
+                return await db.run_sync(
+                    list_consumptions, admin, ConsumptionFilterSchema(),
+                    "-reportDate", CONSUMPTION_FIELDS,
+                )
+        finally:
+            await async_engine.dispose()
+
+    rows, next_cursor = asyncio.run(fetch())
+
+    assert next_cursor is None
+    assert [(row.project, row.amount) for row in rows] == [("Site", 10)]
+
+
+# Test that engines from the factory apply the SQLite PRAGMAs on every connection
+def test_create_db_engine_applies_pragmas(tmp_path):
+    engine = create_db_engine(
+        f"sqlite:///{tmp_path / 'tuned.db'}",
+        pragmas={"journal_mode": "WAL", "synchronous": "NORMAL", "busy_timeout": 1234},
+    )
+    try:
+        with engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+            # NORMAL is reported as 1
+            assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+            assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == 1234
+        assert engine.pool.size() == DB_POOL_SIZE
+    finally:
+        engine.dispose()
+
+
+# Test that async mode maps the database URL to the backend's async driver
+def test_async_url():
+    assert async_url("sqlite:///../carbon_data.db") == "sqlite+aiosqlite:///../carbon_data.db"
+    assert (
+        async_url("postgresql+psycopg2://carbon:secret@db:5432/carbon_data")
+        == "postgresql+asyncpg://carbon:secret@db:5432/carbon_data"
+    )
+
+
+def _request(method="GET", headers=()):
+    return Request(
+        {
+            "type": "http",
+            "method": method,
+            "headers": [(k.lower().encode(), v.encode()) for k, v in headers],
+        }
+    )
+
+
+# Test that reads go to the replica, except for clients that just wrote
+def test_read_replica_routing(monkeypatch, test_db):
+    replica = Session()
+    monkeypatch.setattr(database, "ReplicaSessionLocal", lambda: replica)
+    monkeypatch.setattr(database, "_recent_writers", {})
+    alice = ("Authorization", "Bearer alice")
+    bob = ("Authorization", "Bearer bob")
+
+    assert next(get_read_db(_request(headers=[alice]), test_db)) is replica
+
+    response = Response()
+    record_write(_request("POST", [alice]), response)
+    cookie = response.headers["set-cookie"]
+    assert cookie.startswith(READ_YOUR_WRITES_COOKIE + "=")
+
+    # Sticky by Authorization header in this worker
+    assert next(get_read_db(_request(headers=[alice]), test_db)) is test_db
+    assert not reads_from_primary(_request(headers=[bob]))
+    # ... and by cookie in any worker
+    other_worker = _request(headers=[bob, ("Cookie", cookie.split(";")[0])])
+    monkeypatch.setattr(database, "_recent_writers", {})
+    assert reads_from_primary(other_worker)
+    assert not reads_from_primary(_request(headers=[alice]))
+
+
+# Test that without a replica every read uses the primary session
+def test_read_db_without_replica(test_db):
+    assert database.ReplicaSessionLocal is None
+    assert next(get_read_db(_request(), test_db)) is test_db
@@ -0,0 +1,126 @@
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import Session
+
+from database import Base
+from migrations import MIGRATIONS, explain_query_plan, list_indexes, run_migrations
+from models import (
+    Company,
+    Consumption,
+    DailyEmission,
+    EmailOutbox,
+    FuelType,
+    Invite,
+    Project,
+)
+from routers.consumption import build_consumption_query
+from schemas import ConsumptionFilterSchema
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+    yield engine
+    engine.dispose()
+
+
+def _legacy_schema(engine):
+    """
+    Recreate the pre-migration layout: no composite indexes, rollup or outbox
+    tables, nor consumption change tracking.
+    """
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql('ALTER TABLE "User" DROP COLUMN "permissionVersion"')
+        DailyEmission.__table__.drop(bind=conn)
+        EmailOutbox.__table__.drop(bind=conn)
+        for table in (Consumption.__table__, Project.__table__, Invite.__table__):
+            for index in table.indexes:
+                if not index.name.startswith("ix_" + table.name + "_"):
+                    index.drop(bind=conn)
+        for column in ("updatedAt", "deletedAt"):
+            conn.exec_driver_sql(f'ALTER TABLE "Consumption" DROP COLUMN "{column}"')
+        # Older schemas also indexed the Consumption primary key separately
+        conn.exec_driver_sql('CREATE INDEX "ix_Consumption_id" ON "Consumption" (id)')
+
+
+def test_run_migrations_on_fresh_database(engine):
+    latest = MIGRATIONS[-1][0]
+    assert run_migrations(engine) == latest
+    # Running again is a no-op
+    assert run_migrations(engine) == latest
+    assert "ix_consumption_project_start" in list_indexes(engine, "Consumption")
+
+
+def test_run_migrations_on_populated_legacy_database(engine):
+    _legacy_schema(engine)
+    assert "ix_consumption_project_start" not in list_indexes(engine, "Consumption")
+
+    with Session(engine) as db:
+        company = Company(name="Co")
+        fuel = FuelType(name="Diesel", averageCO2Emission=2.0)
+        db.add_all([company, fuel])
+        db.flush()
+        project = Project(name="P", startDate=date(2023, 1, 1), companyId=company.id)
+        db.add(project)
+        db.flush()
+        # Plain SQL: the legacy table lacks the change tracking columns
+        db.connection().exec_driver_sql(
+            'INSERT INTO "Consumption" (amount, "startDate", "endDate", "reportDate", '
+            '"projectId", "fuelTypeId") VALUES (?, ?, ?, ?, ?, ?)',
+            (4.0, "2023-01-01", "2023-01-02", "2023-01-03", project.id, fuel.id),
+        )
+        db.commit()
+
+    run_migrations(engine)
+
+    assert {
+        "ix_consumption_project_start",
+        "ix_consumption_user_report",
+        "ix_consumption_report",
+    } <= list_indexes(engine, "Consumption")
+    assert "ix_Consumption_id" not in list_indexes(engine, "Consumption")
+    assert "ix_project_company" in list_indexes(engine, "Project")
+    assert {"ix_invite_created", "ix_invite_company_created"} <= list_indexes(
+        engine, "Invite"
+    )
+    assert "EmailOutbox" in inspect(engine).get_table_names()
+    assert "permissionVersion" in {
+        column["name"] for column in inspect(engine).get_columns("User")
+    }
+    assert "ix_consumption_updated" in list_indexes(engine, "Consumption")
+    with Session(engine) as db:
+        assert db.query(DailyEmission).count() == 2
+        # Existing rows are stamped so the first delta sync includes them
+        assert db.query(Consumption.updatedAt).scalar() is not None
+
+
+def test_router_queries_use_composite_indexes(engine):
+    run_migrations(engine)
+    with Session(engine) as db:
+        user = SimpleNamespace(role="user", project_ids=[1])
+        plan = explain_query_plan(
+            db,
+            build_consumption_query(
+                db, user, ConsumptionFilterSchema(dateTo=date(2024, 1, 1))
+            ),
+        )
+        assert any("ix_consumption_project_start" in step for step in plan)
+
+        admin = SimpleNamespace(role="admin")
+        plan = explain_query_plan(
+            db, build_consumption_query(db, admin, ConsumptionFilterSchema(userId=[1]))
+        )
+        assert any("ix_consumption_user_report" in step for step in plan)
+
+        company_admin = SimpleNamespace(role="companyadmin", companyId=1)
+        plan = explain_query_plan(
+            db,
+            build_consumption_query(
+                db, company_admin, ConsumptionFilterSchema()
+            ).order_by(Consumption.reportDate.desc(), Consumption.id.desc()),
+        )
+        assert any("Consumption USING INDEX" in step for step in plan)
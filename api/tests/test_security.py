@@ -135,6 +135,124 @@ def test_get_current_user_user_not_found(mock_get_db):
     assert "User not found" in str(exc_info.value.detail)
 
 
+# -------------------- Claims Fast Path Tests --------------------
+
+
+@pytest.fixture
+def claims_db(test_db, monkeypatch):
+    from models import Company, Project, User_Project
+
+    monkeypatch.setattr(security, "AUTH_MODE", "claims")
+    security._permission_versions.clear()
+    security._principals.clear()
+    test_db.query(User_Project).delete()
+    test_db.query(User).delete()
+    company = Company(name="Co")
+    test_db.add(company)
+    test_db.flush()
+    project = Project(name="P", companyId=company.id)
+    user = User(email="claims@example.com", role="user", companyId=company.id)
+    test_db.add_all([project, user])
+    test_db.flush()
+    test_db.add(User_Project(userId=user.id, projectId=project.id))
+    test_db.commit()
+    yield test_db, user, project
+    security._permission_versions.clear()
+    security._principals.clear()
+
+
+def test_build_access_claims(claims_db):
+    db, user, project = claims_db
+    claims = security.build_access_claims(user)
+    assert claims["sub"] == str(user.id)
+    assert claims["role"] == "user"
+    assert claims["projects"] == [project.id]
+    assert claims["pv"] == 0
+
+
+def test_get_current_user_claims_fast_path(claims_db):
+    db, user, project = claims_db
+    token = security.create_access_token(security.build_access_claims(user))
+
+    principal = security.get_current_user(token=token, db=db)
+    assert isinstance(principal, security.Principal)
+    assert principal.project_ids == [project.id]
+
+    # The permission version is cached, so later requests skip the database
+    broken_db = MagicMock()
+    broken_db.query.side_effect = AssertionError("database was queried")
+    assert security.get_current_user(token=token, db=broken_db) == principal
+
+
+def test_get_current_user_claims_stale_version(claims_db):
+    db, user, project = claims_db
+    token = security.create_access_token(security.build_access_claims(user))
+    assert isinstance(security.get_current_user(token=token, db=db), security.Principal)
+
+    security.bump_permission_version(db, [user.id])
+    db.commit()
+
+    # Stale claims fall back to loading the user
+    current = security.get_current_user(token=token, db=db)
+    assert isinstance(current, User)
+    assert current.id == user.id
+
+
+def test_get_current_user_claims_deleted_user(claims_db):
+    db, user, project = claims_db
+    token = security.create_access_token(security.build_access_claims(user))
+
+    security.bump_permission_version(db, [user.id])
+    db.query(User).filter(User.id == user.id).delete()
+    db.commit()
+
+    with pytest.raises(HTTPException) as exc_info:
+        security.get_current_user(token=token, db=db)
+    assert exc_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_refresh_access_token_with_db_carries_claims(claims_db):
+    db, user, project = claims_db
+    refresh_token = security.create_refresh_token({"sub": str(user.id)})
+
+    access_token, _ = security.refresh_access_token(refresh_token, db)
+    decoded = jwt.decode(access_token, security.SECRET_KEY, algorithms=[security.ALGORITHM])
+    assert decoded["role"] == "user"
+    assert decoded["projects"] == [project.id]
+
+
+# -------------------- Principal Cache Tests --------------------
+
+
+def test_get_current_user_cached_principal(claims_db, monkeypatch):
+    db, user, project = claims_db
+    monkeypatch.setattr(security, "AUTH_MODE", "cached")
+    token = security.create_access_token({"sub": str(user.id)})
+
+    principal = security.get_current_user(token=token, db=db)
+    assert principal == security.Principal(
+        id=user.id, role="user", companyId=user.companyId, project_ids=[project.id]
+    )
+
+    # Cache hit: no database access
+    broken_db = MagicMock()
+    broken_db.query.side_effect = AssertionError("database was queried")
+    assert security.get_current_user(token=token, db=broken_db) == principal
+
+
+def test_bump_permission_version_invalidates_cached_principal(claims_db, monkeypatch):
+    db, user, project = claims_db
+    monkeypatch.setattr(security, "AUTH_MODE", "cached")
+    token = security.create_access_token({"sub": str(user.id)})
+    assert security.get_current_user(token=token, db=db).role == "user"
+
+    db.query(User).filter(User.id == user.id).update({User.role: "companyadmin"})
+    security.bump_permission_version(db, [user.id])
+    db.commit()
+
+    assert security.get_current_user(token=token, db=db).role == "companyadmin"
+
+
 # -------------------- Invite Token Tests --------------------
 
 
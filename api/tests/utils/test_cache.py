@@ -0,0 +1,36 @@
+from unittest.mock import patch
+
+from utils.cache import TTLCache
+
+
+def test_ttl_cache_get_set_and_invalidate():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.get("missing", "default") == "default"
+
+    cache.invalidate("a")
+    assert cache.get("a") is None
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")  # "b" is now the least recently used
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(maxsize=2, ttl=10)
+    with patch("utils.cache.time.monotonic", return_value=100.0):
+        cache.set("a", 1)
+    with patch("utils.cache.time.monotonic", return_value=105.0):
+        assert cache.get("a") == 1
+    with patch("utils.cache.time.monotonic", return_value=111.0):
+        assert cache.get("a") is None
@@ -0,0 +1,148 @@
+from datetime import date
+
+import io
+
+import pytest
+
+from database import Base
+from models import (
+    ActivityType,
+    Company,
+    Consumption,
+    DailyEmission,
+    FuelType,
+    Project,
+    Unit,
+    User,
+)
+from utils import sync
+from utils.consumption_import import ConsumptionImporter, read_batches
+
+
+def test_read_batches_csv_records_span_lines_and_batches():
+    body = io.BytesIO(
+        b'\xef\xbb\xbfa,b\r\n1,"first\nsecond"\n\n2,"x\r\ny\nz"\n3,plain\n'
+    )
+    batches = list(read_batches(body, "csv", batch_size=2))
+    assert batches == [
+        [(1, ["a", "b"]), (2, ["1", "first\nsecond"])],
+        [(4, []), (5, ["2", "x\r\ny\nz"])],
+        [(8, ["3", "plain"])],
+    ]
+    # The body stays open for its owner to close
+    assert not body.closed
+
+
+def test_read_batches_ndjson_lines():
+    body = io.BytesIO(b'{"a": 1}\n\n{"a": 2}')
+    assert list(read_batches(body, "ndjson", batch_size=2)) == [
+        [b'{"a": 1}', b""],
+        [b'{"a": 2}'],
+    ]
+
+
+@pytest.fixture
+def clean_db(test_db):
+    Base.metadata.drop_all(bind=test_db.bind)
+    Base.metadata.create_all(bind=test_db.bind)
+    return test_db
+
+
+@pytest.fixture
+def postgres_db(clean_db):
+    if clean_db.get_bind().dialect.name != "postgresql":
+        pytest.skip("COPY imports are only used on Postgres")
+    return clean_db
+
+
+def _seed(db):
+    """Adds the rows an import refers to and returns the importing admin."""
+    company = Company(name="TestCo")
+    db.add(company)
+    db.flush()
+    admin = User(
+        firstName="Ad", lastName="Min", email="admin@test.co",
+        passwordhash="x", role="admin", companyId=company.id,
+    )
+    db.add_all([
+        admin,
+        Project(name="Site", startDate=date(2023, 1, 1), companyId=company.id),
+        ActivityType(name="Metering"),
+        FuelType(name="Diesel", averageCO2Emission=2.0),
+        Unit(name="Liter"),
+    ])
+    db.commit()
+    return admin
+
+
+def test_long_import_restamped_by_id(monkeypatch, clean_db):
+    db = clean_db
+    admin = _seed(db)
+    importer = ConsumptionImporter(db, admin, "ndjson")
+    for _ in range(2):
+        importer.feed([
+            b'{"amount": 1, "startDate": "2023-02-01", "endDate": "2023-02-01", '
+            b'"project": "Site", "activityType": "Metering", "fuelType": "Diesel", '
+            b'"unit": "Liter"}'
+        ])
+    stamp = importer.updated_at
+    # Another entry of the same user that happens to share the stamp
+    other = Consumption(
+        amount=9, startDate=date(2023, 1, 1), endDate=date(2023, 1, 1),
+        reportDate=date(2023, 1, 1), userId=admin.id, projectId=1,
+        activityTypeId=1, fuelTypeId=1, unitId=1, updatedAt=stamp,
+    )
+    db.add(other)
+    db.flush()
+
+    # The import took longer than the settle window allows
+    monkeypatch.setattr(sync, "CHANGES_SETTLE_SECONDS", 0)
+    assert importer.finish()["inserted"] == 2
+    imported = db.query(Consumption).filter(Consumption.amount == 1).all()
+    assert len(imported) == 2
+    assert all(c.updatedAt > stamp.replace(tzinfo=None) for c in imported)
+    db.refresh(other)
+    assert other.updatedAt == stamp.replace(tzinfo=None)
+
+
+def test_quick_import_keeps_its_stamp(clean_db):
+    db = clean_db
+    admin = _seed(db)
+    importer = ConsumptionImporter(db, admin, "ndjson")
+    importer.feed([
+        b'{"amount": 1, "startDate": "2023-02-01", "endDate": "2023-02-01", '
+        b'"projectId": 1, "activityTypeId": 1, "fuelTypeId": 1, "unitId": 1}'
+    ])
+    importer.finish()
+    imported = db.query(Consumption).one()
+    assert imported.updatedAt == importer.updated_at.replace(tzinfo=None)
+
+
+def test_copy_import_round_trips_values(postgres_db):
+    db = postgres_db
+    admin = _seed(db)
+
+    importer = ConsumptionImporter(db, admin, "csv")
+    assert importer._copy is not None
+    body = io.BytesIO(b"\n".join([
+        b"project,activityType,fuelType,unit,amount,startDate,endDate,reportDate,description",
+        b'Site,Metering,Diesel,Liter,1.5,2023-02-01,2023-02-02,2023-02-03,"tab\tback\\\\slash"',
+        b"Site,Metering,Diesel,Liter,0.1,2023-02-01,2023-02-01,,",
+    ]))
+    for batch in read_batches(body, "csv"):
+        importer.feed(batch)
+    report = importer.finish()
+    assert report == {"inserted": 2, "failed": 0, "errors": []}
+
+    imported = db.query(Consumption).order_by(Consumption.amount).all()
+    assert [c.amount for c in imported] == [0.1, 1.5]
+    assert imported[0].reportDate == date.today()
+    assert imported[0].description == ""
+    assert imported[1].description == "tab\tback\\\\slash"
+    assert imported[1].startDate == date(2023, 2, 1)
+    assert {c.userId for c in imported} == {admin.id}
+    assert all(c.updatedAt is not None for c in imported)
+
+    # The rollup covers the copied rows
+    total = sum(row.amount for row in db.query(DailyEmission))
+    assert total == pytest.approx(1.6)
@@ -0,0 +1,140 @@
+import socket
+import smtplib
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+from aiosmtpd.controller import Controller
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+from models import EmailOutbox
+from utils import email_outbox
+from utils.email_outbox import OutboxWorker, SMTPConnection, enqueue_invite_email
+
+engine = create_engine(
+    "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+class RecordingHandler:
+    """aiosmtpd handler that keeps every received message."""
+
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def db_session():
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def smtp_server():
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=_free_port())
+    controller.start()
+    try:
+        yield controller, handler
+    finally:
+        controller.stop()
+
+
+def test_worker_delivers_queued_emails_over_one_connection(db_session, smtp_server):
+    controller, handler = smtp_server
+    for i in range(3):
+        enqueue_invite_email(
+            db_session, f"u{i}@test.co", "U", str(i), f"http://localhost/setup/T{i}"
+        )
+    db_session.commit()
+
+    worker = OutboxWorker(
+        TestingSessionLocal, SMTPConnection("127.0.0.1", controller.port)
+    )
+    with patch("utils.email_outbox.smtplib.SMTP", wraps=smtplib.SMTP) as smtp:
+        assert worker.run_once() == 3
+        assert worker.run_once() == 0
+    worker.connection.close()
+
+    assert smtp.call_count == 1
+    assert sorted(m.rcpt_tos[0] for m in handler.messages) == [
+        "u0@test.co", "u1@test.co", "u2@test.co"
+    ]
+    assert b"http://localhost/setup/T1" in b"".join(m.content for m in handler.messages)
+
+    db_session.expire_all()
+    rows = db_session.query(EmailOutbox).all()
+    assert {row.status for row in rows} == {"sent"}
+    assert all(row.attempts == 1 and row.sentAt is not None for row in rows)
+
+
+def test_worker_retries_with_backoff_then_gives_up(db_session, monkeypatch):
+    monkeypatch.setattr(email_outbox, "EMAIL_MAX_ATTEMPTS", 2)
+    enqueue_invite_email(db_session, "a@test.co", "A", "B", "http://localhost/setup/T")
+    db_session.commit()
+
+    # Nothing listens on this port, so every attempt fails
+    worker = OutboxWorker(TestingSessionLocal, SMTPConnection("127.0.0.1", _free_port()))
+    # SQLite hands the stored UTC time back without its zone
+    before = datetime.now(timezone.utc).replace(tzinfo=None)
+    assert worker.run_once() == 1
+
+    db_session.expire_all()
+    message = db_session.query(EmailOutbox).one()
+    assert message.status == "pending"
+    assert message.attempts == 1
+    assert message.lastError
+    assert message.nextAttemptAt >= before + email_outbox.retry_delay(1)
+
+    # Not due yet
+    assert worker.run_once() == 0
+
+    message.nextAttemptAt = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db_session.commit()
+    assert worker.run_once() == 1
+
+    db_session.expire_all()
+    message = db_session.query(EmailOutbox).one()
+    assert message.status == "failed"
+    assert message.attempts == 2
+
+
+def test_claimed_messages_are_not_sent_twice(db_session, smtp_server):
+    controller, handler = smtp_server
+    enqueue_invite_email(db_session, "a@test.co", "A", "B", "http://localhost/setup/T")
+    db_session.commit()
+
+    first = OutboxWorker(TestingSessionLocal, SMTPConnection("127.0.0.1", controller.port))
+    second = OutboxWorker(TestingSessionLocal, SMTPConnection("127.0.0.1", controller.port))
+    with TestingSessionLocal() as db:
+        claimed = first._claim(db)
+    assert len(claimed) == 1
+    assert second.run_once() == 0
+    assert handler.messages == []
+
+
+def test_retry_delay_is_exponential_and_capped(monkeypatch):
+    monkeypatch.setattr(email_outbox, "EMAIL_RETRY_BASE_SECONDS", 10)
+    monkeypatch.setattr(email_outbox, "EMAIL_RETRY_MAX_SECONDS", 60)
+    assert [email_outbox.retry_delay(n).total_seconds() for n in (1, 2, 3, 4)] == [
+        10, 20, 40, 60
+    ]
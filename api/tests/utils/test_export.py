@@ -0,0 +1,49 @@
+import gzip
+import json
+from collections import namedtuple
+from datetime import date
+from types import SimpleNamespace
+
+from utils import export
+from utils.export import columnar_chunks, csv_chunks, gzip_chunks, ndjson_chunks
+
+Row = namedtuple("Row", ["id", "kind"])
+ROWS = [SimpleNamespace(id=i, day=date(2024, 1, i + 1), note=f"n,{i}") for i in range(5)]
+
+
+def test_csv_chunks_are_batched(monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 2)
+    chunks = list(csv_chunks(iter(ROWS), ["id", "day", "note"]))
+    assert len(chunks) == 3
+    lines = b"".join(chunks).decode().splitlines()
+    assert lines[0] == "id,day,note"
+    assert lines[1] == '0,2024-01-01,"n,0"'
+    assert len(lines) == 6
+
+
+def test_csv_chunks_without_rows_still_has_header():
+    assert b"".join(csv_chunks([], ["id"])).decode().strip() == "id"
+
+
+def test_ndjson_chunks(monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 4)
+    chunks = list(ndjson_chunks(iter(ROWS), ["id", "day"]))
+    assert len(chunks) == 2
+    records = [json.loads(line) for line in b"".join(chunks).decode().splitlines()]
+    assert records[4] == {"id": 4, "day": "2024-01-05"}
+
+
+def test_gzip_chunks_roundtrip():
+    chunks = [b"hello ", b"", b"world"]
+    assert gzip.decompress(b"".join(gzip_chunks(iter(chunks)))) == b"hello world"
+
+
+def test_columnar_chunks(monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 2)
+    rows = [Row(i, "even" if i % 2 == 0 else "odd") for i in range(5)]
+    chunks = list(columnar_chunks(iter(rows), ["id", "kind"], ["kind"]))
+    assert len(chunks) == 3
+    batches = [json.loads(chunk) for chunk in chunks]
+    assert [b["length"] for b in batches] == [2, 2, 1]
+    assert batches[0]["columns"] == {"id": [0, 1], "kind": [0, 1]}
+    assert batches[2]["dictionaries"] == {"kind": ["even"]}
@@ -0,0 +1,79 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+from models import Company, Invite
+from utils import invite_sweeper
+from utils.invite_sweeper import InviteSweeper
+
+engine = create_engine(
+    "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def db_session():
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+def _add_invites(db, count, age_days, prefix):
+    company = Company(name=prefix)
+    db.add(company)
+    db.flush()
+    db.add_all(
+        Invite(
+            email=f"{prefix}{i}@test.co", firstName="F", lastName="L", role="user",
+            companyId=company.id, inviteToken=f"{prefix}{i}",
+            createdAt=datetime.now(timezone.utc) - timedelta(days=age_days),
+        )
+        for i in range(count)
+    )
+    db.commit()
+
+
+def test_sweeper_purges_expired_invites_in_batches(db_session, monkeypatch):
+    monkeypatch.setattr(invite_sweeper, "INVITE_SWEEP_BATCH_SIZE", 2)
+    _add_invites(db_session, 5, 31, "old")
+    _add_invites(db_session, 3, 1, "new")
+
+    sweeper = InviteSweeper(TestingSessionLocal)
+    assert sweeper.run_once() == 5
+    assert sweeper.run_once() == 0
+
+    remaining = {invite.inviteToken for invite in db_session.query(Invite)}
+    assert remaining == {"new0", "new1", "new2"}
+
+    metrics = sweeper.metrics()
+    assert metrics["runs"] == 2
+    assert metrics["purgedTotal"] == 5
+    assert metrics["lastPurged"] == 0
+    assert metrics["lastRunAt"] is not None
+    assert metrics["running"] is False
+
+
+def test_sweeper_thread_runs_on_start(db_session, monkeypatch):
+    monkeypatch.setattr(invite_sweeper, "INVITE_SWEEP_INTERVAL", 60)
+    _add_invites(db_session, 2, 40, "old")
+
+    sweeper = InviteSweeper(TestingSessionLocal)
+    sweeper.start()
+    try:
+        deadline = datetime.now() + timedelta(seconds=5)
+        while sweeper.metrics()["runs"] == 0 and datetime.now() < deadline:
+            time.sleep(0.01)
+    finally:
+        sweeper.stop()
+
+    assert sweeper.metrics()["purgedTotal"] == 2
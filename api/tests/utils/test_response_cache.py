@@ -0,0 +1,135 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from utils import response_cache as response_cache_module
+from utils.response_cache import MemoryBackend, RedisBackend, ResponseCache
+
+
+class FakeRedis:
+    """Local stand-in for a Redis client (expiry is not simulated)."""
+
+    def __init__(self):
+        self.data = {}
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, px=None):
+        self.data[key] = value
+
+    def incr(self, key):
+        value = int(self.data.get(key, b"0")) + 1
+        self.data[key] = str(value).encode()
+        return value
+
+    def scan_iter(self, match):
+        return [key for key in self.data if key.startswith(match.rstrip("*"))]
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+
+class Unavailable:
+    def get_many(self, keys):
+        raise ConnectionError("down")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache_module, "time", SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+@pytest.fixture(params=["memory", "redis"])
+def cache(request, clock):
+    backend = MemoryBackend() if request.param == "memory" else RedisBackend(FakeRedis())
+    return ResponseCache(backend, ttl=5, stale_seconds=30)
+
+
+def counter():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return f"body {len(calls)}".encode()
+
+    return calls, compute
+
+
+def test_fresh_entries_are_served_until_a_tag_is_invalidated(cache):
+    calls, compute = counter()
+
+    async def get(tags=("project:1",)):
+        return await cache.get(("series", 1), tags, compute)
+
+    assert asyncio.run(get()) == b"body 1"
+    assert asyncio.run(get()) == b"body 1"
+    cache.invalidate(["company:2"])
+    assert asyncio.run(get()) == b"body 1"
+
+    cache.invalidate(["project:1"])
+    assert asyncio.run(get()) == b"body 2"
+    assert asyncio.run(get()) == b"body 2"
+    # Entries with other tags are separate
+    assert asyncio.run(get(tags=("project:1", "emissions"))) == b"body 3"
+    assert len(calls) == 3
+
+
+def test_stale_entries_are_served_while_refreshing(cache, clock):
+    calls, compute = counter()
+    refreshes = []
+
+    async def main():
+        release = asyncio.Event()
+
+        async def refresh():
+            refreshes.append(1)
+            await release.wait()
+            return b"refreshed"
+
+        await cache.get("k", ["t"], compute, refresh)
+        clock[0] += 6
+        # Stale: both callers get the old payload at once, one refresh runs
+        stale = await asyncio.gather(
+            cache.get("k", ["t"], compute, refresh),
+            cache.get("k", ["t"], compute, refresh),
+        )
+        release.set()
+        await asyncio.gather(*cache._tasks)
+        return stale, await cache.get("k", ["t"], compute, refresh)
+
+    stale, refreshed = asyncio.run(main())
+    assert stale == [b"body 1", b"body 1"]
+    assert refreshed == b"refreshed"
+    assert len(calls) == 1 and len(refreshes) == 1
+
+    # Past the stale window the payload is recomputed before responding
+    clock[0] += 36
+    assert asyncio.run(cache.get("k", ["t"], compute)) == b"body 2"
+
+
+def test_writes_during_a_computation_are_not_missed(cache):
+    async def compute_during_write():
+        cache.invalidate(["t"])
+        return b"before the write"
+
+    async def main():
+        first = await cache.get("k", ["t"], compute_during_write)
+        second = await cache.get("k", ["t"], lambda: asyncio.sleep(0, b"after"))
+        return first, second
+
+    assert asyncio.run(main()) == (b"before the write", b"after")
+
+
+def test_disabled_or_unavailable_backend_computes_every_time():
+    for backend in (None, Unavailable()):
+        cache = ResponseCache(backend)
+        calls, compute = counter()
+        asyncio.run(cache.get("k", ["t"], compute))
+        asyncio.run(cache.get("k", ["t"], compute))
+        cache.invalidate(["t"])
+        assert len(calls) == 2
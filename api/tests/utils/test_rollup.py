@@ -0,0 +1,97 @@
+from datetime import date
+
+import pytest
+
+from models import Company, Consumption, DailyEmission, FuelType, Project
+from utils.rollup import (
+    add_consumption,
+    add_consumptions,
+    rebuild_daily_emissions,
+    recompute_fuel_type,
+    remove_consumption,
+)
+
+
+@pytest.fixture
+def db(test_db):
+    for table in ("DailyEmission", "Consumption", "Project", "FuelType", "Company"):
+        test_db.execute(DailyEmission.metadata.tables[table].delete())
+    company = Company(name="Co")
+    fuel = FuelType(name="Diesel", averageCO2Emission=2.0)
+    test_db.add_all([company, fuel])
+    test_db.flush()
+    test_db.add(Project(name="P", startDate=date(2023, 1, 1), companyId=company.id))
+    test_db.commit()
+    return test_db
+
+
+def _consumption(db, amount, start, end):
+    return Consumption(
+        amount=amount,
+        startDate=start,
+        endDate=end,
+        reportDate=end,
+        projectId=db.query(Project.id).scalar(),
+        fuelTypeId=db.query(FuelType.id).scalar(),
+    )
+
+
+def _cells(db):
+    return {
+        row.date: (round(row.amount, 6), round(row.co2, 6))
+        for row in db.query(DailyEmission).order_by(DailyEmission.date)
+    }
+
+
+def test_add_and_remove_consumption(db):
+    entry = _consumption(db, 4.0, date(2023, 1, 1), date(2023, 1, 2))
+    add_consumption(db, entry)
+    add_consumption(db, _consumption(db, 1.0, date(2023, 1, 2), date(2023, 1, 2)))
+    assert _cells(db) == {
+        date(2023, 1, 1): (2.0, 4.0),
+        date(2023, 1, 2): (3.0, 6.0),
+    }
+
+    # Removing an entry subtracts it again and drops emptied cells
+    remove_consumption(db, entry)
+    assert _cells(db) == {date(2023, 1, 2): (1.0, 2.0)}
+
+
+def test_recompute_fuel_type(db):
+    add_consumption(db, _consumption(db, 3.0, date(2023, 1, 1), date(2023, 1, 3)))
+    recompute_fuel_type(db, db.query(FuelType.id).scalar(), 10.0)
+    assert set(_cells(db).values()) == {(1.0, 10.0)}
+
+
+def test_rebuild_daily_emissions(db):
+    db.add_all(
+        [
+            _consumption(db, 4.0, date(2023, 1, 1), date(2023, 1, 2)),
+            _consumption(db, 1.0, date(2023, 1, 4), date(2023, 1, 4)),
+        ]
+    )
+    db.flush()
+    rebuild_daily_emissions(db)
+    assert _cells(db) == {
+        date(2023, 1, 1): (2.0, 4.0),
+        date(2023, 1, 2): (2.0, 4.0),
+        date(2023, 1, 4): (1.0, 2.0),
+    }
+
+
+def test_add_consumptions_matches_single_adds(db):
+    add_consumption(db, _consumption(db, 1.0, date(2023, 1, 2), date(2023, 1, 2)))
+    project_id = db.query(Project.id).scalar()
+    fuel_id = db.query(FuelType.id).scalar()
+    add_consumptions(
+        db,
+        [
+            (project_id, fuel_id, date(2023, 1, 1), date(2023, 1, 2), 4.0),
+            (project_id, fuel_id, date(2023, 1, 4), date(2023, 1, 4), 1.0),
+        ],
+    )
+    assert _cells(db) == {
+        date(2023, 1, 1): (2.0, 4.0),
+        date(2023, 1, 2): (3.0, 6.0),
+        date(2023, 1, 4): (1.0, 2.0),
+    }
@@ -0,0 +1,53 @@
+from collections import namedtuple
+from types import SimpleNamespace
+
+import pytest
+
+from utils.serialization import row_columns, row_records, wants_columnar
+
+Row = namedtuple("Row", ["id", "name", "secret"])
+
+
+def test_row_records_keeps_requested_fields_in_order():
+    rows = [Row(1, "a", "x"), Row(2, "b", "y")]
+    assert row_records(rows, ["name", "id"]) == [
+        {"name": "a", "id": 1},
+        {"name": "b", "id": 2},
+    ]
+
+
+def test_row_records_single_field():
+    assert row_records([Row(1, "a", "x")], ["id"]) == [{"id": 1}]
+
+
+def test_row_records_empty():
+    assert row_records([], ["id"]) == []
+
+
+def test_row_columns_dictionary_encodes():
+    rows = [Row(1, "a", "x"), Row(2, "b", "x"), Row(3, "a", "y")]
+    assert row_columns(rows, ["id", "name"], ["name"]) == {
+        "length": 3,
+        "columns": {"id": [1, 2, 3], "name": [0, 1, 0]},
+        "dictionaries": {"name": ["a", "b"]},
+    }
+
+
+def test_row_columns_empty():
+    assert row_columns([], ["id", "name"], ["name"]) == {
+        "length": 0,
+        "columns": {"id": [], "name": []},
+        "dictionaries": {"name": []},
+    }
+
+
+@pytest.mark.parametrize("accept,expected", [
+    ("application/vnd.columnar+json", True),
+    ("application/json, application/vnd.columnar+json;q=0.9", True),
+    ("application/vnd.columnar+json;q=0", False),
+    ("application/json", False),
+    ("", False),
+])
+def test_wants_columnar(accept, expected):
+    request = SimpleNamespace(headers={"accept": accept})
+    assert wants_columnar(request) is expected
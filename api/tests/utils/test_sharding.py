@@ -0,0 +1,243 @@
+import json
+from datetime import date
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app import app
+from database import Base, create_db_engine, get_db
+from models import (
+    ActivityType,
+    Company,
+    Consumption,
+    DailyEmission,
+    FuelType,
+    Project,
+    Unit,
+    User,
+)
+from security import get_current_user
+from utils import sharding
+from utils.rollup import add_consumption
+from utils.sharding import SHARD_ID_SPACE, ShardRegistry, entry_company, merge_sorted
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'catalog.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        companies = [Company(name="A"), Company(name="B")]
+        lookups = [
+            ActivityType(name="Metering"),
+            FuelType(name="Diesel", averageCO2Emission=2.0),
+            Unit(name="Liter"),
+        ]
+        db.add_all(companies + lookups)
+        db.flush()
+        db.add_all(
+            [
+                Project(name=f"Site {c.name}", startDate=date(2024, 1, 1), companyId=c.id)
+                for c in companies
+            ]
+            + [
+                User(
+                    firstName="Ad", lastName="Min", email="admin@x.co",
+                    passwordhash="x", role="admin", companyId=companies[0].id,
+                )
+            ]
+        )
+        db.commit()
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def shards(tmp_path, catalog, monkeypatch):
+    registry = ShardRegistry(
+        f"sqlite:///{tmp_path / 'shards' / 'company_{company_id}.db'}", catalog
+    )
+    monkeypatch.setattr(sharding, "shards", registry)
+    yield registry
+    registry.dispose()
+
+
+def _entry(project_id, amount):
+    return Consumption(
+        amount=amount,
+        startDate=date(2024, 1, 1),
+        endDate=date(2024, 1, 2),
+        reportDate=date(2024, 1, 3),
+        projectId=project_id,
+        activityTypeId=1,
+        fuelTypeId=1,
+        unitId=1,
+    )
+
+
+def test_shard_ids_and_catalog_joins(shards):
+    for company_id in shards.company_ids():
+        with shards.session(company_id) as db:
+            project_id = (
+                db.query(Project.id).filter(Project.companyId == company_id).scalar()
+            )
+            entry = _entry(project_id, 1.0)
+            db.add(entry)
+            db.commit()
+            # IDs come from the company's range, so they lead back to its shard
+            assert entry.id == company_id * SHARD_ID_SPACE + 1
+            assert entry_company(entry.id) == company_id
+            # The catalog tables are visible from the shard
+            assert entry.project.companyId == company_id
+            assert db.query(Consumption).count() == 1
+
+
+def test_fan_out_keeps_company_order(shards):
+    def count(db, name):
+        return name, db.query(Consumption).count()
+
+    assert shards.fan_out([2, 1], count, "x") == [("x", 0), ("x", 0)]
+    assert shards.company_ids(only=[2, 99]) == [2]
+
+
+def test_no_company_runs_on_the_catalog(tmp_path, shards):
+    assert shards.run(None, lambda db: db.query(Consumption).count()) == 0
+    assert not (tmp_path / "shards" / "company_None.db").exists()
+
+
+def test_move_catalog_entries_into_shards(catalog, shards):
+    with Session(catalog) as db:
+        projects = [p.id for p in db.query(Project).order_by(Project.id)]
+        for project_id, amount in ((projects[0], 1.0), (projects[1], 2.0), (projects[0], 3.0)):
+            entry = _entry(project_id, amount)
+            db.add(entry)
+            db.flush()
+            add_consumption(db, entry)
+        db.commit()
+
+    with pytest.raises(RuntimeError, match="3 consumption entries"):
+        shards.check_catalog()
+
+    assert shards.move_catalog_entries() == {1: 2, 2: 1}
+    shards.check_catalog()
+    with Session(catalog) as db:
+        assert db.query(DailyEmission).count() == 0
+    for company_id, amounts in ((1, [1.0, 3.0]), (2, [2.0])):
+        with shards.session(company_id) as db:
+            entries = db.query(Consumption).order_by(Consumption.id).all()
+            # Re-keyed into the company's range, in their old order
+            assert [e.amount for e in entries] == amounts
+            assert {entry_company(e.id) for e in entries} == {company_id}
+            total = sum(row.amount for row in db.query(DailyEmission))
+            assert total == pytest.approx(sum(amounts))
+
+
+def test_merge_sorted_orders_nulls_like_sqlite():
+    key = lambda row: (row[0], row[1])  # noqa: E731
+    merged = merge_sorted([[(None, 1), (2, 3)], [(1, 2), (3, 4)]], key)
+    assert list(merged) == [(None, 1), (1, 2), (2, 3), (3, 4)]
+    descending = merge_sorted([[(3, 4), (None, 1)], [(2, 3)]], key, descending=True)
+    assert list(descending) == [(3, 4), (2, 3), (None, 1)]
+
+
+def test_admin_requests_span_the_shards(catalog, shards):
+    client = TestClient(app)
+
+    def _get_db_override():
+        db = Session(catalog)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    with Session(catalog) as db:
+        admin = db.query(User).filter(User.role == "admin").one()
+        projects = [p.id for p in db.query(Project).order_by(Project.id)]
+    app.dependency_overrides[get_db] = _get_db_override
+    app.dependency_overrides[get_current_user] = lambda: admin
+    try:
+        entry = {
+            "startDate": "2024-01-01",
+            "endDate": "2024-01-02",
+            "reportDate": "2024-01-03",
+            "description": "",
+            "userId": admin.id,
+            "activityTypeId": 1,
+            "fuelTypeId": 1,
+            "unitId": 1,
+        }
+        for project_id, amount in ((projects[0], 5.0), (projects[1], 7.0)):
+            res = client.post(
+                "/consumption/",
+                json={**entry, "projectId": project_id, "amount": amount},
+            )
+            assert res.status_code == 200
+
+        res = client.get("/consumption/", params={"sort": "amount"})
+        assert res.status_code == 200
+        rows = res.json()
+        assert [row["amount"] for row in rows] == [5.0, 7.0]
+        assert [entry_company(row["id"]) for row in rows] == [1, 2]
+
+        # Single entries are found on their company's shard
+        res = client.get(f"/consumption/{rows[1]['id']}")
+        assert res.status_code == 200
+        assert res.json()["amount"] == 7.0
+
+        # Entries stay with their company
+        res = client.put(
+            f"/consumption/{rows[1]['id']}",
+            json={**entry, "projectId": projects[0], "amount": 1.0},
+        )
+        assert res.status_code == 400
+
+        # The company's rollup lives on its shard
+        res = client.get(
+            "/consumption/timeseries", params={"companyId": entry_company(rows[1]["id"])}
+        )
+        assert res.status_code == 200
+        assert res.json()["totalCO2"][-1] == pytest.approx(14.0)
+
+        # Exports merge the shards in the requested order
+        res = client.get(
+            "/consumption/export",
+            params={"format": "ndjson", "sort": "-amount", "fields": "amount"},
+        )
+        assert res.status_code == 200
+        assert [json.loads(line) for line in res.text.splitlines()] == [
+            {"amount": 7.0},
+            {"amount": 5.0},
+        ]
+
+        # A create-only batch goes to its project's company
+        res = client.post(
+            "/consumption/batch",
+            json={
+                "operations": [
+                    {"op": "create", "data": {**entry, "projectId": projects[0], "amount": 2.0}}
+                ]
+            },
+        )
+        assert res.status_code == 200
+        assert res.json()["created"] == 1
+        assert entry_company(res.json()["results"][0]["id"]) == 1
+
+        # Mixing companies in one batch is rejected
+        res = client.post(
+            "/consumption/batch",
+            json={
+                "operations": [
+                    {"op": "create", "data": {**entry, "projectId": project_id, "amount": 2.0}}
+                    for project_id in projects
+                ]
+            },
+        )
+        assert res.status_code == 400
+
+        # The catalog's own entry table stays empty
+        with Session(catalog) as db:
+            assert db.query(Consumption).count() == 0
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        app.dependency_overrides.pop(get_current_user, None)
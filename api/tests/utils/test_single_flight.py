@@ -0,0 +1,101 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from utils.single_flight import SingleFlight, principal_scope
+
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    calls = []
+
+    async def load(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return [value]
+
+    async def main():
+        results = await asyncio.gather(
+            flights.do("a", load, 1), flights.do("a", load, 1), flights.do("b", load, 2)
+        )
+        # Completed calls are not cached
+        again = await flights.do("a", load, 1)
+        return results, again
+
+    (first, second, other), again = asyncio.run(main())
+    assert first is second
+    assert other == [2]
+    assert again == [1] and again is not first
+    assert calls == [1, 2, 1]
+    assert len(flights) == 0
+
+
+def test_waiting_calls_share_the_exception():
+    flights = SingleFlight()
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        return await asyncio.gather(
+            flights.do("k", fail), flights.do("k", fail), return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+    assert [type(r) for r in results] == [ValueError, ValueError]
+    assert calls == [1]
+
+
+def test_waiting_call_runs_when_the_leader_is_cancelled():
+    flights = SingleFlight()
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        leader = asyncio.create_task(flights.do("k", load))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.do("k", load))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == "done"
+    assert calls == [1, 1]
+
+
+def test_forget_starts_new_calls_afresh():
+    flights = SingleFlight()
+    calls = []
+
+    async def load():
+        calls.append(1)
+        count = len(calls)
+        await asyncio.sleep(0.01)
+        return count
+
+    async def main():
+        first = asyncio.create_task(flights.do("k", load))
+        await asyncio.sleep(0)
+        flights.forget()
+        return await asyncio.gather(first, flights.do("k", load))
+
+    assert asyncio.run(main()) == [1, 2]
+
+
+def test_principal_scope():
+    admin = SimpleNamespace(role="admin", companyId=1, project_ids=[1])
+    company_admin = SimpleNamespace(role="companyadmin", companyId=2, project_ids=[])
+    user = SimpleNamespace(role="user", companyId=2, project_ids=[3, 1, 3])
+    assert principal_scope(admin) == ("admin",)
+    assert principal_scope(company_admin) == ("companyadmin", 2)
+    assert principal_scope(user) == ("user", (1, 3))
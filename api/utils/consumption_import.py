@@ -0,0 +1,461 @@
+import csv
+import io
+import json
+import math
+import os
+from datetime import date, datetime, timezone
+from tempfile import SpooledTemporaryFile
+from typing import List, Optional
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from models import ActivityType, Consumption, FuelType, Project, Unit
+from utils import sync
+from utils.rollup import add_consumptions
+
+# Lines handed to the importer at once; also the executemany batch size
+IMPORT_CHUNK_SIZE = 5000
+
+# Bytes of an upload kept in memory while it is received; larger bodies spill over
+# to a temporary file
+IMPORT_SPOOL_MAX_MEMORY = int(os.getenv("IMPORT_SPOOL_MAX_MEMORY", str(8 * 1024 * 1024)))
+
+# At most this many row errors are listed in the report (all are counted)
+IMPORT_MAX_ERRORS = 1000
+
+# Columns written for every imported row, in insert order
+IMPORT_COLUMNS = (
+    "amount",
+    "startDate",
+    "endDate",
+    "reportDate",
+    "description",
+    "userId",
+    "projectId",
+    "activityTypeId",
+    "fuelTypeId",
+    "unitId",
+)
+
+# Content types accepted by the import endpoint, mapped to their format
+IMPORT_FORMATS = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+# Characters escaped in the text format of Postgres' COPY
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+class RowError(ValueError):
+    """Raised while converting a row that cannot be imported."""
+
+
+def _key(name) -> str:
+    return str(name).strip().casefold()
+
+
+def _copy_text(value: Optional[str]) -> str:
+    """Encodes an optional string for COPY's text format (NULL is \\N)."""
+    return "\\N" if value is None else value.translate(COPY_ESCAPES)
+
+
+async def spool_body(chunks) -> SpooledTemporaryFile:
+    """
+    Receives a whole request body before it is imported, so no transaction is
+    held open while waiting on the client.
+
+    :param chunks: The request body stream.
+    :return: The body, rewound; close it when done.
+    """
+    body = SpooledTemporaryFile(max_size=IMPORT_SPOOL_MAX_MEMORY)
+    try:
+        async for chunk in chunks:
+            body.write(chunk)
+    except BaseException:
+        body.close()
+        raise
+    body.seek(0)
+    return body
+
+
+def read_batches(body, fmt: str, batch_size: int = IMPORT_CHUNK_SIZE):
+    """
+    Splits a binary file into batches for ConsumptionImporter.feed: NDJSON into
+    lines (without their line breaks), CSV into (line number, values) records.
+
+    CSV is parsed by one reader over the whole file, so quoted fields may span
+    lines (and batches); a record's line number is the one it starts on.
+
+    :param body: The spooled request body.
+    :param fmt: "csv" or "ndjson".
+    :param batch_size: Number of lines or records per yielded batch.
+    """
+    if fmt == "csv":
+        text = io.TextIOWrapper(body, encoding="utf-8-sig", errors="replace", newline="")
+        reader = csv.reader(text)
+        records = ((reader.line_num, values) for values in reader)
+        # line_num is the last line read; a record starts after the previous one
+        start = 1
+        batch = []
+        try:
+            for end, values in records:
+                batch.append((start, values))
+                start = end + 1
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        finally:
+            # Leave the body to its owner
+            text.detach()
+    else:
+        batch = []
+        for line in body:
+            batch.append(line[:-1] if line.endswith(b"\n") else line)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+class ConsumptionImporter:
+    """
+    Imports consumption entries from CSV records or NDJSON lines fed in batches
+    (see read_batches).
+
+    All lookups (project, activity type, fuel type and unit names) and the set of
+    projects the caller may write to are loaded once up front, so converting a row
+    needs no queries; resolved names and parsed dates are memoized, as imports
+    repeat the same few values on every row. Valid rows are inserted with one
+    executemany per batch (a COPY on Postgres), the daily emission rollup is
+    updated once at the end, and the whole import commits as a single transaction.
+    Rows are stamped by the first write; if the import then runs long enough for
+    a change client to sync past that stamp, finish() restamps them by ID.
+
+    :param db: The database session to import into.
+    :param current_user: The authenticated user; entries are reported by them.
+    :param fmt: "csv" (with a header line) or "ndjson".
+    :param company_id: If given, only projects of this company are accepted (e.g.
+        the company whose shard db is).
+    """
+
+    def __init__(
+        self, db: Session, current_user, fmt: str, company_id: Optional[int] = None
+    ):
+        self.db = db
+        self.user_id = current_user.id
+        self.fmt = fmt
+        self.today = date.today()
+
+        self.lookups = {
+            "activityType": self._names(ActivityType),
+            "fuelType": self._names(FuelType),
+            "unit": self._names(Unit),
+        }
+        self.ids = {
+            kind: set(names.values()) for kind, names in self.lookups.items()
+        }
+
+        # Projects the caller may add entries to, resolved once for the whole import
+        projects = db.query(Project.id, Project.name, Project.companyId).all()
+        if current_user.role == "admin":
+            allowed = {p.id for p in projects}
+        elif current_user.role == "companyadmin":
+            allowed = {p.id for p in projects if p.companyId == current_user.companyId}
+        else:
+            allowed = set(current_user.project_ids)
+        if company_id is not None:
+            allowed &= {p.id for p in projects if p.companyId == company_id}
+        self.allowed_projects = allowed
+        self.ids["project"] = {p.id for p in projects}
+        self.project_names = {}
+        for p in projects:
+            if p.id in allowed:
+                self.project_names.setdefault(_key(p.name), set()).add(p.id)
+
+        # (kind, "id" or "name", raw value) -> ID, or the error message for it
+        self._resolved = {}
+        # Raw date value -> parsed date, or None if invalid; parsed date -> ISO string
+        self._dates = {}
+        self._iso = {self.today: self.today.isoformat()}
+
+        # The change tracking stamp of every imported row, taken by the first write
+        self.updated_at: Optional[datetime] = None
+        # (first, last) ID ranges of the inserted rows
+        self._id_ranges = []
+
+        # SQLite stores dates as ISO strings; writing through the DBAPI cursor skips
+        # SQLAlchemy's per-parameter processing, which dominates large imports
+        dialect = db.get_bind().dialect
+        table = Consumption.__table__.name
+        names = IMPORT_COLUMNS + ("updatedAt",)
+        columns = ", ".join(f'"{column}"' for column in names)
+        self._raw_insert = None
+        self._copy = None
+        if dialect.name == "sqlite":
+            marks = ", ".join("?" for _ in names)
+            self._raw_insert = f'INSERT INTO "{table}" ({columns}) VALUES ({marks})'
+            column_type = Consumption.__table__.c.updatedAt.type.dialect_impl(dialect)
+            self._bind_stamp = column_type.bind_processor(dialect)
+        elif dialect.name == "postgresql":
+            # COPY streams a whole batch in one statement, much faster than INSERTs.
+            # Its IDs are drawn from the sequence up front, so they are known
+            self._copy = f'COPY "{table}" ("id", {columns}) FROM STDIN'
+            self._next_ids = text(
+                f"SELECT nextval(pg_get_serial_sequence('\"{table}\"', 'id')) "
+                "FROM generate_series(1, :count)"
+            )
+
+        self.header: Optional[List[str]] = None
+        self.line_number = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+        self._rollup = []
+
+    def _names(self, model):
+        """Maps the case-folded names of a lookup table to their IDs."""
+        names = {}
+        for id_, name in self.db.query(model.id, model.name):
+            names.setdefault(_key(name), id_)
+        return names
+
+    def feed(self, batch: list):
+        """Converts and inserts one batch from read_batches. Does not commit."""
+        rows = []
+        for record in self._records(batch):
+            try:
+                rows.append(self._convert(record))
+            except RowError as e:
+                self._fail(str(e))
+        if not rows:
+            return
+        if self.updated_at is None:
+            self.updated_at = datetime.now(timezone.utc)
+
+        if self._raw_insert is not None:
+            iso = self._iso
+            stamp = (self._bind_stamp(self.updated_at),)
+            cursor = self.db.connection().connection.cursor()
+            try:
+                cursor.executemany(
+                    self._raw_insert,
+                    [
+                        (r[0], iso[r[1]], iso[r[2]], iso[r[3]]) + r[4:] + stamp
+                        for r in rows
+                    ],
+                )
+                # The import holds the write lock, so the batch's IDs are consecutive
+                last = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+            finally:
+                cursor.close()
+            self._id_ranges.append((last - len(rows) + 1, last))
+        elif self._copy is not None:
+            self._add_ids(self._copy_rows(rows))
+        else:
+            table = Consumption.__table__
+            result = self.db.execute(
+                table.insert().returning(table.c.id),
+                [
+                    dict(zip(IMPORT_COLUMNS, r), updatedAt=self.updated_at)
+                    for r in rows
+                ],
+            )
+            self._add_ids(result.scalars())
+        self.inserted += len(rows)
+        # (projectId, fuelTypeId, startDate, endDate, amount) for the rollup
+        self._rollup.extend((r[6], r[8], r[1], r[2], r[0]) for r in rows)
+
+    def _add_ids(self, ids):
+        """Records inserted IDs as ranges of consecutive ones."""
+        for id_ in sorted(ids):
+            if self._id_ranges and self._id_ranges[-1][1] == id_ - 1:
+                self._id_ranges[-1] = (self._id_ranges[-1][0], id_)
+            else:
+                self._id_ranges.append((id_, id_))
+
+    def _copy_rows(self, rows: List[tuple]) -> List[int]:
+        """
+        Writes a batch with COPY FROM STDIN (psycopg2 or psycopg 3) and returns the
+        IDs of its rows.
+        """
+        ids = self.db.execute(self._next_ids, {"count": len(rows)}).scalars().all()
+        iso = self._iso
+        stamp = "\t" + self.updated_at.isoformat() + "\n"
+        buffer = io.StringIO()
+        buffer.writelines(
+            f"{id_}\t{r[0]!r}\t{iso[r[1]]}\t{iso[r[2]]}\t{iso[r[3]]}"
+            f"\t{_copy_text(r[4])}\t{r[5]}\t{r[6]}\t{r[7]}\t{r[8]}\t{r[9]}{stamp}"
+            for id_, r in zip(ids, rows)
+        )
+        cursor = self.db.connection().connection.cursor()
+        try:
+            if hasattr(cursor, "copy_expert"):
+                buffer.seek(0)
+                cursor.copy_expert(self._copy, buffer)
+            else:
+                with cursor.copy(self._copy) as copy:
+                    copy.write(buffer.getvalue())
+        finally:
+            cursor.close()
+        return ids
+
+    def finish(self) -> dict:
+        """Updates the rollup, commits the import and returns the report."""
+        if self.fmt == "csv" and self.header is None:
+            self._fail("Missing CSV header")
+        add_consumptions(self.db, self._rollup)
+        if self.updated_at is not None and self._stamp_outdated():
+            # A /consumption/changes client may have synced past the stamp by the
+            # time this commits, so the rows are stamped again, found by their IDs
+            table = Consumption.__table__
+            now = datetime.now(timezone.utc)
+            for first, last in self._id_ranges:
+                self.db.execute(
+                    table.update()
+                    .where(table.c.id.between(first, last))
+                    .values(updatedAt=now)
+                )
+        self.db.commit()
+        return {
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": self.errors,
+        }
+
+    def _stamp_outdated(self) -> bool:
+        """Whether the import ran for more than half of CHANGES_SETTLE_SECONDS."""
+        elapsed = datetime.now(timezone.utc) - self.updated_at
+        return elapsed.total_seconds() >= sync.CHANGES_SETTLE_SECONDS / 2
+
+    @property
+    def project_ids(self) -> set:
+        """IDs of the projects rows were imported into."""
+        return {entry[0] for entry in self._rollup}
+
+    def _fail(self, detail: str):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"line": self.line_number, "detail": detail})
+
+    def _records(self, batch: list):
+        """Yields the rows of a batch as dicts, reporting unparsable lines."""
+        if self.fmt == "csv":
+            for line_number, values in batch:
+                self.line_number = line_number
+                if not values:
+                    continue
+                if self.header is None:
+                    self.header = [name.strip() for name in values]
+                elif len(values) != len(self.header):
+                    self._fail(f"Expected {len(self.header)} columns, got {len(values)}")
+                else:
+                    yield dict(zip(self.header, values))
+            return
+
+        first_line = self.line_number
+        texts = [raw.decode("utf-8", errors="replace").rstrip("\r") for raw in batch]
+        if first_line == 0 and texts:
+            texts[0] = texts[0].lstrip("\ufeff")
+        for offset, text in enumerate(texts, start=1):
+            self.line_number = first_line + offset
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except ValueError:
+                self._fail("Invalid JSON")
+                continue
+            if not isinstance(record, dict):
+                self._fail("Expected a JSON object")
+                continue
+            yield record
+
+    def _resolve(self, kind: str, record: dict) -> int:
+        raw_id = record.get(kind + "Id")
+        if raw_id not in (None, ""):
+            key = (kind, "id", raw_id)
+        else:
+            key = (kind, "name", record.get(kind))
+        try:
+            result = self._resolved[key]
+        except KeyError:
+            result = self._resolved[key] = self._lookup(*key)
+        except TypeError:  # Unhashable JSON value
+            result = self._lookup(*key)
+        if isinstance(result, str):
+            raise RowError(result)
+        return result
+
+    def _lookup(self, kind: str, by: str, value):
+        """Resolves a lookup value to an ID, or returns an error message."""
+        if by == "id":
+            try:
+                id_ = int(value)
+            except (TypeError, ValueError):
+                return f"Invalid {kind}Id"
+            return id_ if id_ in self.ids[kind] else f"Unknown {kind}Id {id_}"
+
+        if value in (None, ""):
+            return f"Missing {kind}"
+        if kind == "project":
+            matches = self.project_names.get(_key(value), ())
+            if len(matches) > 1:
+                return f"Ambiguous project '{value}', use projectId"
+            return next(iter(matches)) if matches else f"Unknown project '{value}'"
+        id_ = self.lookups[kind].get(_key(value))
+        return id_ if id_ is not None else f"Unknown {kind} '{value}'"
+
+    def _date(self, record: dict, field: str) -> date:
+        value = record.get(field)
+        if value in (None, ""):
+            if field == "reportDate":
+                return self.today
+            raise RowError(f"Missing {field}")
+        try:
+            parsed = self._dates[value]
+        except (KeyError, TypeError):
+            try:
+                parsed = date.fromisoformat(str(value).strip())
+            except ValueError:
+                parsed = None
+            if isinstance(value, str):
+                self._dates[value] = parsed
+            if parsed is not None and parsed not in self._iso:
+                self._iso[parsed] = parsed.isoformat()
+        if parsed is None:
+            raise RowError(f"Invalid {field}")
+        return parsed
+
+    def _convert(self, record: dict) -> tuple:
+        """Converts a row into a tuple of IMPORT_COLUMNS values."""
+        project_id = self._resolve("project", record)
+        if project_id not in self.allowed_projects:
+            raise RowError("Not allowed to add to this project")
+
+        try:
+            amount = float(record.get("amount"))
+        except (TypeError, ValueError):
+            raise RowError("Invalid amount")
+        if not math.isfinite(amount):
+            raise RowError("Invalid amount")
+
+        start = self._date(record, "startDate")
+        end = self._date(record, "endDate")
+        if end < start:
+            raise RowError("endDate is before startDate")
+
+        description = record.get("description")
+        return (
+            amount,
+            start,
+            end,
+            self._date(record, "reportDate"),
+            None if description is None else str(description),
+            self.user_id,
+            project_id,
+            self._resolve("activityType", record),
+            self._resolve("fuelType", record),
+            self._resolve("unit", record),
+        )
@@ -0,0 +1,273 @@
+import os
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from logging_config import logger
+from models import EmailOutbox
+from utils.email_utils import (
+    INVITE_SUBJECT,
+    SMTP_PORT,
+    SMTP_SERVER,
+    build_invite_body,
+    build_message,
+)
+
+# Set to "false" to not start the delivery worker with the app (e.g. in tests)
+EMAIL_WORKER_ENABLED = os.getenv("EMAIL_WORKER_ENABLED", "true").lower() == "true"
+
+# Seconds between polls of the outbox when nothing woke the worker up
+EMAIL_POLL_INTERVAL = float(os.getenv("EMAIL_POLL_INTERVAL", "5"))
+
+# Messages claimed per round trip to the database
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "50"))
+
+# Retry policy: exponential backoff from the base delay, capped, then give up
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "8"))
+EMAIL_RETRY_BASE_SECONDS = int(os.getenv("EMAIL_RETRY_BASE_SECONDS", "30"))
+EMAIL_RETRY_MAX_SECONDS = int(os.getenv("EMAIL_RETRY_MAX_SECONDS", "3600"))
+
+# How long a claimed message stays reserved for the worker that claimed it
+EMAIL_CLAIM_SECONDS = 300
+
+# Statuses of messages a worker may pick up ("sending" only once its claim expired)
+CLAIMABLE_STATUSES = ("pending", "sending")
+
+# SMTP socket timeout, and idle seconds after which the connection is closed
+SMTP_TIMEOUT = 10
+SMTP_IDLE_SECONDS = 60
+
+
+def enqueue_emails(db: Session, emails) -> list:
+    """
+    Queues emails for background delivery. The rows are part of the caller's
+    transaction, so the emails are only sent if the surrounding change commits.
+    Does not commit.
+
+    :param db: The database session of the ongoing change.
+    :param emails: (recipient, subject, body) tuples.
+    :return: The queued EmailOutbox rows.
+    """
+    messages = [
+        EmailOutbox(recipient=recipient, subject=subject, body=body, status="pending")
+        for recipient, subject, body in emails
+    ]
+    db.add_all(messages)
+    # Deliver right after commit instead of waiting for the next poll
+    event.listen(db, "after_commit", lambda session: outbox_worker.wake(), once=True)
+    return messages
+
+
+def enqueue_email(db: Session, recipient: str, subject: str, body: str) -> EmailOutbox:
+    """Queues a single email for background delivery. Does not commit."""
+    return enqueue_emails(db, [(recipient, subject, body)])[0]
+
+
+def invite_email(recipient_email: str, first_name: str, last_name: str, invite_link: str):
+    """Returns the (recipient, subject, body) tuple of an invitation email."""
+    return (
+        recipient_email,
+        INVITE_SUBJECT,
+        build_invite_body(first_name, last_name, invite_link),
+    )
+
+
+def enqueue_invite_email(
+    db: Session, recipient_email: str, first_name: str, last_name: str, invite_link: str
+) -> EmailOutbox:
+    """Queues an invitation email with a unique registration link. Does not commit."""
+    return enqueue_email(
+        db, *invite_email(recipient_email, first_name, last_name, invite_link)
+    )
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Returns the backoff before the next delivery attempt after `attempts` failures."""
+    seconds = EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+    return timedelta(seconds=min(seconds, EMAIL_RETRY_MAX_SECONDS))
+
+
+class SMTPConnection:
+    """
+    A single SMTP connection that is opened lazily and reused across sends.
+
+    :param host: The SMTP server host.
+    :param port: The SMTP server port.
+    """
+
+    def __init__(self, host: str = SMTP_SERVER, port: int = SMTP_PORT):
+        self.host = host
+        self.port = port
+        self._smtp = None
+        self._last_used = 0.0
+
+    def send(self, message):
+        """Sends a message, reconnecting once if the server dropped the connection."""
+        try:
+            self._connection().send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            self._connection().send_message(message)
+        self._last_used = time.monotonic()
+
+    def close_if_idle(self):
+        """Closes the connection when it has not been used for SMTP_IDLE_SECONDS."""
+        if self._smtp is not None and (
+            time.monotonic() - self._last_used > SMTP_IDLE_SECONDS
+        ):
+            self.close()
+
+    def close(self):
+        """Closes the connection, ignoring errors from an already broken one."""
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        self._smtp = None
+
+    def _connection(self):
+        if self._smtp is None:
+            self._smtp = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        return self._smtp
+
+
+class OutboxWorker:
+    """
+    Drains the EmailOutbox table on a background thread, reusing one SMTP connection.
+
+    Messages are claimed with a conditional UPDATE, so several workers (one per
+    app process) can drain the same table without sending a message twice. A claim
+    expires after EMAIL_CLAIM_SECONDS, which recovers messages of a crashed worker.
+
+    :param session_factory: Creates the database sessions used by the worker.
+    :param connection: The SMTP connection to send through.
+    """
+
+    def __init__(self, session_factory=None, connection: SMTPConnection = None):
+        self.session_factory = session_factory
+        self.connection = connection or SMTPConnection()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts the delivery thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if self.session_factory is None:
+            from database import SessionLocal
+
+            self.session_factory = SessionLocal
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="email-outbox", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        """Stops the delivery thread and closes the SMTP connection."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.connection.close()
+
+    def wake(self):
+        """Asks the worker to look for new messages now."""
+        self._wake.set()
+
+    def run_once(self) -> int:
+        """
+        Claims and sends one batch of due messages.
+
+        :return: The number of messages processed (sent or rescheduled).
+        """
+        with self.session_factory() as db:
+            messages = self._claim(db)
+            for message in messages:
+                self._deliver(db, message)
+            return len(messages)
+
+    def _claim(self, db: Session):
+        now = datetime.now(timezone.utc)
+        candidates = [
+            message_id
+            for (message_id,) in db.query(EmailOutbox.id)
+            .filter(
+                EmailOutbox.status.in_(CLAIMABLE_STATUSES),
+                EmailOutbox.nextAttemptAt <= now,
+            )
+            .order_by(EmailOutbox.nextAttemptAt, EmailOutbox.id)
+            .limit(EMAIL_BATCH_SIZE)
+        ]
+        claimed = []
+        for message_id in candidates:
+            # Only one worker wins the update of a given due row
+            won = (
+                db.query(EmailOutbox)
+                .filter(
+                    EmailOutbox.id == message_id,
+                    EmailOutbox.nextAttemptAt <= now,
+                    EmailOutbox.status.in_(CLAIMABLE_STATUSES),
+                )
+                .update(
+                    {
+                        EmailOutbox.status: "sending",
+                        EmailOutbox.nextAttemptAt: now
+                        + timedelta(seconds=EMAIL_CLAIM_SECONDS),
+                    },
+                    synchronize_session=False,
+                )
+            )
+            if won:
+                claimed.append(message_id)
+        db.commit()
+        if not claimed:
+            return []
+        return db.query(EmailOutbox).filter(EmailOutbox.id.in_(claimed)).all()
+
+    def _deliver(self, db: Session, message: EmailOutbox):
+        message.attempts += 1
+        try:
+            self.connection.send(
+                build_message(message.recipient, message.subject, message.body)
+            )
+        except (smtplib.SMTPException, OSError) as e:
+            # Drop the connection so the next attempt starts from a clean one
+            self.connection.close()
+            message.lastError = str(e)
+            if message.attempts >= EMAIL_MAX_ATTEMPTS:
+                message.status = "failed"
+                logger.error(f"Giving up on email {message.id} to {message.recipient}: {e}")
+            else:
+                message.status = "pending"
+                message.nextAttemptAt = datetime.now(timezone.utc) + retry_delay(message.attempts)
+                logger.warning(f"Email {message.id} to {message.recipient} failed: {e}")
+        else:
+            message.status = "sent"
+            message.sentAt = datetime.now(timezone.utc)
+            message.lastError = None
+            logger.info(f"Email {message.id} sent to {message.recipient}")
+        db.commit()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.run_once()
+            except Exception as e:
+                logger.error(f"Email outbox worker error: {e}")
+                processed = 0
+            if processed:
+                continue  # There may be more due messages
+            self.connection.close_if_idle()
+            self._wake.wait(EMAIL_POLL_INTERVAL)
+            self._wake.clear()
+
+
+# The worker of this process; started and stopped by the app lifespan
+outbox_worker = OutboxWorker()
@@ -1,33 +1,26 @@
+import os
 import smtplib
 from email.message import EmailMessage
 
 # MailHog SMTP Configuration
-SMTP_SERVER = "mailhog"
-SMTP_PORT = 1025  # MailHog's default SMTP port
+SMTP_SERVER = os.getenv("SMTP_HOST", "mailhog")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "1025"))  # MailHog's default SMTP port
 
 SENDER_EMAIL = "no-reply@example.com"
 SENDER_NAME = "CARMA"
 
+INVITE_SUBJECT = "You're invited to use CARMA"
 
-def send_invite_email(
-    recipient_email: str, first_name: str, last_name: str, invite_link: str
-):
+
+def build_invite_body(first_name: str, last_name: str, invite_link: str) -> str:
     """
-    Sends an invitation email with a unique registration link.
+    Renders the text of an invitation email.
 
-    :param recipient_email: The email of the invitee.
     :param first_name: First name of the invitee.
     :param last_name: Last name of the invitee.
     :param invite_link: The unique invitation link.
     """
-    try:
-        # Create email message
-        msg = EmailMessage()
-        msg["Subject"] = "You're invited to use CARMA"
-        msg["From"] = f"{SENDER_NAME} <{SENDER_EMAIL}>"
-        msg["To"] = recipient_email
-        msg.set_content(
-            f"""
+    return f"""
         Hello {first_name} {last_name},
 
         You have been invited to use CARMA (carbon emission data managing tool). Click the link below to complete your registration:
@@ -39,6 +32,43 @@ def send_invite_email(
         Best regards,  
         {SENDER_NAME}
         """
+
+
+def build_message(recipient_email: str, subject: str, body: str) -> EmailMessage:
+    """
+    Builds an email message from the configured sender.
+
+    :param recipient_email: The email of the recipient.
+    :param subject: The subject line.
+    :param body: The plain text content.
+    """
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg["From"] = f"{SENDER_NAME} <{SENDER_EMAIL}>"
+    msg["To"] = recipient_email
+    msg.set_content(body)
+    return msg
+
+
+def send_invite_email(
+    recipient_email: str, first_name: str, last_name: str, invite_link: str
+):
+    """
+    Sends an invitation email with a unique registration link right away, over a
+    fresh SMTP connection. Request handlers queue emails through
+    utils.email_outbox.enqueue_invite_email instead.
+
+    :param recipient_email: The email of the invitee.
+    :param first_name: First name of the invitee.
+    :param last_name: Last name of the invitee.
+    :param invite_link: The unique invitation link.
+    """
+    try:
+        # Create email message
+        msg = build_message(
+            recipient_email,
+            INVITE_SUBJECT,
+            build_invite_body(first_name, last_name, invite_link),
         )
 
         # Connect to SMTP server and send email
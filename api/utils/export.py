@@ -0,0 +1,90 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date
+from itertools import islice
+from typing import Iterable, Iterator, Sequence
+import orjson
+from utils.serialization import COLUMNAR_MEDIA_TYPE, row_columns
+
+# Rows fetched from the database cursor and encoded per chunk
+EXPORT_BATCH_SIZE = 1000
+
+# Supported export formats, mapped to their media types and file extensions
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "columnar": (COLUMNAR_MEDIA_TYPE, "columnar.ndjson"),
+}
+
+
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def csv_chunks(rows: Iterable, columns: Sequence[str]) -> Iterator[bytes]:
+    """
+    Encode rows as CSV with a header line, one chunk per EXPORT_BATCH_SIZE rows.
+
+    :param rows: Row objects exposing the columns as attributes.
+    :param columns: The columns to write, in order.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow([getattr(row, column) for column in columns])
+        count += 1
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def ndjson_chunks(rows: Iterable, columns: Sequence[str]) -> Iterator[bytes]:
+    """Encode rows as one JSON object per line, one chunk per EXPORT_BATCH_SIZE rows."""
+    lines = []
+    for row in rows:
+        lines.append(
+            json.dumps(
+                {column: getattr(row, column) for column in columns},
+                default=_json_default,
+            )
+        )
+        if len(lines) == EXPORT_BATCH_SIZE:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def columnar_chunks(
+    rows: Iterable, columns: Sequence[str], dictionary_fields: Sequence[str] = ()
+) -> Iterator[bytes]:
+    """
+    Encode rows as one columnar JSON object (see row_columns) per line, each
+    holding up to EXPORT_BATCH_SIZE rows. Every batch carries its own
+    dictionaries, so lines can be decoded independently.
+    """
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, EXPORT_BATCH_SIZE))
+        if not batch:
+            return
+        yield orjson.dumps(row_columns(batch, columns, dictionary_fields)) + b"\n"
+
+
+def gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Compress a stream of chunks into a single gzip stream as they are produced."""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,25 @@
+from typing import Optional, Sequence, Tuple
+from fastapi import HTTPException
+
+
+def parse_fields(fields: Optional[str], available: Sequence[str]) -> Tuple[str, ...]:
+    """
+    Resolves a sparse fieldset parameter such as "id,name" against the fields a
+    list endpoint can return.
+
+    :param fields: Comma-separated field names, or None for all fields.
+    :param available: The endpoint's fields, in response order.
+    :return: The requested fields, in response order.
+    :raises HTTPException: If a field is unknown or none is given.
+    """
+    if fields is None:
+        return tuple(available)
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested.difference(available)
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+        )
+    if not requested:
+        raise HTTPException(status_code=400, detail="No fields requested")
+    return tuple(name for name in available if name in requested)
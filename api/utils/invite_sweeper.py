@@ -0,0 +1,127 @@
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.orm import Session
+from logging_config import logger
+from models import Invite
+
+INVITE_EXPIRATION_DAYS = 30  # Number of days after which an invite expires
+
+# Set to "false" to not start the sweeper with the app (e.g. in tests)
+INVITE_SWEEPER_ENABLED = os.getenv("INVITE_SWEEPER_ENABLED", "true").lower() == "true"
+
+# Seconds between sweeps, and invites deleted per transaction
+INVITE_SWEEP_INTERVAL = float(os.getenv("INVITE_SWEEP_INTERVAL", "3600"))
+INVITE_SWEEP_BATCH_SIZE = int(os.getenv("INVITE_SWEEP_BATCH_SIZE", "500"))
+
+
+def invite_expiry_threshold() -> datetime:
+    """Returns the creation time before which an invite counts as expired."""
+    return datetime.now(timezone.utc) - timedelta(days=INVITE_EXPIRATION_DAYS)
+
+
+class InviteSweeper:
+    """
+    Periodically deletes expired invites on a background thread.
+
+    Each batch is deleted in its own short transaction, so the sweep never holds
+    SQLite's write lock for long. Reads do not depend on the sweeper: they filter
+    expired invites out by createdAt themselves.
+
+    :param session_factory: Creates the database sessions used by the sweeper.
+    """
+
+    def __init__(self, session_factory=None):
+        self.session_factory = session_factory
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._metrics = {
+            "runs": 0,
+            "purgedTotal": 0,
+            "lastPurged": 0,
+            "lastRunAt": None,
+            "lastError": None,
+        }
+
+    def start(self):
+        """Starts the sweeper thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if self.session_factory is None:
+            from database import SessionLocal
+
+            self.session_factory = SessionLocal
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="invite-sweeper", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        """Stops the sweeper thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_once(self) -> int:
+        """
+        Deletes all currently expired invites, one batch per transaction.
+
+        :return: The number of invites deleted.
+        """
+        threshold = invite_expiry_threshold()
+        purged = 0
+        with self.session_factory() as db:
+            while True:
+                deleted = self._delete_batch(db, threshold)
+                purged += deleted
+                if deleted < INVITE_SWEEP_BATCH_SIZE:
+                    break
+
+        with self._lock:
+            self._metrics["runs"] += 1
+            self._metrics["purgedTotal"] += purged
+            self._metrics["lastPurged"] = purged
+            self._metrics["lastRunAt"] = datetime.now(timezone.utc)
+            self._metrics["lastError"] = None
+        if purged:
+            logger.info(f"Invite sweeper purged {purged} expired invites")
+        return purged
+
+    def metrics(self) -> dict:
+        """Returns a snapshot of the sweeper's counters."""
+        with self._lock:
+            return {**self._metrics, "running": self._thread is not None}
+
+    def _delete_batch(self, db: Session, threshold: datetime) -> int:
+        ids = [
+            invite_id
+            for (invite_id,) in db.query(Invite.id)
+            .filter(Invite.createdAt < threshold)
+            .limit(INVITE_SWEEP_BATCH_SIZE)
+        ]
+        if not ids:
+            return 0
+        deleted = (
+            db.query(Invite)
+            .filter(Invite.id.in_(ids), Invite.createdAt < threshold)
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+        return deleted
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Invite sweeper error: {e}")
+                with self._lock:
+                    self._metrics["lastError"] = str(e)
+            self._stop.wait(INVITE_SWEEP_INTERVAL)
+
+
+# The sweeper of this process; started and stopped by the app lifespan
+invite_sweeper = InviteSweeper()
@@ -0,0 +1,81 @@
+import base64
+import json
+from datetime import date
+from fastapi import HTTPException
+from sqlalchemy import Date, and_, or_
+
+# Upper bound for the page size a client may request
+MAX_PAGE_SIZE = 500
+
+# Response header carrying the cursor for the next page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(sort: str, value, row_id: int) -> str:
+    """
+    Encodes the keyset position of the last row on a page into an opaque cursor.
+
+    :param sort: The sort key the page was produced with.
+    :param value: The sort column value of the last row returned.
+    :param row_id: The id of the last row returned (tie-breaker).
+    :return: A URL-safe cursor string.
+    """
+    if isinstance(value, date):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str):
+    """
+    Decodes a cursor produced by encode_cursor back into its keyset position.
+
+    :param cursor: The opaque cursor received from the client.
+    :param sort: The sort key of the current request; must match the cursor's.
+    :return: A (value, id) tuple. Date values are returned as ISO strings.
+    :raises HTTPException: If the cursor is malformed or was issued for another sort.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Only what encode_cursor produces: a scalar value and an integer id
+    if type(row_id) is not int or not (
+        value is None or type(value) in (str, int, float)
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if cursor_sort != sort:
+        raise HTTPException(status_code=400, detail="Cursor does not match sort order")
+
+    return value, row_id
+
+
+def _matches_type(column, value) -> bool:
+    """Whether a cursor value can be compared with the column."""
+    try:
+        expected = column.type.python_type
+    except NotImplementedError:
+        return True
+    if expected is float:
+        return type(value) in (int, float)
+    return isinstance(value, expected) and type(value) is not bool
+
+
+def keyset_filter(column, id_column, value, row_id: int, descending: bool):
+    """
+    Builds the WHERE clause selecting rows strictly after (value, row_id) in the
+    ordering (column, id_column), both ascending or both descending.
+    """
+    if isinstance(column.type, Date) and isinstance(value, str):
+        try:
+            value = date.fromisoformat(value)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    if value is not None and not _matches_type(column, value):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if descending:
+        return or_(column < value, and_(column == value, id_column < row_id))
+    return or_(column > value, and_(column == value, id_column > row_id))
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Callable, Optional
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from utils.cache import TTLCache
+
+# Upper bound (in seconds) on how long a cached reference list is served. Writes in
+# this worker invalidate immediately; the TTL bounds staleness across workers.
+REFERENCE_CACHE_TTL = int(os.getenv("REFERENCE_CACHE_TTL", "300"))
+
+# Bumped on every write to companies, activity types, fuel types or units
+_version = 0
+_version_lock = threading.Lock()
+
+# Cache key -> (version, encoded JSON body, ETag)
+_entries = TTLCache(maxsize=16, ttl=REFERENCE_CACHE_TTL)
+
+
+def current_version() -> int:
+    """Returns the current reference data version."""
+    return _version
+
+
+def invalidate_reference_data():
+    """
+    Marks every cached reference list as stale. Call it after committing a change
+    to companies, activity types, fuel types or units.
+    """
+    global _version
+    with _version_lock:
+        _version += 1
+
+
+def cached_payload(key: str, loader: Callable):
+    """
+    Returns the encoded JSON body and ETag of a reference list, loading and
+    encoding it only when the cached copy is missing or outdated.
+
+    :param key: The cache key of the list.
+    :param loader: Returns the data to serialize on a cache miss.
+    :return: A (body, etag) tuple.
+    """
+    # Capture the version before loading, so data read concurrently with a write
+    # is stored under the old version and discarded on the next request
+    version = current_version()
+    entry = _entries.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1], entry[2]
+
+    body = json.dumps(
+        jsonable_encoder(loader()),
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    _entries.set(key, (version, body, etag))
+    return body, etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Checks an If-None-Match header against an ETag (weak comparison)."""
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def reference_response(request: Request, key: str, loader: Callable) -> Response:
+    """
+    Serves a cached reference list with an ETag, answering 304 Not Modified when
+    the client already holds the current representation.
+
+    :param request: The incoming request, inspected for If-None-Match.
+    :param key: The cache key of the list.
+    :param loader: Returns the data to serialize on a cache miss.
+    """
+    body, etag = cached_payload(key, loader)
+    # Clients may store the response but must revalidate it before reuse
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def clear_reference_cache():
+    """Drops all cached reference lists."""
+    _entries.clear()
@@ -0,0 +1,251 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Sequence
+from fastapi.concurrency import run_in_threadpool
+from logging_config import logger
+from utils.cache import TTLCache
+
+# Seconds a cached aggregate is served as is
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "5"))
+
+# Seconds after the TTL during which the stale payload is still served right away
+# while a background task recomputes it
+RESPONSE_CACHE_STALE_SECONDS = float(os.getenv("RESPONSE_CACHE_STALE_SECONDS", "30"))
+
+# "memory" (per app worker, the default), "redis" (shared by all workers, needs the
+# redis package and works with any Redis-compatible server) or "none"
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_REDIS_URL = os.getenv(
+    "RESPONSE_CACHE_REDIS_URL", "redis://localhost:6379/0"
+)
+
+# Entries kept by the memory backend; the least recently used are evicted first
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+
+# Tag of every emission aggregate, e.g. for emission factor changes
+EMISSIONS_TAG = "emissions"
+
+
+def project_tag(project_id: int) -> str:
+    """Tag of the cached aggregates that include a project's entries."""
+    return f"project:{project_id}"
+
+
+def company_tag(company_id: int) -> str:
+    """Tag of the cached aggregates that include a company's entries."""
+    return f"company:{company_id}"
+
+
+class MemoryBackend:
+    """
+    Response cache storage in this process, so each app worker caches and
+    invalidates on its own.
+
+    A backend stores byte values under string keys with a lifetime (get_many, set,
+    clear) and keeps integer counters (incr; read back through get_many).
+    """
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self._entries = TTLCache(maxsize=maxsize, ttl=0)
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: Sequence[str]) -> List:
+        values = []
+        for key in keys:
+            value = self._counters.get(key)
+            values.append(self._entries.get(key) if value is None else value)
+        return values
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self._entries.set(key, value, ttl=ttl)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def clear(self):
+        self._entries.clear()
+
+
+class RedisBackend:
+    """
+    Response cache storage on a Redis-compatible server, shared by every worker.
+
+    :param client: A redis.Redis client, or an object with the same mget, set,
+        incr, scan_iter and delete methods (e.g. a stand-in in tests).
+    :param prefix: Prepended to every key.
+    """
+
+    # The client blocks on the network: call it from the threadpool
+    blocking = True
+
+    def __init__(self, client, prefix: str = "response-cache:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str):
+        import redis
+
+        return cls(redis.Redis.from_url(url))
+
+    def get_many(self, keys: Sequence[str]) -> List:
+        return self.client.mget([self.prefix + key for key in keys])
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self.client.set(self.prefix + key, value, px=max(1, int(ttl * 1000)))
+
+    def incr(self, key: str) -> int:
+        return self.client.incr(self.prefix + key)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+class ResponseCache:
+    """
+    Stale-while-revalidate cache of encoded responses, invalidated by tags.
+
+    An entry is served as is for `ttl` seconds. For `stale_seconds` after that it
+    is still served right away, while a background task recomputes it (at most one
+    per key and worker). Older entries are recomputed before responding.
+
+    Every tag has a version counter in the backend, which invalidate() increments;
+    entries record the versions of their tags at the time they were computed, and
+    are not served once one of them has moved on. Versions are read before
+    computing, so data read concurrently with a write is not kept.
+
+    :param backend: A MemoryBackend or RedisBackend; None disables caching.
+    """
+
+    def __init__(
+        self,
+        backend,
+        ttl: float = RESPONSE_CACHE_TTL,
+        stale_seconds: float = RESPONSE_CACHE_STALE_SECONDS,
+    ):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_seconds = stale_seconds
+        # Keys being refreshed in the background by this worker, and their tasks
+        self._refreshing = set()
+        self._tasks = set()
+
+    async def _call(self, fn: Callable, *args):
+        if getattr(self.backend, "blocking", False):
+            return await run_in_threadpool(fn, *args)
+        return fn(*args)
+
+    async def get(
+        self,
+        key: tuple,
+        tags: Iterable[str],
+        compute: Callable[[], Awaitable[bytes]],
+        refresh: Optional[Callable[[], Awaitable[bytes]]] = None,
+    ) -> bytes:
+        """
+        Returns the cached payload for key, computing it if needed.
+
+        :param key: JSON-serializable values identifying the payload.
+        :param tags: Tags whose invalidation makes the payload outdated.
+        :param compute: Computes the payload on a miss.
+        :param refresh: Computes the payload in the background; it runs after the
+            response is sent, so it must not use the request's session. Defaults
+            to compute.
+        """
+        if self.backend is None:
+            return await compute()
+
+        key = "entry:" + json.dumps(key, default=str, separators=(",", ":"))
+        tags = sorted(set(tags))
+        try:
+            raw, *versions = await self._call(
+                self.backend.get_many, [key] + ["tag:" + tag for tag in tags]
+            )
+        except Exception as e:
+            # Serve uncached while the backend is unavailable
+            logger.error(f"Response cache read failed: {e}")
+            return await compute()
+        versions = {tag: int(version or 0) for tag, version in zip(tags, versions)}
+
+        if raw is not None:
+            header, _, body = raw.partition(b"\n")
+            header = json.loads(header)
+            age = time.time() - header["created"]
+            if header["tags"] == versions and age < self.ttl + self.stale_seconds:
+                if age >= self.ttl:
+                    self._revalidate(key, versions, refresh or compute)
+                return body
+
+        return await self._store(key, versions, compute)
+
+    async def _store(self, key: str, versions: dict, compute: Callable) -> bytes:
+        created = time.time()
+        body = await compute()
+        header = json.dumps({"created": created, "tags": versions}).encode()
+        try:
+            await self._call(
+                self.backend.set,
+                key,
+                header + b"\n" + body,
+                self.ttl + self.stale_seconds,
+            )
+        except Exception as e:
+            logger.error(f"Response cache write failed: {e}")
+        return body
+
+    def _revalidate(self, key: str, versions: dict, refresh: Callable):
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        task = asyncio.create_task(self._store(key, versions, refresh))
+        self._tasks.add(task)
+
+        def done(task):
+            self._tasks.discard(task)
+            self._refreshing.discard(key)
+            if not task.cancelled() and task.exception() is not None:
+                logger.warning(f"Response cache refresh failed: {task.exception()}")
+
+        task.add_done_callback(done)
+
+    def invalidate(self, tags: Iterable[str]):
+        """
+        Marks the entries with any of the tags as outdated. Call it after committing
+        a change to the data they include; it blocks on a network backend.
+        """
+        if self.backend is None:
+            return
+        try:
+            for tag in set(tags):
+                self.backend.incr("tag:" + tag)
+        except Exception as e:
+            # The change is committed; entries expire after ttl + stale_seconds
+            logger.error(f"Response cache invalidation failed: {e}")
+
+    def clear(self):
+        """Drops all entries."""
+        if self.backend is not None:
+            self.backend.clear()
+
+
+def create_backend(name: str = RESPONSE_CACHE_BACKEND):
+    """The backend configured by RESPONSE_CACHE_BACKEND, or None for "none"."""
+    if name == "none":
+        return None
+    if name == "redis":
+        return RedisBackend.from_url(RESPONSE_CACHE_REDIS_URL)
+    if name == "memory":
+        return MemoryBackend()
+    raise ValueError(f"Unknown response cache backend '{name}'")
+
+
+# The cache of the dashboard aggregate endpoints
+response_cache = ResponseCache(create_backend())
@@ -0,0 +1,217 @@
+from collections import defaultdict
+from datetime import timedelta
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from models import Consumption, DailyEmission, FuelType
+from utils.timeseries import prorate_daily
+
+# Rollup cells whose amount falls below this are treated as empty and removed
+EPSILON = 1e-9
+
+# INSERT constructs supporting ON CONFLICT DO UPDATE, per dialect
+UPSERT_INSERTS = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}
+
+
+def daily_contributions(consumption, factor: float, sign: int = 1):
+    """
+    Split one consumption entry into its per-day rollup contributions.
+
+    :param consumption: Any object with projectId, fuelTypeId, amount, startDate and endDate.
+    :param factor: The fuel type's averageCO2Emission.
+    :param sign: +1 to add the entry, -1 to remove it.
+    :return: A list of rollup row dicts.
+    """
+    days = (consumption.endDate - consumption.startDate).days + 1
+    if days <= 0:
+        return []
+    rate = sign * consumption.amount / days
+    return [
+        {
+            "projectId": consumption.projectId,
+            "fuelTypeId": consumption.fuelTypeId,
+            "date": consumption.startDate + timedelta(days=offset),
+            "amount": rate,
+            "co2": rate * factor,
+        }
+        for offset in range(days)
+    ]
+
+
+def apply_contributions(db: Session, rows):
+    """
+    Add rollup contributions in one executemany upsert, merging rows that hit the
+    same (projectId, date, fuelTypeId) cell first. Does not commit.
+    """
+    merged = defaultdict(lambda: [0.0, 0.0])
+    for row in rows:
+        cell = merged[(row["projectId"], row["date"], row["fuelTypeId"])]
+        cell[0] += row["amount"]
+        cell[1] += row["co2"]
+    if not merged:
+        return
+
+    stmt = UPSERT_INSERTS[db.get_bind().dialect.name](DailyEmission)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["projectId", "date", "fuelTypeId"],
+        set_={
+            "amount": DailyEmission.amount + stmt.excluded.amount,
+            "co2": DailyEmission.co2 + stmt.excluded.co2,
+        },
+    )
+    db.execute(
+        stmt,
+        [
+            {
+                "projectId": project_id,
+                "date": day,
+                "fuelTypeId": fuel_type_id,
+                "amount": amount,
+                "co2": co2,
+            }
+            for (project_id, day, fuel_type_id), (amount, co2) in merged.items()
+        ],
+    )
+
+    # Drop cells that were emptied by removals
+    db.query(DailyEmission).filter(
+        DailyEmission.projectId.in_({key[0] for key in merged}),
+        DailyEmission.date.between(
+            min(key[1] for key in merged), max(key[1] for key in merged)
+        ),
+        func.abs(DailyEmission.amount) < EPSILON,
+    ).delete(synchronize_session=False)
+
+
+def _fuel_factor(db: Session, fuel_type_id: int) -> float:
+    factor = (
+        db.query(FuelType.averageCO2Emission)
+        .filter(FuelType.id == fuel_type_id)
+        .scalar()
+    )
+    return factor or 0.0
+
+
+def add_consumption(db: Session, consumption):
+    """Add one consumption entry to the rollup. Does not commit."""
+    factor = _fuel_factor(db, consumption.fuelTypeId)
+    apply_contributions(db, daily_contributions(consumption, factor))
+
+
+def remove_consumption(db: Session, consumption):
+    """Remove one consumption entry from the rollup. Does not commit."""
+    factor = _fuel_factor(db, consumption.fuelTypeId)
+    apply_contributions(db, daily_contributions(consumption, factor, sign=-1))
+
+
+def recompute_fuel_type(db: Session, fuel_type_id: int, factor: float):
+    """
+    Re-derive the CO2 of every rollup cell of a fuel type after its emission
+    factor changed. Amounts are unaffected, so this is a single UPDATE. Does not commit.
+    """
+    db.query(DailyEmission).filter(DailyEmission.fuelTypeId == fuel_type_id).update(
+        {DailyEmission.co2: DailyEmission.amount * factor},
+        synchronize_session=False,
+    )
+
+
+def prorated_cells(project_id, start_dates, end_dates, amounts, fuel_ids, factors):
+    """
+    Prorate many entries of one project over their days at once and return the
+    resulting rollup rows, one per non-empty (date, fuel type) cell.
+
+    :param project_id: The project all entries belong to.
+    :param start_dates: First day of each entry's period.
+    :param end_dates: Last day of each entry's period.
+    :param amounts: Amount of each entry.
+    :param fuel_ids: Fuel type of each entry.
+    :param factors: Fuel type ID -> averageCO2Emission.
+    :return: A list of rollup row dicts.
+    """
+    fuel_order = list(dict.fromkeys(fuel_ids))
+    position = {fuel_id: i for i, fuel_id in enumerate(fuel_order)}
+    first_day = min(start_dates)
+
+    daily = prorate_daily(
+        start_dates,
+        end_dates,
+        amounts,
+        [position[fuel_id] for fuel_id in fuel_ids],
+        len(fuel_order),
+        first_day,
+        max(end_dates),
+    )
+    rows, offsets = np.nonzero(np.abs(daily) >= EPSILON)
+    return [
+        {
+            "projectId": project_id,
+            "date": first_day + timedelta(days=int(offset)),
+            "fuelTypeId": fuel_order[row],
+            "amount": float(daily[row, offset]),
+            "co2": float(daily[row, offset]) * (factors.get(fuel_order[row]) or 0.0),
+        }
+        for row, offset in zip(rows, offsets)
+    ]
+
+
+def add_consumptions(db: Session, entries):
+    """
+    Add many consumption entries to the rollup at once, e.g. after a bulk import.
+    The entries of each project are prorated together and every touched cell is
+    upserted once. Does not commit.
+
+    :param entries: (projectId, fuelTypeId, startDate, endDate, amount) tuples.
+    """
+    by_project = defaultdict(list)
+    for project_id, fuel_type_id, start, end, amount in entries:
+        by_project[project_id].append((start, end, amount, fuel_type_id))
+    if not by_project:
+        return
+
+    factors = dict(db.query(FuelType.id, FuelType.averageCO2Emission).all())
+    rows = []
+    for project_id, project_entries in by_project.items():
+        start_dates, end_dates, amounts, fuel_ids = zip(*project_entries)
+        rows.extend(
+            prorated_cells(
+                project_id, start_dates, end_dates, amounts, fuel_ids, factors
+            )
+        )
+    apply_contributions(db, rows)
+
+
+def rebuild_daily_emissions(db: Session, skip_deleted: bool = True):
+    """
+    Rebuild the whole rollup from the live (not soft-deleted) rows of the
+    Consumption table, one project at a time. Used to backfill existing databases.
+    Does not commit.
+
+    :param skip_deleted: False for schemas that predate soft deletes (no deletedAt).
+    """
+    db.query(DailyEmission).delete(synchronize_session=False)
+    factors = dict(db.query(FuelType.id, FuelType.averageCO2Emission).all())
+    project_ids = [
+        project_id for (project_id,) in db.query(Consumption.projectId).distinct()
+    ]
+
+    for project_id in project_ids:
+        query = db.query(
+            Consumption.startDate,
+            Consumption.endDate,
+            Consumption.amount,
+            Consumption.fuelTypeId,
+        ).filter(Consumption.projectId == project_id)
+        if skip_deleted:
+            query = query.filter(Consumption.deletedAt.is_(None))
+        entries = query.all()
+        if not entries:
+            continue
+        start_dates, end_dates, amounts, fuel_ids = zip(*entries)
+        db.bulk_insert_mappings(
+            DailyEmission,
+            prorated_cells(
+                project_id, start_dates, end_dates, amounts, fuel_ids, factors
+            ),
+        )
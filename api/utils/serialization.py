@@ -0,0 +1,85 @@
+from operator import itemgetter
+from typing import Dict, Iterable, List, Sequence
+from fastapi import Request
+
+# Media type of the columnar JSON layout, selected through the Accept header
+COLUMNAR_MEDIA_TYPE = "application/vnd.columnar+json"
+
+
+def row_records(rows: List, fields: Sequence[str]) -> List[dict]:
+    """
+    Turn query result rows into plain dicts holding only the given fields.
+
+    Row values come straight from the database with the types the response
+    schema declares, so they are not validated again; the field positions are
+    resolved once for the whole result instead of per row.
+
+    :param rows: Rows of a single query, e.g. from Query.all().
+    :param fields: The keys to keep, in output order.
+    """
+    if not rows:
+        return []
+    keys = rows[0]._fields
+    positions = [keys.index(field) for field in fields]
+    if not positions:
+        return [{} for _ in rows]
+    if len(positions) == 1:
+        return [{fields[0]: row[positions[0]]} for row in rows]
+    values = itemgetter(*positions)
+    return [dict(zip(fields, values(row))) for row in rows]
+
+
+def row_columns(
+    rows: List, fields: Sequence[str], dictionary_fields: Iterable[str] = ()
+) -> dict:
+    """
+    Turn query result rows into a columnar layout: one array per field.
+
+    Fields listed in dictionary_fields are dictionary-encoded: their column holds
+    indexes into a list of the distinct values, in order of first appearance.
+
+        {"length": 2,
+         "columns": {"id": [1, 2], "project": [0, 0]},
+         "dictionaries": {"project": ["Site A"]}}
+
+    :param rows: Rows of a single query, e.g. from Query.all().
+    :param fields: The columns to keep, in output order.
+    :param dictionary_fields: The columns to dictionary-encode.
+    """
+    encoded = [field for field in fields if field in set(dictionary_fields)]
+    if not rows:
+        return {
+            "length": 0,
+            "columns": {field: [] for field in fields},
+            "dictionaries": {field: [] for field in encoded},
+        }
+
+    keys = rows[0]._fields
+    # zip(*rows) transposes the rows in C; columns not asked for are dropped after
+    transposed = dict(zip(keys, zip(*rows)))
+    columns: Dict[str, list] = {}
+    dictionaries: Dict[str, list] = {}
+    for field in fields:
+        values = transposed[field]
+        if field in encoded:
+            # dict.fromkeys keeps the first-appearance order of the distinct values
+            index = {value: i for i, value in enumerate(dict.fromkeys(values))}
+            dictionaries[field] = list(index)
+            columns[field] = [index[value] for value in values]
+        else:
+            columns[field] = list(values)
+    return {"length": len(rows), "columns": columns, "dictionaries": dictionaries}
+
+
+def wants_columnar(request: Request) -> bool:
+    """Returns whether the request's Accept header asks for the columnar layout."""
+    accept = request.headers.get("accept", "")
+    for media_range in accept.split(","):
+        media_type, _, params = media_range.partition(";")
+        if media_type.strip().lower() == COLUMNAR_MEDIA_TYPE:
+            # An explicit q=0 means "not acceptable"
+            return not any(
+                param.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+                for param in params.split(";")
+            )
+    return False
@@ -0,0 +1,276 @@
+import heapq
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional
+from sqlalchemy import MetaData, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, sessionmaker
+from database import Base, create_db_engine, engine as catalog_engine
+from models import Company, Consumption, DailyEmission, Project
+
+# Shard-per-company mode: every company's consumption entries and daily emission
+# rollup live in a database of their own, e.g.
+# sqlite:///../shards/company_{company_id}.db. Unset keeps everything in one database
+SHARD_DATABASE_URL_TEMPLATE = os.getenv("SHARD_DATABASE_URL_TEMPLATE") or None
+
+# Threads querying the shards of a cross-company (admin) request in parallel
+SHARD_FANOUT_WORKERS = int(os.getenv("SHARD_FANOUT_WORKERS", "8"))
+
+# Consumption IDs of company c are allocated from c * SHARD_ID_SPACE upwards, so
+# the shard holding an entry follows from its ID
+SHARD_ID_SPACE = 2**32
+
+# Tables stored per company; all others stay in the catalog database
+SHARDED_TABLES = (Consumption.__table__.name, DailyEmission.__table__.name)
+
+# Name the catalog database is attached under in shard connections
+CATALOG_SCHEMA = "catalog"
+
+
+def shard_metadata() -> MetaData:
+    """
+    The schema of a shard. Consumption uses AUTOINCREMENT, so its IDs continue
+    from the company's range instead of restarting at max(id) + 1.
+    """
+    metadata = MetaData()
+    for table in Base.metadata.sorted_tables:
+        table.to_metadata(metadata)
+    metadata.tables[Consumption.__table__.name].dialect_options["sqlite"][
+        "autoincrement"
+    ] = True
+    return metadata
+
+
+def entry_company(entry_id: int) -> int:
+    """The company whose shard holds the consumption entry with this ID."""
+    return entry_id // SHARD_ID_SPACE
+
+
+class ShardRegistry:
+    """
+    Opens and caches one engine per company shard.
+
+    Shards are SQLite databases with the catalog database ATTACHed, so queries on
+    a shard session join companies, users, projects and the lookup tables from
+    the catalog unchanged; a company's writes only lock its own shard. A shard is
+    created with its tables on first use.
+
+    :param url_template: Shard URL with a {company_id} placeholder.
+    :param catalog_engine: Engine of the catalog, a SQLite database file.
+    """
+
+    def __init__(self, url_template: str, catalog_engine):
+        if make_url(url_template.format(company_id=0)).get_backend_name() != "sqlite":
+            raise ValueError("Shard databases must be SQLite")
+        if catalog_engine.dialect.name != "sqlite":
+            raise ValueError("Sharding needs a SQLite catalog database")
+        self.url_template = url_template
+        self.catalog_engine = catalog_engine
+        self.catalog_path = catalog_engine.url.database
+        self.metadata = shard_metadata()
+        self._sessions: Dict[int, sessionmaker] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=SHARD_FANOUT_WORKERS)
+
+    def _create_engine(self, company_id: int):
+        url = make_url(self.url_template.format(company_id=company_id))
+        if url.database and url.database != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(url.database)), exist_ok=True)
+        engine = create_db_engine(url.render_as_string(hide_password=False))
+
+        @event.listens_for(engine, "connect")
+        def _attach_catalog(dbapi_connection, connection_record):
+            dbapi_connection.execute(
+                f"ATTACH DATABASE ? AS {CATALOG_SCHEMA}", (self.catalog_path,)
+            )
+
+        tables = [self.metadata.tables[name] for name in SHARDED_TABLES]
+        with engine.begin() as conn:
+            self.metadata.create_all(conn, tables=tables)
+            conn.execute(
+                text(
+                    "INSERT INTO main.sqlite_sequence (name, seq) SELECT :name, :seq "
+                    "WHERE NOT EXISTS "
+                    "(SELECT 1 FROM main.sqlite_sequence WHERE name = :name)"
+                ),
+                {"name": Consumption.__table__.name, "seq": company_id * SHARD_ID_SPACE},
+            )
+        return engine
+
+    def session(self, company_id: int) -> Session:
+        """A new session on the company's shard."""
+        factory = self._sessions.get(company_id)
+        if factory is None:
+            with self._lock:
+                factory = self._sessions.get(company_id)
+                if factory is None:
+                    factory = sessionmaker(
+                        autocommit=False,
+                        autoflush=False,
+                        bind=self._create_engine(company_id),
+                    )
+                    self._sessions[company_id] = factory
+        return factory()
+
+    def company_ids(self, only: Iterable[int] = ()) -> List[int]:
+        """
+        The IDs of the companies, i.e. of the shards, from the catalog.
+
+        :param only: If given, just those of these IDs that exist.
+        """
+        with Session(self.catalog_engine) as db:
+            query = db.query(Company.id).order_by(Company.id)
+            only = set(only)
+            if only:
+                query = query.filter(Company.id.in_(only))
+            return [company_id for (company_id,) in query]
+
+    def run(self, company_id: Optional[int], fn: Callable, *args):
+        """
+        Calls fn(session, *args) on a session of the company's shard. Without a
+        company (e.g. a user not in one), this is a catalog session, whose entry
+        tables are empty in shard mode.
+        """
+        if company_id is None:
+            db = Session(self.catalog_engine)
+        else:
+            db = self.session(company_id)
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+
+    def fan_out(self, company_ids: Iterable[int], fn: Callable, *args) -> List:
+        """
+        Calls fn(session, *args) on the shards of the given companies in parallel.
+
+        :return: The results, in the order of company_ids.
+        """
+        company_ids = list(company_ids)
+        if len(company_ids) <= 1:
+            return [self.run(company_id, fn, *args) for company_id in company_ids]
+        futures = [
+            self._pool.submit(self.run, company_id, fn, *args)
+            for company_id in company_ids
+        ]
+        return [future.result() for future in futures]
+
+    def catalog_entries(self) -> int:
+        """The number of consumption entries still in the catalog database."""
+        with Session(self.catalog_engine) as db:
+            return db.query(Consumption).count()
+
+    def check_catalog(self):
+        """
+        Refuses to run shard mode over a catalog that still holds entries, which
+        every read would then miss.
+
+        :raises RuntimeError: If the catalog holds consumption entries.
+        """
+        count = self.catalog_entries()
+        if count:
+            raise RuntimeError(
+                f"The catalog database holds {count} consumption entries; move them "
+                "into the company shards with `python -m scripts.move_entries_to_shards` "
+                "before enabling SHARD_DATABASE_URL_TEMPLATE"
+            )
+
+    def move_catalog_entries(self) -> Dict[int, int]:
+        """
+        Moves the catalog's consumption entries, and the daily emission rollup of
+        their projects, into the shards of the projects' companies. Entries get
+        new IDs from their company's range, in the order of their old IDs.
+
+        Each company is moved in one transaction on its shard, which has the
+        catalog attached. Entries without a project or company stay behind.
+
+        :return: The number of entries moved per company.
+        """
+        consumption = Consumption.__table__.name
+        daily = DailyEmission.__table__.name
+        columns = ", ".join(
+            f'"{column.name}"' for column in Consumption.__table__.c if column.name != "id"
+        )
+        daily_columns = ", ".join(f'"{column.name}"' for column in DailyEmission.__table__.c)
+        in_company = (
+            f'"projectId" IN (SELECT id FROM {CATALOG_SCHEMA}."{Project.__table__.name}" '
+            'WHERE "companyId" = :company_id)'
+        )
+        moved = {}
+        for company_id in self.company_ids():
+            db = self.session(company_id)
+            try:
+                params = {"company_id": company_id}
+                result = db.execute(
+                    text(
+                        f'INSERT INTO main."{consumption}" ({columns}) '
+                        f'SELECT {columns} FROM {CATALOG_SCHEMA}."{consumption}" '
+                        f"WHERE {in_company} ORDER BY id"
+                    ),
+                    params,
+                )
+                moved[company_id] = result.rowcount
+                db.execute(
+                    text(
+                        f'INSERT INTO main."{daily}" ({daily_columns}) '
+                        f'SELECT {daily_columns} FROM {CATALOG_SCHEMA}."{daily}" '
+                        f"WHERE {in_company}"
+                    ),
+                    params,
+                )
+                for table in (consumption, daily):
+                    db.execute(
+                        text(f'DELETE FROM {CATALOG_SCHEMA}."{table}" WHERE {in_company}'),
+                        params,
+                    )
+                db.commit()
+            finally:
+                db.close()
+        return moved
+
+    def dispose(self):
+        """Closes the pooled connections of every shard."""
+        with self._lock:
+            for factory in self._sessions.values():
+                factory.kw["bind"].dispose()
+            self._sessions.clear()
+
+
+# The shards of this app, or None when sharding is off
+shards: Optional[ShardRegistry] = None
+if SHARD_DATABASE_URL_TEMPLATE:
+    shards = ShardRegistry(SHARD_DATABASE_URL_TEMPLATE, catalog_engine)
+
+
+@contextmanager
+def company_session(db: Session, company_id: Optional[int]):
+    """
+    The session holding a company's entries: a session on the company's shard,
+    closed on exit. Without sharding, and for companies that do not exist, this
+    is db itself, whose entry tables then answer as usual (e.g. nothing found).
+
+    :param db: A catalog session, e.g. from get_db.
+    """
+    if shards is None or company_id is None or db.get(Company, company_id) is None:
+        yield db
+        return
+    shard_db = shards.session(company_id)
+    try:
+        yield shard_db
+    finally:
+        shard_db.close()
+
+
+def merge_sorted(results: Iterable[List], key: Callable, descending: bool = False):
+    """
+    Merges lists that are each sorted by key into one sorted iterator. NULL keys
+    come first in ascending and last in descending order, as in SQLite.
+    """
+
+    def null_aware(row):
+        value, tiebreaker = key(row)
+        return (value is not None, value, tiebreaker)
+
+    return heapq.merge(*results, key=null_aware, reverse=descending)
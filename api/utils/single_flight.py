@@ -0,0 +1,77 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Tuple
+
+
+def principal_scope(user) -> tuple:
+    """
+    The part of a user that decides which consumption data they can see: their
+    role, plus the company of a company admin or the projects of a user.
+    """
+    if user.role == "admin":
+        return ("admin",)
+    if user.role == "companyadmin":
+        return ("companyadmin", user.companyId)
+    return (user.role, tuple(sorted(set(user.project_ids))))
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: while a call for a key is in flight, later
+    calls with the same key wait for it and share its result (or exception)
+    instead of running again. Nothing is cached once the call completes.
+
+    Calls are coalesced per event loop, i.e. per app worker. If the leading call is
+    cancelled, a waiting call runs the work itself. After a write, call forget() so
+    later calls do not join ones that may have read the data before it.
+    """
+
+    def __init__(self):
+        # (event loop, key) -> future of the call in flight
+        self._calls: Dict[Tuple[asyncio.AbstractEventLoop, Hashable], asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable], *args):
+        """
+        Awaits fn(*args), or the result of the identical call already in flight.
+
+        :param key: Identifies calls with the same result; it must cover every
+            input fn's result depends on.
+        """
+        loop = asyncio.get_running_loop()
+        call_key = (loop, key)
+        while True:
+            future = self._calls.get(call_key)
+            if future is None:
+                break
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Retry when the leading call was cancelled, not this one
+                if not future.cancelled():
+                    raise
+
+        future = loop.create_future()
+        # Mark exceptions as retrieved, so one without waiting calls is not logged
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._calls[call_key] = future
+        try:
+            result = await fn(*args)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            # forget() may have dropped it already, from a request thread
+            if self._calls.get(call_key) is future:
+                self._calls.pop(call_key, None)
+
+    def forget(self):
+        """Lets later calls start afresh instead of joining the ones in flight."""
+        self._calls.clear()
+
+    def __len__(self):
+        return len(self._calls)
@@ -0,0 +1,48 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+from fastapi import HTTPException
+from utils.pagination import decode_cursor, encode_cursor
+
+# Rows changed within the last few seconds are held back from a changes page, so a
+# transaction that stamped its rows before a later one but commits after it is not
+# skipped by a client that has already moved its watermark past those stamps.
+# Long transactions, i.e. imports, restamp their rows right before committing
+CHANGES_SETTLE_SECONDS = float(os.getenv("CHANGES_SETTLE_SECONDS", "2"))
+
+# Default and largest number of changes returned per request
+CHANGES_PAGE_SIZE = 1000
+MAX_CHANGES_PAGE_SIZE = 5000
+
+# Key the watermark cursors are issued for (see utils/pagination.py)
+WATERMARK_KEY = "changes"
+
+
+def settled_before() -> datetime:
+    """Returns the change time up to which changes are considered committed."""
+    return datetime.now(timezone.utc) - timedelta(seconds=CHANGES_SETTLE_SECONDS)
+
+
+def encode_watermark(updated_at: datetime, row_id: int) -> str:
+    """Encodes the (updatedAt, id) position of the last change returned."""
+    return encode_cursor(WATERMARK_KEY, updated_at, row_id)
+
+
+def decode_watermark(watermark: str) -> Tuple[datetime, int]:
+    """
+    Decodes a watermark produced by encode_watermark.
+
+    :raises HTTPException: If the watermark is malformed.
+    """
+    value, row_id = decode_cursor(watermark, WATERMARK_KEY)
+    try:
+        return datetime.fromisoformat(value), row_id
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid watermark")
+
+
+def next_watermark(rows, since: Optional[str]) -> Optional[str]:
+    """Returns the watermark after the last of the given rows, or `since` if none."""
+    if not rows:
+        return since
+    return encode_watermark(rows[-1].updatedAt, rows[-1].id)
@@ -0,0 +1,153 @@
+from datetime import date
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+
+# Supported bucket sizes for emission time series
+BUCKET_SIZES = ("day", "week", "month")
+
+
+# Proleptic Gregorian ordinal of 1970-01-01, the datetime64 epoch
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def _to_days(values) -> np.ndarray:
+    """Convert a sequence of dates into a datetime64[D] array."""
+    if len(values) and isinstance(values[0], date):
+        # Going through ordinals is much faster than converting date objects
+        ordinals = np.fromiter(
+            (value.toordinal() for value in values), dtype=np.int64, count=len(values)
+        )
+        return (ordinals - EPOCH_ORDINAL).astype("datetime64[D]")
+    return np.asarray(values, dtype="datetime64[D]")
+
+
+def prorate_daily(
+    start_dates: Sequence[date],
+    end_dates: Sequence[date],
+    amounts: Sequence[float],
+    series_index: Sequence[int],
+    n_series: int,
+    first_day: date,
+    last_day: date,
+) -> np.ndarray:
+    """
+    Spread every entry's amount evenly over the days of its (inclusive) period.
+
+    Uses a difference array per series: +rate on the first day, -rate after the
+    last day, then a cumulative sum, so the cost is O(entries + days) instead of
+    O(entries * days).
+
+    :param start_dates: First day of each entry's period.
+    :param end_dates: Last day of each entry's period.
+    :param amounts: Amount of each entry.
+    :param series_index: Row of the output matrix each entry contributes to.
+    :param n_series: Number of rows in the output matrix.
+    :param first_day: First day of the output window.
+    :param last_day: Last day of the output window.
+    :return: A (n_series, days) matrix of prorated daily amounts within the window.
+    """
+    window_start = np.datetime64(first_day, "D")
+    n_days = int((np.datetime64(last_day, "D") - window_start).astype(int)) + 1
+    diff = np.zeros((n_series, n_days + 1))
+
+    starts = _to_days(start_dates)
+    ends = _to_days(end_dates)
+    if starts.size == 0 or n_days <= 0:
+        return diff[:, :max(n_days, 0)]
+
+    rates = np.asarray(amounts, dtype=float) / ((ends - starts).astype(int) + 1)
+    rows = np.asarray(series_index, dtype=int)
+
+    # Clip each period to the window and drop entries entirely outside of it
+    first = np.maximum((starts - window_start).astype(int), 0)
+    last = np.minimum((ends - window_start).astype(int), n_days - 1)
+    inside = first <= last
+
+    np.add.at(diff, (rows[inside], first[inside]), rates[inside])
+    np.add.at(diff, (rows[inside], last[inside] + 1), -rates[inside])
+    return np.cumsum(diff, axis=1)[:, :n_days]
+
+
+def bucket_starts(first_day: date, n_days: int, bucket: str) -> np.ndarray:
+    """
+    Map every day of the window to the first day of its bucket.
+
+    Weeks start on Monday, months on the 1st.
+    """
+    days = np.datetime64(first_day, "D") + np.arange(n_days)
+    if bucket == "day":
+        return days
+    if bucket == "week":
+        # 1970-01-01 was a Thursday, i.e. weekday 3 counting from Monday
+        weekday = (days.astype(int) + 3) % 7
+        return days - weekday
+    if bucket == "month":
+        return days.astype("datetime64[M]").astype("datetime64[D]")
+    raise ValueError(f"Unsupported bucket size: {bucket}")
+
+
+def cumulative_buckets(daily: np.ndarray, first_day: date, bucket: str):
+    """
+    Sum a (series, days) matrix per bucket and accumulate it over time.
+
+    :return: A (bucket labels, cumulative matrix) tuple.
+    """
+    n_days = daily.shape[1]
+    if n_days == 0:
+        return [], daily
+    keys = bucket_starts(first_day, n_days, bucket)
+    boundaries = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    totals = np.add.reduceat(daily, boundaries, axis=1)
+    labels = [str(label) for label in keys[boundaries]]
+    return labels, np.cumsum(totals, axis=1)
+
+
+def emission_series(
+    rows: List[tuple],
+    bucket: str,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+) -> Dict:
+    """
+    Build cumulative per-fuel-type and total CO2 series from daily rollup rows.
+
+    :param rows: (date, fuelTypeId, fuelType, amount, co2) tuples, at most one
+                 per date and fuel type after summing over projects.
+    :param bucket: One of BUCKET_SIZES.
+    :param date_from: First day of the series; defaults to the earliest date.
+    :param date_to: Last day of the series; defaults to the latest date.
+    :return: A dict with the bucket labels, one cumulative series per fuel type
+             and the cumulative total CO2 series.
+    """
+    if not rows:
+        return {"bucket": bucket, "dates": [], "fuelTypes": {}, "totalCO2": []}
+
+    days, fuel_ids, fuel_names, amounts, co2 = zip(*rows)
+    first_day = date_from or min(days)
+    last_day = date_to or max(days)
+    window_start = np.datetime64(first_day, "D")
+    n_days = int((np.datetime64(last_day, "D") - window_start).astype(int)) + 1
+
+    # One output row per fuel type, plus a final row for the CO2 total
+    fuel_order = list(dict.fromkeys(fuel_ids))
+    names = dict(zip(fuel_ids, fuel_names))
+    position = {fuel_id: i for i, fuel_id in enumerate(fuel_order)}
+    co2_row = len(fuel_order)
+
+    offsets = (_to_days(days) - window_start).astype(int)
+    rows_index = np.fromiter((position[fuel_id] for fuel_id in fuel_ids), dtype=int)
+    daily = np.zeros((co2_row + 1, n_days))
+    np.add.at(daily, (rows_index, offsets), np.asarray(amounts, dtype=float))
+    np.add.at(daily[co2_row], offsets, np.asarray(co2, dtype=float))
+
+    labels, cumulative = cumulative_buckets(daily, first_day, bucket)
+    cumulative = np.round(cumulative, 3)
+    return {
+        "bucket": bucket,
+        "dates": labels,
+        "fuelTypes": {
+            names[fuel_id]: cumulative[i].tolist()
+            for i, fuel_id in enumerate(fuel_order)
+        },
+        "totalCO2": cumulative[co2_row].tolist(),
+    }
@@ -0,0 +1,2 @@
+-- Scratch database for the backend test suite (TEST_DATABASE_URL)
+CREATE DATABASE carbon_data_test;